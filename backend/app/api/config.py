@@ -1,59 +1,186 @@
 # backend/app/api/config.py
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from typing import Dict, Any, List
-from app.models.config import ConfigBase, ConfigUpdate, ConfigVersion, ConfigVersionResponse
-from app.db.redis_client import RedisService
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+from app.models.config import (
+    ConfigBase,
+    ConfigUpdate,
+    ConfigPatch,
+    ConfigVersion,
+    ConfigVersionResponse,
+    ConfigDiff,
+    VersionHistoryPage,
+    ConfigBatchRequest,
+    ConfigBatchResponse,
+)
+import orjson
+from app.db.redis_client import RedisService, VersionConflict, content_hash
+from app.api.deps import (
+    get_redis_service,
+    expected_tags,
+    conflict,
+    make_etag,
+    etag_matches,
+    not_modified,
+    json_response,
+)
 
 router = APIRouter()
 
-# Dependency to get Redis service
-async def get_redis_service(request: Request):
-    return RedisService(request.app.state.redis)
+@router.post("/batch", response_model=ConfigBatchResponse)
+async def get_configs_batch(
+    selection: ConfigBatchRequest,
+    redis: RedisService = Depends(get_redis_service)
+):
+    """Get current configurations of many instruments at once"""
+    instrument_ids = selection.instrument_ids
+    existing = None
+    if selection.type is not None or selection.location is not None:
+        # Filter on metadata fetched in a single JSON.MGET
+        instruments = await redis.get_instruments(instrument_ids)
+        existing = instruments.keys()
+        matching = [
+            id for id, data in instruments.items()
+            if (selection.type is None or data.get("type") == selection.type)
+            and (selection.location is None or data.get("location") == selection.location)
+        ]
+    elif instrument_ids is None:
+        matching = await redis.get_instrument_ids()
+    else:
+        matching = instrument_ids
+    
+    if selection.at is not None:
+        # Instruments without a version by then had no config yet
+        versions = await redis.get_versions_at(matching, selection.at)
+        if existing is None and instrument_ids:
+            existing = await redis.get_instruments(instrument_ids)
+        missing = [id for id in instrument_ids or [] if id not in existing]
+        return json_response({
+            "configs": {id: version["data"] for id, version in versions.items()},
+            "missing": missing,
+            "version_ids": {id: version["version_id"] for id, version in versions.items()},
+        })
+    
+    configs = await redis.get_configs(matching)
+    if existing is None:
+        existing = configs.keys()
+    missing = [id for id in instrument_ids or [] if id not in existing]
+    return json_response({"configs": configs, "missing": missing})
 
 @router.get("/{instrument_id}", response_model=Dict[str, Any])
 async def get_config(
     instrument_id: str,
+    paths: Optional[List[str]] = Query(
+        None, alias="path", description="Definite JSONPaths to return, e.g. $.gain"
+    ),
+    if_none_match: Optional[str] = Header(None),
     redis: RedisService = Depends(get_redis_service)
 ):
     """Get current configuration for an instrument"""
     # Check if instrument exists
-    instrument = await redis.get_instrument(instrument_id)
-    if not instrument:
+    if not await redis.instrument_exists(instrument_id):
         raise HTTPException(status_code=404, detail="Instrument not found")
     
-    config = await redis.get_config(instrument_id)
-    return config
+    # Read the tag before the config, so a concurrent update can at worst
+    # pair new data with an old tag and never the other way round
+    digest = await redis.get_config_etag(instrument_id)
+    if digest and etag_matches(if_none_match, make_etag(digest, paths)):
+        return not_modified(make_etag(digest, paths))
+    
+    if paths:
+        try:
+            body = orjson.dumps(await redis.get_config(instrument_id, paths))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        # Send the stored JSON as is, without parsing it
+        body = await redis.get_config_json(instrument_id)
+    if not digest:
+        # Instruments that were never updated have no recorded hash
+        digest = content_hash(orjson.loads(body))
+        if etag_matches(if_none_match, make_etag(digest, paths)):
+            return not_modified(make_etag(digest, paths))
+    return Response(
+        body,
+        media_type="application/json",
+        headers={"ETag": make_etag(digest, paths)},
+    )
 
 @router.put("/{instrument_id}", response_model=Dict[str, Any])
 async def update_config(
     instrument_id: str,
     config: ConfigUpdate,
+    if_match: Optional[str] = Header(None),
     redis: RedisService = Depends(get_redis_service)
 ):
-    """Update configuration for an instrument"""
+    """Update configuration for an instrument
+
+    With an If-Match header or a base_version, the update only applies if
+    the configuration has not changed since; otherwise it fails with 412 or
+    409 and the current version.
+    """
     # Check if instrument exists
-    instrument = await redis.get_instrument(instrument_id)
-    if not instrument:
+    if not await redis.instrument_exists(instrument_id):
         raise HTTPException(status_code=404, detail="Instrument not found")
     
     # For now, we'll use a hardcoded user (in a real app, get from auth)
     user = "admin"
     
     # Update config and create version
-    version_id = await redis.update_config(
-        instrument_id, 
-        config.data, 
-        user, 
-        config.comment
-    )
+    expected, status_code = expected_tags(if_match, config.base_version)
+    try:
+        version_id, updated_config = await redis.update_config(
+            instrument_id, 
+            config.data, 
+            user, 
+            config.comment,
+            expected=expected
+        )
+    except VersionConflict as e:
+        raise conflict(e, status_code)
     
-    # Get updated config
-    updated_config = await redis.get_config(instrument_id)
+    return json_response({
+        "message": "Configuration updated",
+        "version_id": version_id,
+        "config": updated_config
+    })
+
+@router.patch("/{instrument_id}", response_model=Dict[str, Any])
+async def patch_config(
+    instrument_id: str,
+    patch: ConfigPatch,
+    if_match: Optional[str] = Header(None),
+    redis: RedisService = Depends(get_redis_service)
+):
+    """Apply JSON Patch or JSONPath operations to the configuration in place
+
+    Preconditions work as for PUT.
+    """
+    # Check if instrument exists
+    if not await redis.instrument_exists(instrument_id):
+        raise HTTPException(status_code=404, detail="Instrument not found")
+    
+    # For now, we'll use a hardcoded user (in a real app, get from auth)
+    user = "admin"
+    
+    expected, status_code = expected_tags(if_match, patch.base_version)
+    try:
+        version_id, changes = await redis.patch_config(
+            instrument_id,
+            [operation.dict() for operation in patch.operations],
+            user,
+            patch.comment,
+            expected=expected
+        )
+    except VersionConflict as e:
+        raise conflict(e, status_code)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     
     return {
         "message": "Configuration updated",
         "version_id": version_id,
-        "config": updated_config
+        "changes": changes
     }
 
 @router.get("/{instrument_id}/versions", response_model=List[str])
@@ -63,27 +190,125 @@ async def get_config_versions(
 ):
     """Get all version IDs for an instrument"""
     # Check if instrument exists
-    instrument = await redis.get_instrument(instrument_id)
-    if not instrument:
+    if not await redis.instrument_exists(instrument_id):
         raise HTTPException(status_code=404, detail="Instrument not found")
     
     versions = await redis.get_versions(instrument_id)
     return versions
 
+@router.get("/{instrument_id}/history", response_model=VersionHistoryPage)
+async def get_config_history(
+    instrument_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(
+        None, regex=r"^-?\d+(:.+)?$", description="next_cursor of the previous page"
+    ),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    redis: RedisService = Depends(get_redis_service)
+):
+    """Get a page of version summaries, newest first"""
+    # Check if instrument exists
+    if not await redis.instrument_exists(instrument_id):
+        raise HTTPException(status_code=404, detail="Instrument not found")
+    
+    versions, next_cursor = await redis.get_version_history(
+        instrument_id, limit=limit, cursor=cursor, start=start, end=end
+    )
+    return {"versions": versions, "next_cursor": next_cursor}
+
+@router.get("/{instrument_id}/as-of", response_model=ConfigVersion)
+async def get_config_as_of(
+    instrument_id: str,
+    at: datetime = Query(..., description="Time at which the config was in effect"),
+    paths: Optional[List[str]] = Query(
+        None, alias="path", description="Definite JSONPaths to return, e.g. $.gain"
+    ),
+    if_none_match: Optional[str] = Header(None),
+    redis: RedisService = Depends(get_redis_service)
+):
+    """Get the version that was in effect at a given time"""
+    # Check if instrument exists
+    if not await redis.instrument_exists(instrument_id):
+        raise HTTPException(status_code=404, detail="Instrument not found")
+    
+    version_ids = await redis.get_version_ids_at([instrument_id], at)
+    if instrument_id not in version_ids:
+        raise HTTPException(status_code=404, detail="No version at that time")
+    version_id = version_ids[instrument_id]
+    
+    # The same version tag as get_config_version, so caches can share it
+    etag = make_etag(version_id, paths)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    
+    try:
+        version = await redis.get_version(instrument_id, version_id, paths, raw=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not version:
+        raise HTTPException(status_code=404, detail="Version not found")
+    
+    return json_response(version, headers={"ETag": etag}, model=ConfigVersion)
+
+@router.get("/{instrument_id}/diff", response_model=ConfigDiff)
+async def get_config_diff(
+    instrument_id: str,
+    from_ref: str = Query(..., alias="from", description="current, version:{id}, snapshot:{name}, or a bare version ID or snapshot name"),
+    to_ref: str = Query("current", alias="to", description="Same forms as from"),
+    redis: RedisService = Depends(get_redis_service)
+):
+    """Get the changes between two versions, snapshots or the current config"""
+    # Check if instrument exists
+    if not await redis.instrument_exists(instrument_id):
+        raise HTTPException(status_code=404, detail="Instrument not found")
+    
+    refs = []
+    for ref in (from_ref, to_ref):
+        resolved = await redis.resolve_ref(instrument_id, ref)
+        if resolved is None:
+            raise HTTPException(status_code=404, detail=f"No version or snapshot {ref!r}")
+        refs.append(resolved)
+    
+    changes = await redis.diff_refs(instrument_id, *refs)
+    if changes is None:
+        raise HTTPException(status_code=404, detail="Version or snapshot not found")
+    
+    from_ref, to_ref = [kind if name is None else f"{kind}:{name}" for kind, name in refs]
+    return json_response({
+        "from_ref": from_ref,
+        "to_ref": to_ref,
+        "changes": changes,
+        "change_count": len(changes),
+    })
+
 @router.get("/{instrument_id}/versions/{version_id}", response_model=ConfigVersion)
 async def get_config_version(
     instrument_id: str,
     version_id: str,
+    paths: Optional[List[str]] = Query(
+        None, alias="path", description="Definite JSONPaths to return, e.g. $.gain"
+    ),
+    if_none_match: Optional[str] = Header(None),
     redis: RedisService = Depends(get_redis_service)
 ):
     """Get specific version data"""
     # Check if instrument exists
-    instrument = await redis.get_instrument(instrument_id)
-    if not instrument:
+    if not await redis.instrument_exists(instrument_id):
         raise HTTPException(status_code=404, detail="Instrument not found")
     
-    version = await redis.get_version(instrument_id, version_id)
+    # Versions never change, so their ID is a strong entity tag
+    etag = make_etag(version_id, paths)
+    if etag_matches(if_none_match, etag):
+        if not await redis.version_exists(instrument_id, version_id):
+            raise HTTPException(status_code=404, detail="Version not found")
+        return not_modified(etag)
+    
+    try:
+        version = await redis.get_version(instrument_id, version_id, paths, raw=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not version:
         raise HTTPException(status_code=404, detail="Version not found")
     
-    return version
+    return json_response(version, headers={"ETag": etag}, model=ConfigVersion)
@@ -0,0 +1,96 @@
+# backend/app/api/deps.py
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple, Type
+import orjson
+from fastapi import HTTPException, Request, Response
+from pydantic import BaseModel
+from app.db.redis_client import RedisService, VersionConflict
+
+
+# Dependency to get Redis service
+async def get_redis_service(request: Request):
+    # Clients that wrote recently read from the primary, see ReadYourWritesMiddleware
+    read_primary = getattr(request.state, "read_primary", False)
+    service = RedisService(
+        request.app.state.redis,
+        cache=request.app.state.cache,
+        archive=request.app.state.archive,
+        diff_cache=request.app.state.diff_cache,
+        replicas=None if read_primary else request.app.state.replicas,
+        search=request.app.state.search,
+    )
+    request.state.redis_service = service
+    return service
+
+
+def make_etag(value: str, paths: Optional[List[str]] = None) -> str:
+    """Quote a value as a strong entity tag, distinct per projection"""
+    if paths:
+        digest = hashlib.sha256("\n".join(paths).encode()).hexdigest()[:16]
+        value = f"{value}-{digest}"
+    return f'"{value}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an entity tag"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def expected_tags(
+    if_match: Optional[str], base_version: Optional[str]
+) -> Tuple[Optional[List[str]], int]:
+    """Tags a write must find current, and the status reporting a mismatch
+
+    An If-Match header fails with 412 and is compared strongly, so weak tags
+    never match; a base version in the body fails with 409.
+    """
+    if if_match:
+        tags = [tag.strip() for tag in if_match.split(",")]
+        return [tag.strip('"') for tag in tags if not tag.startswith("W/")], 412
+    if base_version:
+        return [base_version.strip('"')], 409
+    return None, 409
+
+
+def conflict(error: VersionConflict, status_code: int) -> HTTPException:
+    """Error telling a client whose base version is stale what is current"""
+    return HTTPException(
+        status_code=status_code,
+        detail={"message": str(error), "version_id": error.version_id},
+        headers={"ETag": make_etag(error.etag)} if error.etag else None,
+    )
+
+
+def not_modified(etag: str) -> Response:
+    """Empty 304 response for a client that already holds the current entity"""
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def json_response(
+    content: Any,
+    headers: Optional[Dict[str, str]] = None,
+    model: Optional[Type[BaseModel]] = None,
+) -> Response:
+    """Encode a response with orjson, bypassing response model validation
+
+    Data read from Redis is valid JSON already, so walking and re-validating
+    it only costs time; the route's response_model still documents the
+    schema. With ``model``, top-level fields it does not declare are dropped
+    as the response model would. Stored JSON embedded as ``orjson.Fragment``
+    is copied into the body verbatim.
+    """
+    if model is not None:
+        content = {name: content[name] for name in model.__fields__ if name in content}
+    try:
+        body = orjson.dumps(content)
+    except TypeError:
+        # orjson rejects integers wider than 64 bits
+        body = json.dumps(content, separators=(",", ":")).encode()
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,56 @@
+# backend/app/api/events.py
+import json
+import re
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.db.redis_client import RedisService
+from app.api.deps import get_redis_service
+
+router = APIRouter()
+
+STREAM_ID = re.compile(r"\d+(-\d+)?")
+
+
+async def server_sent_events(feed, instrument_id, last_id):
+    """Encode change events as server-sent events"""
+    async for event in feed.events(
+        instrument_id, last_id, keepalive=settings.EVENTS_KEEPALIVE_SECONDS
+    ):
+        if event is None:
+            yield b": keepalive\n\n"
+            continue
+        data = json.dumps(event, separators=(",", ":"))
+        yield f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n".encode()
+
+
+@router.get("/")
+async def stream_events(
+    request: Request,
+    instrument_id: Optional[str] = Query(None, description="Only events of this instrument"),
+    since: Optional[str] = Query(None, description="Resume after this event ID"),
+    last_event_id: Optional[str] = Header(None),
+    redis: RedisService = Depends(get_redis_service)
+):
+    """Stream config updates and snapshots as server-sent events"""
+    # Check if instrument exists
+    if instrument_id is not None and not await redis.instrument_exists(instrument_id):
+        raise HTTPException(status_code=404, detail="Instrument not found")
+    
+    # Reconnecting EventSource clients send the ID of the last event they saw
+    last_id = last_event_id or since
+    if last_id is not None and not STREAM_ID.fullmatch(last_id):
+        raise HTTPException(status_code=400, detail="Invalid event ID")
+    
+    return StreamingResponse(
+        server_sent_events(request.app.state.feed, instrument_id, last_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stats")
+async def events_stats(request: Request):
+    """Subscribers and queued events of this worker's change feed"""
+    return request.app.state.feed.stats()
@@ -1,17 +1,20 @@
 # backend/app/api/instruments.py
-from fastapi import APIRouter, Depends, HTTPException, Request
-from typing import List
-from app.models.instrument import InstrumentCreate, Instrument, InstrumentList
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import List, Literal, Optional
+from app.models.instrument import (
+    InstrumentCreate,
+    Instrument,
+    InstrumentList,
+    InstrumentSearchPage,
+    RetentionPolicy,
+    RetentionSettings,
+)
 from app.db.redis_client import RedisService
+from app.api.deps import get_redis_service
 
 router = APIRouter()
 
 
-# Dependency to get Redis service
-async def get_redis_service(request: Request):
-    return RedisService(request.app.state.redis)
-
-
 @router.get("/", response_model=InstrumentList)
 async def get_instruments(redis: RedisService = Depends(get_redis_service)):
     """Get all instruments"""
@@ -25,6 +28,49 @@ async def get_instruments(redis: RedisService = Depends(get_redis_service)):
     return {"instruments": instruments}
 
 
+@router.get("/search", response_model=InstrumentSearchPage)
+async def search_instruments(
+    request: Request,
+    types: Optional[List[str]] = Query(None, alias="type"),
+    locations: Optional[List[str]] = Query(None, alias="location"),
+    name: Optional[str] = Query(None, description="Words the name contains"),
+    where: Optional[List[str]] = Query(
+        None, description="Conditions on indexed config paths, e.g. $.detector.gain>5"
+    ),
+    sort: Optional[str] = Query(
+        None, description="id, name, type, location, last_updated or an indexed path"
+    ),
+    order: Literal["asc", "desc"] = "asc",
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    redis: RedisService = Depends(get_redis_service),
+):
+    """Find instruments by metadata and indexed config values"""
+    if request.app.state.search is None:
+        raise HTTPException(status_code=503, detail="Instrument search is unavailable")
+
+    try:
+        total, instruments = await redis.search_instruments(
+            types=types,
+            locations=locations,
+            name=name,
+            conditions=where or (),
+            sort_by=sort,
+            descending=order == "desc",
+            offset=offset,
+            limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "instruments": [Instrument(**instrument) for instrument in instruments],
+    }
+
+
 @router.get("/{instrument_id}", response_model=Instrument)
 async def get_instrument(
     instrument_id: str, redis: RedisService = Depends(get_redis_service)
@@ -43,8 +89,7 @@ async def create_instrument(
 ):
     """Create a new instrument"""
     # Check if instrument already exists
-    existing = await redis.get_instrument(instrument.id)
-    if existing:
+    if await redis.instrument_exists(instrument.id):
         raise HTTPException(status_code=400, detail="Instrument ID already exists")
 
     # Create metadata object
@@ -59,3 +104,36 @@ async def create_instrument(
     await redis.add_instrument(instrument.id, metadata)
 
     return Instrument(id=instrument.id, **metadata)
+
+
+@router.get("/{instrument_id}/retention", response_model=RetentionSettings)
+async def get_retention(
+    instrument_id: str, redis: RedisService = Depends(get_redis_service)
+):
+    """Get the version retention policy of an instrument"""
+    # Check if instrument exists
+    if not await redis.instrument_exists(instrument_id):
+        raise HTTPException(status_code=404, detail="Instrument not found")
+
+    return {
+        "overrides": await redis.get_retention_overrides(instrument_id),
+        "effective": await redis.get_retention(instrument_id),
+    }
+
+
+@router.put("/{instrument_id}/retention", response_model=RetentionSettings)
+async def set_retention(
+    instrument_id: str,
+    policy: RetentionPolicy,
+    redis: RedisService = Depends(get_redis_service),
+):
+    """Override the global version retention rules for an instrument"""
+    # Check if instrument exists
+    if not await redis.instrument_exists(instrument_id):
+        raise HTTPException(status_code=404, detail="Instrument not found")
+
+    await redis.set_retention(instrument_id, policy.keep_last, policy.max_age_days)
+    return {
+        "overrides": await redis.get_retention_overrides(instrument_id),
+        "effective": await redis.get_retention(instrument_id),
+    }
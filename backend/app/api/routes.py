@@ -101,16 +101,13 @@ async def update_config(
     user = "admin"
     
     # Update config and create version
-    version_id = await redis.update_config(
+    version_id, updated_config = await redis.update_config(
         instrument_id, 
         config.data, 
         user, 
         config.comment
     )
     
-    # Get updated config
-    updated_config = await redis.get_config(instrument_id)
-    
     return {
         "message": "Configuration updated",
         "version_id": version_id,
@@ -1,15 +1,18 @@
 # backend/app/api/snapshots.py
-from fastapi import APIRouter, Depends, HTTPException, Request
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from typing import List, Optional
 from app.models.snapshot import SnapshotCreate, Snapshot
 from app.db.redis_client import RedisService
+from app.api.deps import (
+    get_redis_service,
+    make_etag,
+    etag_matches,
+    not_modified,
+    json_response,
+)
 
 router = APIRouter()
 
-# Dependency to get Redis service
-async def get_redis_service(request: Request):
-    return RedisService(request.app.state.redis)
-
 @router.post("/{instrument_id}", response_model=Snapshot)
 async def create_snapshot(
     instrument_id: str,
@@ -18,8 +21,7 @@ async def create_snapshot(
 ):
     """Create a named snapshot of current configuration"""
     # Check if instrument exists
-    instrument = await redis.get_instrument(instrument_id)
-    if not instrument:
+    if not await redis.instrument_exists(instrument_id):
         raise HTTPException(status_code=404, detail="Instrument not found")
     
     # Check if snapshot name already exists
@@ -50,8 +52,7 @@ async def get_snapshots(
 ):
     """Get all snapshot names for an instrument"""
     # Check if instrument exists
-    instrument = await redis.get_instrument(instrument_id)
-    if not instrument:
+    if not await redis.instrument_exists(instrument_id):
         raise HTTPException(status_code=404, detail="Instrument not found")
     
     snapshots = await redis.get_snapshots(instrument_id)
@@ -61,16 +62,31 @@ async def get_snapshots(
 async def get_snapshot(
     instrument_id: str,
     snapshot_name: str,
+    paths: Optional[List[str]] = Query(
+        None, alias="path", description="Definite JSONPaths to return, e.g. $.gain"
+    ),
+    if_none_match: Optional[str] = Header(None),
     redis: RedisService = Depends(get_redis_service)
 ):
     """Get specific snapshot data"""
     # Check if instrument exists
-    instrument = await redis.get_instrument(instrument_id)
-    if not instrument:
+    if not await redis.instrument_exists(instrument_id):
         raise HTTPException(status_code=404, detail="Instrument not found")
     
-    snapshot = await redis.get_snapshot(instrument_id, snapshot_name)
+    tag = await redis.get_snapshot_etag(instrument_id, snapshot_name)
+    if tag is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    etag = make_etag(tag, paths)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    
+    try:
+        snapshot = await redis.get_snapshot(
+            instrument_id, snapshot_name, paths, raw=True
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not snapshot:
         raise HTTPException(status_code=404, detail="Snapshot not found")
     
-    return snapshot
+    return json_response(snapshot, headers={"ETag": etag}, model=Snapshot)
@@ -0,0 +1,35 @@
+# backend/app/api/transfer.py
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from app.services.transfer import export_ndjson, import_ndjson, iter_lines
+
+router = APIRouter()
+
+
+@router.get("/export")
+async def export_data(request: Request):
+    """Stream all instruments, configs, versions and snapshots as NDJSON"""
+    return StreamingResponse(
+        export_ndjson(request.app.state.redis, archive=request.app.state.archive),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition": 'attachment; filename="configer-export.ndjson"'
+        },
+    )
+
+
+@router.post("/import")
+async def import_data(request: Request):
+    """Import an NDJSON export streamed in the request body"""
+    try:
+        counts = await import_ndjson(
+            request.app.state.redis,
+            iter_lines(request.stream()),
+            archive=request.app.state.archive,
+            search=request.app.state.search,
+        )
+    except (ValueError, KeyError) as e:
+        # json.JSONDecodeError is a ValueError
+        raise HTTPException(status_code=400, detail=f"Invalid import record: {e}")
+
+    return {"message": "Import completed", "imported": counts}
@@ -0,0 +1,186 @@
+# backend/app/cli.py
+"""Command line entry point for maintenance tasks
+
+Usage (from the backend directory):
+
+    python -m app.cli export [-o FILE]
+    python -m app.cli import [-i FILE]
+    python -m app.cli migrate
+    python -m app.cli migrate-keys
+    python -m app.cli gc
+    python -m app.cli compact
+    python -m app.cli train-dictionary [--codec zlib|zstd]
+"""
+
+import argparse
+import asyncio
+import sys
+import orjson
+from app.core.config import settings
+from app.db.keys import hash_tagged, instrument_key, scan_instrument_ids
+from app.db.migrations import (
+    MIGRATIONS,
+    MIGRATIONS_KEY,
+    migrate_key_layout,
+    run_migrations,
+)
+from app.db.redis_client import RedisService, init_redis_pool
+from app.services.archive import VersionArchive
+from app.services.compression import load_payloads, store_dictionary, train_dictionary
+from app.services.retention import compact_all
+from app.services.search import open_index
+from app.services.transfer import export_ndjson, import_ndjson
+
+
+def _archive():
+    return VersionArchive(settings.ARCHIVE_PATH) if settings.ARCHIVE_PATH else None
+
+
+async def _file_lines(f):
+    for line in f:
+        yield line
+
+
+async def export_command(client, args):
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async for line in export_ndjson(
+            client, batch_size=args.batch_size, archive=_archive()
+        ):
+            out.write(line)
+    finally:
+        if args.output:
+            out.close()
+
+
+async def import_command(client, args):
+    f = open(args.input, "rb") if args.input else sys.stdin.buffer
+    try:
+        counts = await import_ndjson(
+            client,
+            _file_lines(f),
+            batch_size=args.batch_size,
+            archive=_archive(),
+            search=await open_index(client),
+        )
+    finally:
+        if args.input:
+            f.close()
+    print(f"Imported {counts}", file=sys.stderr)
+
+
+async def migrate_command(client, args):
+    await run_migrations(client)
+
+
+async def migrate_keys_command(client, args):
+    if settings.REDIS_CLUSTER:
+        # Keys of one instrument in the plain layout span slots, so RENAME fails
+        sys.exit("Migrate the key layout on a single node, with REDIS_HASH_TAGS")
+    applied = await client.smembers(MIGRATIONS_KEY)
+    if any(name not in applied for name, _ in MIGRATIONS):
+        sys.exit("Apply pending migrations in the current layout first")
+    renamed = await migrate_key_layout(client, hash_tagged(), args.batch_size)
+    layout = "hash-tagged" if hash_tagged() else "plain"
+    print(f"Renamed {renamed} keys to the {layout} layout", file=sys.stderr)
+
+
+async def gc_command(client, args):
+    service = RedisService(client)
+    removed = 0
+    async for instrument_id in scan_instrument_ids(client):
+        removed += await service.gc_blobs(instrument_id)
+    print(f"Removed {removed} unreferenced payloads", file=sys.stderr)
+
+
+async def compact_command(client, args):
+    archive = _archive()
+    if archive is None:
+        sys.exit("ARCHIVE_PATH is not set")
+    archived = await compact_all(RedisService(client, archive=archive), args.batch_size)
+    print(f"Archived {archived} expired versions", file=sys.stderr)
+
+
+async def train_dictionary_command(client, args):
+    samples = []
+    async for instrument_id in scan_instrument_ids(client):
+        refs = await client.hkeys(instrument_key(instrument_id, "blobrefs"))
+        refs = refs[: args.samples - len(samples)]
+        for payload in await load_payloads(client, instrument_id, refs):
+            if payload is not None:
+                samples.append(orjson.dumps(payload))
+        if len(samples) >= args.samples:
+            break
+    if not samples:
+        sys.exit("No stored payloads to train on")
+
+    dictionary = train_dictionary(samples, args.codec, args.size)
+    dictionary_id = await store_dictionary(client, dictionary)
+    print(
+        f"Trained a {len(dictionary)} byte {args.codec} dictionary on"
+        f" {len(samples)} payloads; set COMPRESSION_DICTIONARY={dictionary_id}",
+        file=sys.stderr,
+    )
+
+
+async def run(args):
+    client = await init_redis_pool()
+    try:
+        await args.command(client, args)
+    finally:
+        await client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    subparsers = parser.add_subparsers(required=True)
+
+    export_parser = subparsers.add_parser("export", help="export all data as NDJSON")
+    export_parser.add_argument("-o", "--output", help="file to write (default stdout)")
+    export_parser.add_argument("--batch-size", type=int, default=100)
+    export_parser.set_defaults(command=export_command)
+
+    import_parser = subparsers.add_parser("import", help="import an NDJSON export")
+    import_parser.add_argument("-i", "--input", help="file to read (default stdin)")
+    import_parser.add_argument("--batch-size", type=int, default=500)
+    import_parser.set_defaults(command=import_command)
+
+    migrate_parser = subparsers.add_parser("migrate", help="apply pending migrations")
+    migrate_parser.set_defaults(command=migrate_command)
+
+    migrate_keys_parser = subparsers.add_parser(
+        "migrate-keys", help="move keys to the key layout of the settings"
+    )
+    migrate_keys_parser.add_argument("--batch-size", type=int, default=500)
+    migrate_keys_parser.set_defaults(command=migrate_keys_command)
+
+    gc_parser = subparsers.add_parser("gc", help="delete unreferenced payloads")
+    gc_parser.set_defaults(command=gc_command)
+
+    compact_parser = subparsers.add_parser(
+        "compact", help="archive versions expired by the retention policies"
+    )
+    compact_parser.add_argument("--batch-size", type=int, default=200)
+    compact_parser.set_defaults(command=compact_command)
+
+    train_parser = subparsers.add_parser(
+        "train-dictionary", help="train a compression dictionary on stored payloads"
+    )
+    train_parser.add_argument(
+        "--codec",
+        choices=["zlib", "zstd"],
+        default=(
+            settings.STORAGE_COMPRESSION
+            if settings.STORAGE_COMPRESSION != "none"
+            else "zlib"
+        ),
+    )
+    train_parser.add_argument("--samples", type=int, default=1000)
+    train_parser.add_argument("--size", type=int, default=32768, help="bytes")
+    train_parser.set_defaults(command=train_dictionary_command)
+
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 # backend/app/core/config.py
 from pydantic import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -14,6 +14,94 @@ class Settings(BaseSettings):
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
     REDIS_PASSWORD: str = ""
+    # Overrides host, port and db; rediss:// connects with TLS using the
+    # REDIS_SSL_* files and unix:///path/to/redis.sock?db=0 through a socket
+    REDIS_URL: str = ""
+    REDIS_SSL_CA_CERTS: str = ""
+    REDIS_SSL_CERTFILE: str = ""
+    REDIS_SSL_KEYFILE: str = ""
+    REDIS_SSL_CERT_REQS: str = "required"
+
+    # Connection pool per worker; requests wait up to REDIS_POOL_TIMEOUT
+    # seconds for a free connection. Timeouts are in seconds (0 disables);
+    # commands failing with connection errors or timeouts are retried with
+    # jittered exponential backoff
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 5.0
+    REDIS_SOCKET_TIMEOUT: float = 10.0
+    REDIS_CONNECT_TIMEOUT: float = 5.0
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
+    REDIS_RETRIES: int = 3
+    REDIS_RETRY_BACKOFF_BASE: float = 0.05
+    REDIS_RETRY_BACKOFF_CAP: float = 1.0
+
+    # Redis Cluster: the URL names any node, and keys are hash-tagged by
+    # instrument ID. REDIS_HASH_TAGS uses the same key layout on a single
+    # node, ahead of moving to a cluster. The instrument ID set is split
+    # into INSTRUMENT_ID_SHARDS sets in that layout
+    REDIS_CLUSTER: bool = False
+    REDIS_HASH_TAGS: bool = False
+    INSTRUMENT_ID_SHARDS: int = 16
+
+    # Read replicas, as comma-separated URLs with the same options as the
+    # primary. Reads go to them in turn; a replica that fails is skipped for
+    # REDIS_REPLICA_RETRY_SECONDS while its reads go to the primary. With
+    # READ_YOUR_WRITES_SECONDS set, a client's reads go to the primary for
+    # that long after it wrote
+    REDIS_REPLICA_URLS: str = ""
+    REDIS_REPLICA_RETRY_SECONDS: float = 5.0
+    READ_YOUR_WRITES_SECONDS: float = 0.0
+
+    # In-process cache for instrument metadata and current configs
+    CACHE_ENABLED: bool = True
+    CACHE_MAX_ENTRIES: int = 10000
+    CACHE_TTL_SECONDS: float = 30.0
+    # Diffs between versions, snapshots and the current config, kept per
+    # worker by the content they compare (0 disables the cache)
+    DIFF_CACHE_MAX_ENTRIES: int = 1000
+
+    # Versions are stored as JSON patches with a full keyframe every N versions
+    VERSION_KEYFRAME_INTERVAL: int = 20
+
+    # Payloads (keyframes and snapshots) whose JSON encoding reaches
+    # COMPRESSION_MIN_BYTES are stored compressed with "zlib" or "zstd" (needs
+    # the zstandard package), or always as RedisJSON with "none". The level
+    # defaults to the codec's own, and COMPRESSION_DICTIONARY is an ID printed
+    # by `python -m app.cli train-dictionary`
+    STORAGE_COMPRESSION: str = "none"
+    COMPRESSION_MIN_BYTES: int = 4096
+    COMPRESSION_LEVEL: Optional[int] = None
+    COMPRESSION_DICTIONARY: str = ""
+
+    # Version retention: keep the newest N versions and/or versions younger
+    # than the given age (0 disables a rule; instruments may override both).
+    # Expired versions move to the archive at ARCHIVE_PATH, which is disabled
+    # while empty; every worker and the CLI must use the same file, so give
+    # an absolute path
+    RETENTION_KEEP_LAST: int = 0
+    RETENTION_MAX_AGE_DAYS: float = 0.0
+    RETENTION_INTERVAL_SECONDS: float = 3600.0
+    ARCHIVE_PATH: str = ""
+
+    # Change feed: approximate number of events retained for resuming clients,
+    # per-client buffer and idle keepalive interval of streaming connections
+    EVENTS_STREAM_MAXLEN: int = 100000
+    EVENTS_QUEUE_SIZE: int = 1000
+    EVENTS_KEEPALIVE_SECONDS: float = 15.0
+
+    # Prometheus metrics are served on /metrics when enabled. Tracing creates
+    # OpenTelemetry spans for requests, service calls and Redis commands; it
+    # needs the opentelemetry-api package and an SDK configured by the
+    # deployment, for example with opentelemetry-instrument
+    METRICS_ENABLED: bool = True
+    TRACING_ENABLED: bool = False
+
+    # RediSearch index over instrument metadata and config values, searched
+    # by /api/instruments/search. Config values are indexed for the
+    # comma-separated "JSONPath:numeric" or "JSONPath:tag" entries, such as
+    # "$.detector.gain:numeric,$.mode:tag"
+    SEARCH_ENABLED: bool = True
+    SEARCH_CONFIG_FIELDS: str = ""
 
     # CORS settings
     # Change this from List[str] to str and parse it manually
@@ -22,6 +110,11 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
 
+    @property
+    def redis_replica_urls_list(self) -> List[str]:
+        """Parse REDIS_REPLICA_URLS as a list of URLs"""
+        return [url.strip() for url in self.REDIS_REPLICA_URLS.split(",") if url.strip()]
+
     @property
     def cors_origins_list(self) -> List[str]:
         """Parse CORS_ORIGINS as a list of strings"""
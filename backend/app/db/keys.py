@@ -0,0 +1,103 @@
+# backend/app/db/keys.py
+"""Names of the Redis keys of instruments
+
+Every key of an instrument starts with ``instrument:{instrument_id}:``. In
+the hash-tagged layout, used with REDIS_CLUSTER or REDIS_HASH_TAGS, the ID
+is wrapped in braces, as in ``instrument:{abc}:config``, so Redis Cluster
+stores all keys of an instrument in one slot and transactions over them
+stay possible. The set of instrument IDs is then split into shards, so it
+does not load one node with every lookup.
+"""
+
+import asyncio
+import zlib
+import redis.asyncio as redis
+from app.core.config import settings
+
+# Set of instrument IDs in the plain layout
+LEGACY_IDS_KEY = "instruments:ids"
+
+
+def hash_tagged():
+    return settings.REDIS_CLUSTER or settings.REDIS_HASH_TAGS
+
+
+def _tagged(tagged):
+    # Layout of the settings, unless the caller picks one
+    return hash_tagged() if tagged is None else tagged
+
+
+def hash_tag(instrument_id, tagged=None):
+    """The part of a key naming an instrument, braced in the tagged layout"""
+    if _tagged(tagged):
+        return f"{{{instrument_id}}}"
+    return instrument_id
+
+
+def instrument_key(instrument_id, *parts, tagged=None):
+    """Key of an instrument, such as ``instrument_key(id, "version", version_id)``
+
+    Without parts this is the prefix of all of the instrument's keys.
+    """
+    return ":".join([f"instrument:{hash_tag(instrument_id, tagged)}", *map(str, parts)])
+
+
+def instrument_ids_keys(tagged=None, shards=None):
+    """Keys of the sets that together hold every instrument ID
+
+    ``shards`` overrides INSTRUMENT_ID_SHARDS of the hash-tagged layout.
+    """
+    if not _tagged(tagged):
+        return [LEGACY_IDS_KEY]
+    return [
+        f"instruments:ids:{{{shard}}}"
+        for shard in range(shards or settings.INSTRUMENT_ID_SHARDS)
+    ]
+
+
+def instrument_ids_key(instrument_id, tagged=None):
+    """Key of the set holding an instrument's ID"""
+    keys = instrument_ids_keys(tagged)
+    return keys[zlib.crc32(instrument_id.encode()) % len(keys)]
+
+
+async def scan_instrument_ids(client, count=None):
+    """Iterate over every instrument ID, shard by shard"""
+    for key in instrument_ids_keys():
+        async for instrument_id in client.sscan_iter(key, count=count):
+            yield instrument_id
+
+
+async def get_instrument_ids(client):
+    """Set of every instrument ID"""
+    instrument_ids = set()
+    for key in instrument_ids_keys():
+        instrument_ids.update(await client.smembers(key))
+    return instrument_ids
+
+
+async def read_by_slot(client, keys, read):
+    """Replies of a multi-key read, in the order of keys
+
+    ``read`` is called with a list of keys. A cluster rejects commands whose
+    keys lie in several slots, so on one it is called once per slot, all
+    concurrently.
+    """
+    if not isinstance(client, redis.RedisCluster):
+        return await read(keys)
+    slots = {}
+    for index, key in enumerate(keys):
+        slots.setdefault(client.keyslot(key), []).append(index)
+    replies = await asyncio.gather(
+        *[read([keys[index] for index in indexes]) for indexes in slots.values()]
+    )
+    results = [None] * len(keys)
+    for indexes, reply in zip(slots.values(), replies):
+        for index, value in zip(indexes, reply):
+            results[index] = value
+    return results
+
+
+async def json_mget(client, keys, path):
+    """JSON.MGET of keys of any instruments"""
+    return await read_by_slot(client, keys, lambda keys: client.json().mget(keys, path))
@@ -0,0 +1,320 @@
+# backend/app/db/migrations.py
+import asyncio
+import json
+import redis.asyncio as redis
+from app.db.keys import (
+    LEGACY_IDS_KEY,
+    get_instrument_ids,
+    hash_tag,
+    instrument_ids_key,
+    instrument_ids_keys,
+    instrument_key,
+    scan_instrument_ids,
+)
+from app.db.redis_client import content_hash, init_redis_pool, timestamp_score
+from app.services.search import DOCUMENT_PREFIX
+
+# Set of migration names that have already been applied
+MIGRATIONS_KEY = "schema:migrations"
+# Key layout the instruments are stored in, as named by key_layout
+KEY_LAYOUT_KEY = "schema:key_layout"
+
+
+async def split_instruments_list(client):
+    """Move instruments:list entries to per-instrument metadata keys"""
+    if not await client.exists("instruments:list"):
+        return
+
+    if isinstance(client, redis.RedisCluster):
+        # The keys span slots, so no transaction covers them; the migration
+        # lock keeps other workers out, and the list goes only once copied
+        instruments = await client.json().get("instruments:list")
+        async with client.pipeline(transaction=False) as pipe:
+            _queue_metadata(pipe, instruments or {})
+            await pipe.execute()
+        await client.delete("instruments:list")
+        return
+
+    async with client.pipeline(transaction=True) as pipe:
+        try:
+            # Abort if another worker migrates the list concurrently
+            await pipe.watch("instruments:list")
+            instruments = await pipe.json().get("instruments:list")
+            if not instruments:
+                return
+
+            pipe.multi()
+            _queue_metadata(pipe, instruments)
+            pipe.delete("instruments:list")
+            await pipe.execute()
+        except redis.WatchError:
+            pass
+
+
+def _queue_metadata(pipe, instruments):
+    for instrument_id, metadata in instruments.items():
+        pipe.json().set(instrument_key(instrument_id, "meta"), "$", metadata)
+        pipe.sadd(instrument_ids_key(instrument_id), instrument_id)
+
+
+async def create_version_heads(client):
+    """Record the latest version of pre-existing instruments as a keyframe head"""
+    instrument_ids = list(await get_instrument_ids(client))
+    for start in range(0, len(instrument_ids), 500):
+        batch = instrument_ids[start : start + 500]
+        async with client.pipeline(transaction=False) as pipe:
+            for instrument_id in batch:
+                pipe.exists(instrument_key(instrument_id, "head"))
+                pipe.json().get(instrument_key(instrument_id, "versions"), "$[-1]")
+                pipe.json().arrlen(instrument_key(instrument_id, "versions"))
+            results = await pipe.execute()
+
+        async with client.pipeline(transaction=False) as pipe:
+            for index, instrument_id in enumerate(batch):
+                has_head, last, length = results[index * 3 : index * 3 + 3]
+                if has_head or not length:
+                    continue
+                # Legacy versions all store full data, so the latest is a keyframe
+                pipe.hset(
+                    instrument_key(instrument_id, "head"),
+                    mapping={
+                        "version_id": last[0],
+                        "seq": length - 1,
+                        "keyframe_seq": length - 1,
+                    },
+                )
+            await pipe.execute()
+
+
+async def index_version_history(client):
+    """Build the time-ordered history index for pre-existing versions"""
+    async for instrument_id in scan_instrument_ids(client):
+        version_ids = await client.json().get(instrument_key(instrument_id, "versions"))
+        for start in range(0, len(version_ids or []), 500):
+            batch = version_ids[start : start + 500]
+
+            # Read only the summary fields, never the configuration data
+            async with client.pipeline(transaction=False) as pipe:
+                for version_id in batch:
+                    key = instrument_key(instrument_id, "version", version_id)
+                    pipe.json().get(key, "$.timestamp", "$.user", "$.comment")
+                    pipe.json().objlen(key, "$.changes")
+                results = await pipe.execute()
+
+            async with client.pipeline(transaction=False) as pipe:
+                for index, version_id in enumerate(batch):
+                    fields, change_count = results[index * 2 : index * 2 + 2]
+                    if not fields or not fields["$.timestamp"]:
+                        continue
+                    timestamp = fields["$.timestamp"][0]
+                    pipe.zadd(
+                        instrument_key(instrument_id, "history"),
+                        {version_id: timestamp_score(timestamp)},
+                    )
+                    pipe.hset(
+                        instrument_key(instrument_id, "history:summaries"),
+                        version_id,
+                        json.dumps(
+                            {
+                                "version_id": version_id,
+                                "timestamp": timestamp,
+                                "user": fields["$.user"][0],
+                                "comment": fields["$.comment"][0],
+                                "change_count": change_count[0] or 0,
+                            }
+                        ),
+                    )
+                await pipe.execute()
+
+
+async def deduplicate_payloads(client):
+    """Move full data of versions and snapshots to content-addressed payloads"""
+    async for instrument_id in scan_instrument_ids(client):
+        prefix = instrument_key(instrument_id)
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.json().get(f"{prefix}:config")
+            pipe.json().get(f"{prefix}:versions")
+            pipe.json().get(f"{prefix}:snapshots")
+            config, version_ids, snapshot_names = await pipe.execute()
+
+        if version_ids:
+            await client.hset(
+                f"{prefix}:head", "content_hash", content_hash(config or {})
+            )
+
+        keys = [f"{prefix}:version:{version_id}" for version_id in version_ids or []]
+        keys += [f"{prefix}:snapshot:{name}" for name in snapshot_names or []]
+        for start in range(0, len(keys), 100):
+            batch = keys[start : start + 100]
+            async with client.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    pipe.json().get(key, "$.data")
+                results = await pipe.execute()
+
+            async with client.pipeline(transaction=False) as pipe:
+                for key, data in zip(batch, results):
+                    if not data:
+                        continue
+                    digest = content_hash(data[0])
+                    pipe.json().set(f"{prefix}:blob:{digest}", "$", data[0], nx=True)
+                    pipe.hincrby(f"{prefix}:blobrefs", digest, 1)
+                    pipe.json().set(key, "$.data_ref", digest)
+                    pipe.json().delete(key, "$.data")
+                await pipe.execute()
+
+
+# Ordered list of (name, coroutine function) pairs; never reorder or rename
+MIGRATIONS = [
+    ("0001_split_instruments_list", split_instruments_list),
+    ("0002_create_version_heads", create_version_heads),
+    ("0003_index_version_history", index_version_history),
+    ("0004_deduplicate_payloads", deduplicate_payloads),
+]
+
+
+async def _id_set_keys(client):
+    # The plain set and every shard, whatever the shard count was
+    keys = [LEGACY_IDS_KEY]
+    async for key in client.scan_iter("instruments:ids:*"):
+        keys.append(key)
+    return [key for key in keys if await client.exists(key)]
+
+
+def key_layout(tagged=None):
+    """Name of the plain or the hash-tagged layout, with its ID shard count"""
+    keys = instrument_ids_keys(tagged)
+    return "plain" if keys == [LEGACY_IDS_KEY] else f"hash-tagged:{len(keys)}"
+
+
+async def check_key_layout(client):
+    """Raise RuntimeError if instruments are stored in another key layout
+
+    That is the case after switching between the plain and the hash-tagged
+    layout, or changing INSTRUMENT_ID_SHARDS, without running migrate-keys.
+    The layout is recorded in KEY_LAYOUT_KEY, so this reads one key and,
+    when the settings changed, the ID sets of the recorded layout.
+    """
+    expected = key_layout()
+    # Only the plain layout was in use before the layout was recorded
+    stored = await client.get(KEY_LAYOUT_KEY) or "plain"
+    if stored == expected:
+        return
+    name, _, shards = stored.partition(":")
+    async with client.pipeline(transaction=False) as pipe:
+        for key in instrument_ids_keys(name != "plain", int(shards or 0)):
+            pipe.exists(key)
+        if any(await pipe.execute()):
+            raise RuntimeError(
+                f"Instruments are stored in the {stored} key layout, but the"
+                f" settings use the {expected} layout; run"
+                " python -m app.cli migrate-keys"
+            )
+    # Nothing is stored yet, so the layout of the settings is taken
+    await client.set(KEY_LAYOUT_KEY, expected)
+
+
+async def migrate_key_layout(client, tagged, batch_size=500):
+    """Rename every instrument key into the hash-tagged or the plain layout
+
+    The instrument ID sets are also redistributed over the shards of the
+    target layout, so this changes INSTRUMENT_ID_SHARDS too. Keys of the
+    other layout are found by one scan, so keys added in later releases
+    move along. Each RENAME is atomic but the migration is not, so stop the
+    API while it runs; running it again resumes it. The target layout is
+    recorded for check_key_layout last. Returns the number of renamed keys.
+    """
+    id_set_keys = await _id_set_keys(client)
+    instrument_ids = set()
+    for key in id_set_keys:
+        instrument_ids.update(await client.smembers(key))
+
+    # Old prefix of every instrument's keys and of its search document
+    prefixes = {
+        f"{instrument_key(instrument_id, tagged=not tagged)}:": instrument_id
+        for instrument_id in instrument_ids
+    }
+    documents = {
+        f"{DOCUMENT_PREFIX}{hash_tag(instrument_id, not tagged)}": instrument_id
+        for instrument_id in instrument_ids
+    }
+
+    def new_name(key):
+        if key in documents:
+            return f"{DOCUMENT_PREFIX}{hash_tag(documents[key], tagged)}"
+        # IDs may contain colons, so try every split of the key
+        start = len("instrument:")
+        while (end := key.find(":", start)) != -1:
+            prefix = key[: end + 1]
+            if prefix in prefixes:
+                return (
+                    f"{instrument_key(prefixes[prefix], tagged=tagged)}:{key[end + 1:]}"
+                )
+            start = end + 1
+        return None
+
+    renamed = 0
+    for pattern in ("instrument:*", f"{DOCUMENT_PREFIX}*"):
+        batch = []
+        async for key in client.scan_iter(pattern, count=batch_size):
+            target = new_name(key)
+            if target is not None and target != key:
+                batch.append((key, target))
+            if len(batch) >= batch_size:
+                renamed += await _rename(client, batch)
+                batch = []
+        if batch:
+            renamed += await _rename(client, batch)
+
+    # Every ID into its set in the target layout, and out of any other
+    targets = instrument_ids_keys(tagged)
+    async with client.pipeline(transaction=False) as pipe:
+        for instrument_id in instrument_ids:
+            pipe.sadd(instrument_ids_key(instrument_id, tagged), instrument_id)
+        for key in id_set_keys:
+            if key not in targets:
+                pipe.delete(key)
+                continue
+            moved = [
+                instrument_id
+                for instrument_id in await client.smembers(key)
+                if instrument_ids_key(instrument_id, tagged) != key
+            ]
+            if moved:
+                pipe.srem(key, *moved)
+        pipe.set(KEY_LAYOUT_KEY, key_layout(tagged))
+        await pipe.execute()
+    return renamed
+
+
+async def _rename(client, pairs):
+    async with client.pipeline(transaction=False) as pipe:
+        for key, target in pairs:
+            pipe.rename(key, target)
+        # A key deleted since the scan fails alone
+        results = await pipe.execute(raise_on_error=False)
+    return sum(not isinstance(result, Exception) for result in results)
+
+
+async def run_migrations(client):
+    """Apply all pending migrations, one worker at a time"""
+    await check_key_layout(client)
+    async with client.lock(f"{MIGRATIONS_KEY}:lock", timeout=300, blocking_timeout=300):
+        applied = await client.smembers(MIGRATIONS_KEY)
+        for name, migration in MIGRATIONS:
+            if name in applied:
+                continue
+            print(f"Applying migration {name}")
+            await migration(client)
+            await client.sadd(MIGRATIONS_KEY, name)
+
+
+async def main():
+    client = await init_redis_pool()
+    try:
+        await run_migrations(client)
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,24 +1,295 @@
 # backend/app/db/redis_client.py
+import asyncio
+import contextlib
+import contextvars
+import copy
+import functools
+import hashlib
 import json
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import orjson
 import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import EqualJitterBackoff
+from redis.client import NEVER_DECODE
+from redis.commands import AsyncRedisModuleCommands
 from app.core.config import settings
+from app.db.keys import (
+    get_instrument_ids,
+    instrument_ids_key,
+    instrument_key,
+    json_mget,
+)
+from app.services.cache import INVALIDATION_CHANNEL, MISSING
+from app.services.compression import (
+    PayloadCodec,
+    blob_key,
+    load_blobs,
+    load_payload_json,
+    load_payloads,
+    split_ref,
+)
+from app.services.events import EVENTS_STREAM
+from app.services.metrics import instrument_methods, observe_command
+from app.services.replicas import ReplicaSet
+from app.services.diff import (
+    apply_patch,
+    canonical_json,
+    diff,
+    split_pointer,
+    to_changes,
+    to_patch,
+)
+from app.services.paths import (
+    is_array_index,
+    parse_jsonpath,
+    project,
+    to_pointer,
+    to_redis_path,
+)
+
+
+class MonitoredConnectionPool(redis.BlockingConnectionPool):
+    """Connection pool waiting for a free connection instead of opening more
+
+    It counts the connections handed out, so utilization can be reported.
+    """
+
+    def reset(self):
+        super().reset()
+        # Transactions read through a second connection while holding their
+        # WATCH connection; capping them at half the pool leaves those reads
+        # a connection even when every transaction waits for one
+        self.transaction_slots = asyncio.Semaphore(max(1, self.max_connections // 2))
+        self._in_use = set()
+        self.peak_in_use = 0
+        self.acquire_errors = 0
+        self.acquire_seconds = 0.0
+
+    async def get_connection(self, command_name, *keys, **options):
+        started = time.perf_counter()
+        try:
+            connection = await super().get_connection(command_name, *keys, **options)
+        except Exception:
+            self.acquire_errors += 1
+            raise
+        finally:
+            self.acquire_seconds += time.perf_counter() - started
+        self._in_use.add(connection)
+        self.peak_in_use = max(self.peak_in_use, len(self._in_use))
+        return connection
+
+    async def release(self, connection):
+        self._in_use.discard(connection)
+        await super().release(connection)
+
+    def stats(self):
+        """Utilization counters of the pool"""
+        return {
+            "max_connections": self.max_connections,
+            "created": len(self._connections),
+            "in_use": len(self._in_use),
+            "idle": len(self._connections) - len(self._in_use),
+            "peak_in_use": self.peak_in_use,
+            "acquire_errors": self.acquire_errors,
+            "acquire_seconds": round(self.acquire_seconds, 6),
+        }
+
+
+class Pipeline(redis.client.Pipeline):
+    """Pipeline measuring its round trips"""
+
+    async def immediate_execute_command(self, *args, **options):
+        # WATCH and the reads of an optimistic transaction
+        with observe_command(str(args[0]).upper()):
+            return await super().immediate_execute_command(*args, **options)
+
+    async def execute(self, raise_on_error=True):
+        command = (
+            "MULTI" if self.is_transaction or self.explicit_transaction else "PIPELINE"
+        )
+        with observe_command(command):
+            return await super().execute(raise_on_error)
+
+
+class Redis(redis.Redis):
+    """Client measuring the latency and errors of every Redis command"""
+
+    async def execute_command(self, *args, **options):
+        with observe_command(str(args[0]).upper()):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return Pipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+def client_class():
+    return Redis if settings.METRICS_ENABLED else redis.Redis
+
+
+class ClusterPipeline(AsyncRedisModuleCommands, redis.cluster.ClusterPipeline):
+    """Cluster pipeline that also knows the RedisJSON commands"""
+
+    def set_response_callback(self, command, callback):
+        # Nodes parse the replies, with the callbacks of the cluster client
+        self._client.set_response_callback(command, callback)
+
+
+class SlotTransaction(Pipeline):
+    """Transaction on the cluster node serving one hash slot
+
+    MULTI/EXEC only spans the keys of one node, so commands on keys of other
+    slots, like the change feed stream, are sent through the cluster once the
+    transaction committed; they are not part of it.
+    """
+
+    def __init__(self, cluster, node_client, slot):
+        super().__init__(
+            node_client.connection_pool, node_client.response_callbacks, True, None
+        )
+        self.cluster = cluster
+        self.slot = slot
+        self.deferred = []
+
+    def pipeline_execute_command(self, *args, **options):
+        # PUBLISH names a channel, which every node broadcasts
+        if args[0] != "PUBLISH" and self.cluster.keyslot(args[1]) != self.slot:
+            self.deferred.append((args, options))
+            return self
+        return super().pipeline_execute_command(*args, **options)
+
+    async def reset(self):
+        self.deferred = []
+        await super().reset()
+
+    async def execute(self, raise_on_error=True):
+        deferred = self.deferred
+        result = await super().execute(raise_on_error)
+        if deferred:
+            async with self.cluster.pipeline() as pipe:
+                for args, options in deferred:
+                    pipe.execute_command(*args, **options)
+                await pipe.execute()
+        return result
+
+
+class RedisCluster(AsyncRedisModuleCommands, redis.RedisCluster):
+    """Cluster client with RedisJSON, RediSearch, pub/sub and transactions
+
+    redis-py's cluster client supports none of these. Transactions and
+    pub/sub run on clients of single nodes, see slot_transaction. ``raw``
+    is a second cluster client for reading stored JSON as bytes, set by
+    init_redis_pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.raw = None
+        self._node_clients = {}
+
+    async def execute_command(self, *args, **options):
+        if not settings.METRICS_ENABLED:
+            return await super().execute_command(*args, **options)
+        with observe_command(str(args[0]).upper()):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=None, shard_hint=None):
+        if transaction or shard_hint:
+            # Raises, as transactions need slot_transaction
+            return super().pipeline(transaction, shard_hint)
+        return ClusterPipeline(self)
+
+    def _node_client(self, node):
+        if node.name not in self._node_clients:
+            pool = redis.BlockingConnectionPool(
+                connection_class=node.connection_class,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                **node.connection_kwargs,
+            )
+            client = client_class()(connection_pool=pool)
+            client.auto_close_connection_pool = True
+            self._node_clients[node.name] = client
+        return self._node_clients[node.name]
+
+    def slot_transaction(self, key):
+        """Transaction pipeline for keys sharing the hash slot of key"""
+        node = self.get_node_from_key(key)
+        return SlotTransaction(self, self._node_client(node), self.keyslot(key))
+
+    def pubsub(self, **kwargs):
+        # Classic pub/sub messages reach the subscribers on every node
+        return self._node_client(self.get_random_node()).pubsub(**kwargs)
+
+    async def close(self):
+        for client in self._node_clients.values():
+            await client.close()
+        self._node_clients = {}
+        if self.raw is not None:
+            await self.raw.close()
+        await super().close()
+
+
+def redis_url():
+    """URL of the Redis server: REDIS_URL, or one built from host, port and db"""
+    if settings.REDIS_URL:
+        return settings.REDIS_URL
+    return f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}"
+
+
+def connection_options(url):
+    """Pool, timeout, retry and TLS options from the settings"""
+    options = {
+        "password": settings.REDIS_PASSWORD or None,
+        "decode_responses": True,  # Return strings instead of bytes
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        # Seconds to wait for a free connection before failing
+        "timeout": settings.REDIS_POOL_TIMEOUT,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT or None,
+        "socket_connect_timeout": settings.REDIS_CONNECT_TIMEOUT or None,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+    if url.startswith(("redis://", "rediss://")):
+        # Unix socket connections take no TCP options
+        options["socket_keepalive"] = True
+    if settings.REDIS_RETRIES:
+        # Jittered exponential backoff keeps workers from reconnecting in step
+        options["retry"] = Retry(
+            EqualJitterBackoff(
+                cap=settings.REDIS_RETRY_BACKOFF_CAP,
+                base=settings.REDIS_RETRY_BACKOFF_BASE,
+            ),
+            settings.REDIS_RETRIES,
+        )
+        options["retry_on_error"] = [redis.ConnectionError, redis.TimeoutError]
+    if url.startswith("rediss://"):
+        options.update(
+            ssl_ca_certs=settings.REDIS_SSL_CA_CERTS or None,
+            ssl_certfile=settings.REDIS_SSL_CERTFILE or None,
+            ssl_keyfile=settings.REDIS_SSL_KEYFILE or None,
+            ssl_cert_reqs=settings.REDIS_SSL_CERT_REQS,
+        )
+    return options
 
 
 # Helper function to initialize Redis pool
 async def init_redis_pool():
-    redis_url = (
-        f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}"
-    )
-
-    # Create Redis client directly from URL
-    # Note: Changed from_pool to from_url as per error message
-    client = redis.Redis.from_url(
-        redis_url,
-        password=settings.REDIS_PASSWORD,
-        decode_responses=True,  # Return strings instead of bytes
-    )
+    url = redis_url()
+    if settings.REDIS_CLUSTER:
+        options = connection_options(url)
+        # Nodes open connections up to max_connections, without waiting
+        del options["timeout"]
+        client = RedisCluster.from_url(url, **options)
+        client.raw = RedisCluster.from_url(url, **options)
+    else:
+        pool = MonitoredConnectionPool.from_url(url, **connection_options(url))
+        client = client_class()(connection_pool=pool)
+        # The client owns the pool, so closing it disconnects every connection
+        client.auto_close_connection_pool = True
 
     # Test connection
     try:
@@ -31,157 +302,1686 @@ async def init_redis_pool():
     return client
 
 
+async def init_replicas():
+    """ReplicaSet of the read replicas in REDIS_REPLICA_URLS, or None"""
+    if settings.REDIS_CLUSTER:
+        # Cluster replicas serve the slots of their own primary only
+        return None
+    clients = []
+    for url in settings.redis_replica_urls_list:
+        pool = MonitoredConnectionPool.from_url(url, **connection_options(url))
+        client = client_class()(connection_pool=pool)
+        client.auto_close_connection_pool = True
+        clients.append(client)
+    if not clients:
+        return None
+    return ReplicaSet(clients, settings.REDIS_REPLICA_RETRY_SECONDS)
+
+
+def pool_stats(client):
+    """Utilization of a client's connection pool, if it is monitored"""
+    if isinstance(client, redis.RedisCluster):
+        # Every node of a cluster has a pool of its own
+        return {"monitored": False, "nodes": len(client.get_nodes())}
+    pool = client.connection_pool
+    if not isinstance(pool, MonitoredConnectionPool):
+        return {"monitored": False, "max_connections": pool.max_connections}
+    return {"monitored": True, **pool.stats()}
+
+
+def timestamp_score(value):
+    """Microseconds since the epoch, used as sorted-set score for timestamps"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+
+
+def _check_disjoint(targets, ops):
+    """Reject operations whose targets overlap or shift each other's indexes"""
+    paths = {tuple(tokens) for tokens in targets}
+    if len(paths) < len(targets):
+        raise ValueError("Operations must not target the same path twice")
+
+    elements = {}
+    for tokens, op in zip(targets, ops):
+        for end in range(len(tokens)):
+            if tuple(tokens[:end]) in paths:
+                raise ValueError(f"Operations overlap at {op['path']!r}")
+        if tokens and isinstance(tokens[-1], int):
+            elements.setdefault(tuple(tokens[:-1]), []).append(op["op"])
+    for kinds in elements.values():
+        # Adding or removing an element moves the ones after it
+        if len(kinds) > 1 and any(kind != "replace" for kind in kinds):
+            raise ValueError(
+                "Operations must not add or remove elements of an array other operations edit"
+            )
+
+
+def _exclusive_max(score):
+    """Integer exclusive upper bound for a ZRANGEBYSCORE max argument"""
+    if score == "+inf":
+        return 2**63 - 1
+    if isinstance(score, str) and score.startswith("("):
+        return int(score[1:])
+    return int(score) + 1
+
+
+# Reads of a delta chain before it is taken as broken rather than moved
+# by a concurrent compaction
+CHAIN_READ_ATTEMPTS = 3
+
+
+def _chain_intact(version, chain):
+    """Whether chain holds a delta version's keyframe and every delta before it"""
+    keyframe_seq = version["keyframe_seq"]
+    return len(chain) == version["seq"] - keyframe_seq and all(
+        doc and doc.get("seq", keyframe_seq) == keyframe_seq + index
+        for index, doc in enumerate(chain)
+    )
+
+
+def raw_client(client):
+    """Client sharing client's connection pool that never parses JSON replies
+
+    redis-py registers RedisJSON reply parsers on a client the first time
+    ``json()`` is called on it, so stored JSON is read as bytes through a
+    separate client object; a cluster client brings its own.
+    """
+    if isinstance(client, RedisCluster):
+        return client.raw
+    return client_class()(connection_pool=client.connection_pool)
+
+
+# Replica serving the reads of the current replica_read call, if any
+_replica = contextvars.ContextVar("replica", default=None)
+
+
+def replica_read(method):
+    """Run a RedisService read method against one of its replicas
+
+    Everything the method reads through ``self.redis`` goes to the same
+    replica. If the replica fails, it is skipped for a while and the
+    method runs again on the primary.
+    """
+
+    @functools.wraps(method)
+    async def read(self, *args, **kwargs):
+        replica = None
+        if self.replicas is not None and _replica.get() is None:
+            replica = self.replicas.choose()
+        if replica is None:
+            return await method(self, *args, **kwargs)
+
+        token = _replica.set(replica)
+        try:
+            return await method(self, *args, **kwargs)
+        except (redis.ConnectionError, redis.TimeoutError):
+            self.replicas.mark_down(replica)
+        finally:
+            _replica.reset(token)
+        return await method(self, *args, **kwargs)
+
+    return read
+
+
+@contextlib.contextmanager
+def _on_primary(service):
+    """Send every read in the block to the primary, replica_read ones too"""
+    token = _replica.set(service.primary)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def primary_write(method):
+    """Run a RedisService write method, and the reads it makes, on the primary"""
+
+    @functools.wraps(method)
+    async def write(self, *args, **kwargs):
+        with _on_primary(self):
+            return await method(self, *args, **kwargs)
+
+    return write
+
+
+def content_hash(data):
+    """SHA-256 of the canonical JSON encoding, used to address stored payloads"""
+    return hashlib.sha256(canonical_json(data)).hexdigest()
+
+
+class VersionConflict(Exception):
+    """A write expected a base version that is no longer current"""
+
+    def __init__(self, version_id, etag):
+        super().__init__(f"Configuration changed, current version is {version_id}")
+        self.version_id = version_id
+        self.etag = etag
+
+
+def _check_base(head, expected, config=None):
+    """Raise VersionConflict unless the head matches one of the expected tags
+
+    Tags are version IDs or entity tags of the current configuration, as
+    get_config_etag returns them; ``*`` matches any state. ``config`` is
+    only needed for instruments without a recorded head.
+    """
+    version_id = head.get("version_id")
+    etag = head.get("content_hash") or (version_id and f"v-{version_id}")
+    if not etag and config is not None:
+        etag = content_hash(config)
+    if not {"*", version_id, etag}.isdisjoint(expected):
+        return
+    raise VersionConflict(version_id, etag)
+
+
 # Redis service class with JSON operations
+@instrument_methods
 class RedisService:
-    def __init__(self, redis_client):
-        self.redis = redis_client
+    def __init__(
+        self,
+        redis_client,
+        cache=None,
+        archive=None,
+        diff_cache=None,
+        replicas=None,
+        search=None,
+    ):
+        self.primary = redis_client
+        # Optional ReplicaSet serving the methods marked with replica_read
+        self.replicas = replicas
+        # time.time() of the last write made through this service
+        self.last_write = None
+        # Optional process-wide LRUCache for metadata and current configs
+        self.cache = cache
+        # Optional process-wide LRUCache of diffs, keyed by content identity
+        self.diff_cache = diff_cache
+        # Optional VersionArchive holding versions expired from Redis
+        self.archive = archive
+        self.keyframe_interval = settings.VERSION_KEYFRAME_INTERVAL
+        # Whether and how new payloads are compressed
+        self.codec = PayloadCodec.from_settings()
+        # Optional SearchIndex whose documents writes maintain, see open_index
+        self.search = search
+        self._raw = {}
 
-    # --- Instrument Config Operations ---
+    @property
+    def redis(self):
+        """Client to use: the replica of a replica_read call, or the primary"""
+        return _replica.get() or self.primary
 
-    async def get_instruments(self):
-        """Get list of all instruments"""
-        instruments = await self.redis.json().get("instruments:list")
-        return instruments or {}
+    @property
+    def raw(self):
+        """Client for reading stored JSON as bytes, created on first use"""
+        client = self.redis
+        if id(client) not in self._raw:
+            self._raw[id(client)] = raw_client(client)
+        return self._raw[id(client)]
 
-    async def get_instrument(self, instrument_id):
-        """Get specific instrument metadata"""
-        instruments = await self.redis.json().get("instruments:list")
-        if not instruments:
-            return None
-        return instruments.get(instrument_id)
+    async def _cached(self, key, load):
+        """Read through the in-process cache, if one is configured
 
-    async def add_instrument(self, instrument_id, metadata):
-        """Add a new instrument"""
-        # Check if instruments list exists, create if not
-        if not await self.redis.exists("instruments:list"):
-            await self.redis.json().set("instruments:list", "$", {})
+        Misses are loaded from the primary, so a lagging replica cannot
+        refill the cache with data an invalidation just dropped.
+        """
+        if self.cache is None:
+            return await load()
 
-        # Add instrument to list
-        await self.redis.json().set(f"instruments:list", f"$.{instrument_id}", metadata)
+        value = self.cache.get(key)
+        if value is MISSING:
+            with _on_primary(self):
+                value = await load()
+            if value is not None:
+                self.cache.set(key, value)
+        return value
 
-        # Initialize empty config
-        await self.redis.json().set(f"instrument:{instrument_id}:config", "$", {})
+    def _transaction_slot(self):
+        """Context holding one of the pool's transaction slots, if it has any"""
+        pool = getattr(self.redis, "connection_pool", None)
+        slots = getattr(pool, "transaction_slots", None)
+        return slots if slots is not None else contextlib.nullcontext()
 
-        # Initialize empty versions and snapshots lists
-        await self.redis.json().set(f"instrument:{instrument_id}:versions", "$", [])
-        await self.redis.json().set(f"instrument:{instrument_id}:snapshots", "$", [])
+    def _transaction(self, instrument_id):
+        """Transaction pipeline for the keys of one instrument"""
+        if isinstance(self.redis, RedisCluster):
+            return self.redis.slot_transaction(instrument_key(instrument_id))
+        return self.redis.pipeline(transaction=True)
 
-        return True
+    def _publish_invalidation(self, pipe, instrument_id):
+        """Queue a message telling every worker to drop an instrument's entries"""
+        pipe.publish(INVALIDATION_CHANNEL, instrument_id)
+        self.last_write = time.time()
 
-    # --- Configuration Operations ---
+    def _queue_event(self, pipe, event_type, instrument_id, **fields):
+        """Queue appending a change event to the change feed stream"""
+        fields = {name: value for name, value in fields.items() if value is not None}
+        pipe.xadd(
+            EVENTS_STREAM,
+            {"type": event_type, "instrument_id": instrument_id, **fields},
+            maxlen=settings.EVENTS_STREAM_MAXLEN,
+            approximate=True,
+        )
 
-    async def get_config(self, instrument_id):
-        """Get current configuration for an instrument"""
-        config = await self.redis.json().get(f"instrument:{instrument_id}:config")
-        return config or {}
+    def _store_blob(self, pipe, instrument_id, ref, data=None):
+        """Queue storing a payload once and taking a reference to it
 
-    async def update_config(self, instrument_id, config_data, user, comment=""):
-        """Update configuration and create a new version"""
-        # Get current config for comparison
-        current_config = await self.get_config(instrument_id)
-
-        # Create changes dict (diff between old and new)
-        changes = {}
-        for key, new_value in config_data.items():
-            if key in current_config and current_config[key] != new_value:
-                changes[key] = {"old": current_config[key], "new": new_value}
-            elif key not in current_config:
-                changes[key] = {"old": None, "new": new_value}
-
-        # If no changes, don't create a new version
-        if not changes:
-            return None
+        ``data`` may be omitted when the payload is known to be stored under
+        ``ref``. Otherwise ``ref`` is its content hash, and the reference it
+        is stored under, which names its encoding, is returned.
+        """
+        if data is not None:
+            ref = self.codec.queue_store(pipe, instrument_id, ref, data)
+        pipe.hincrby(instrument_key(instrument_id, "blobrefs"), ref, 1)
+        return ref
 
-        # Update current config
-        await self.redis.json().set(
-            f"instrument:{instrument_id}:config", "$", config_data
+    def _release_blob(self, pipe, instrument_id, ref):
+        """Queue dropping a reference; unreferenced payloads are swept by gc_blobs"""
+        pipe.hincrby(instrument_key(instrument_id, "blobrefs"), ref, -1)
+
+    async def _resolve_data(self, instrument_id, document, paths=None, raw=False):
+        """Replace a document's data_ref with the referenced payload, in place
+
+        With ``paths``, only the projection of the payload onto them is read.
+        With ``raw``, the payload is left unparsed as an ``orjson.Fragment``.
+        """
+        if document and "data_ref" in document:
+            ref = document.pop("data_ref")
+            if raw and not paths:
+                payload = await load_payload_json(self.raw, instrument_id, ref)
+                document["data"] = orjson.Fragment(payload) if payload else None
+            elif paths and split_ref(ref)[0] is None:
+                document["data"] = await self._read_projection(
+                    blob_key(instrument_id, ref), paths
+                )
+            else:
+                # Compressed payloads are only readable as a whole
+                (data,) = await load_payloads(self.redis, instrument_id, [ref])
+                document["data"] = project(data, paths) if paths else data
+        elif document and paths:
+            document["data"] = project(document["data"], paths)
+        return document
+
+    async def _read_projection(self, key, paths):
+        """Read only the values at definite JSONPaths, keyed by path"""
+        redis_paths = [to_redis_path(parse_jsonpath(path)) for path in paths]
+        result = await self.redis.json().get(key, *redis_paths)
+        if result is None:
+            return {}
+        if len(redis_paths) == 1:
+            # A single path is answered with its matches instead of an object
+            result = {redis_paths[0]: result}
+        return {
+            path: result[redis_path][0]
+            for path, redis_path in zip(paths, redis_paths)
+            if result.get(redis_path)
+        }
+
+    def _keyframe_due(self, head):
+        """Whether the next version must store the full configuration"""
+        # Imported instruments may have a head holding only a content hash
+        if not head or "seq" not in head:
+            return True
+        return (
+            int(head["seq"]) + 1 - int(head["keyframe_seq"]) >= self.keyframe_interval
         )
 
-        # Create new version
+    def _queue_version(
+        self, pipe, instrument_id, head, ops, user, comment, config_data=None
+    ):
+        """Queue writing the version recording ops and advancing the head
+
+        Every ``keyframe_interval`` versions store the full configuration,
+        which must then be passed as ``config_data``; the others store the
+        JSON patch against the previous version. Returns the version ID.
+        """
         version_id = str(uuid.uuid4())
         timestamp = datetime.utcnow().isoformat()
+        seq = int(head["seq"]) + 1 if head and "seq" in head else 0
+        changes = to_changes(ops)
 
         version_data = {
             "version_id": version_id,
             "timestamp": timestamp,
             "user": user,
             "comment": comment,
-            "data": config_data,
             "changes": changes,
+            "seq": seq,
         }
 
-        # Save version
-        await self.redis.json().set(
-            f"instrument:{instrument_id}:version:{version_id}", "$", version_data
+        # Store a full keyframe every N versions and JSON patches against
+        # the previous version in between
+        digest = content_hash(config_data) if config_data is not None else None
+        payload_ref = None
+        if self._keyframe_due(head):
+            keyframe_seq = seq
+            payload_ref = self._store_blob(pipe, instrument_id, digest, config_data)
+            version_data["data_ref"] = payload_ref
+        else:
+            keyframe_seq = int(head["keyframe_seq"])
+            version_data["patch"] = to_patch(ops)
+        version_data["keyframe_seq"] = keyframe_seq
+
+        pipe.json().set(
+            instrument_key(instrument_id, "version", version_id), "$", version_data
+        )
+        pipe.json().arrappend(
+            instrument_key(instrument_id, "versions"), "$", version_id
+        )
+        # Time-ordered index and summary for history listings
+        pipe.zadd(
+            instrument_key(instrument_id, "history"),
+            {version_id: timestamp_score(timestamp)},
+        )
+        pipe.hset(
+            instrument_key(instrument_id, "history:summaries"),
+            version_id,
+            json.dumps(
+                {
+                    "version_id": version_id,
+                    "timestamp": timestamp,
+                    "user": user,
+                    "comment": comment,
+                    "change_count": len(changes),
+                }
+            ),
+        )
+        head_key = instrument_key(instrument_id, "head")
+        pipe.hset(
+            head_key,
+            mapping={
+                "version_id": version_id,
+                "seq": seq,
+                "keyframe_seq": keyframe_seq,
+            },
+        )
+        if digest:
+            pipe.hset(head_key, "content_hash", digest)
+        else:
+            # Unknown without reading the whole configuration
+            pipe.hdel(head_key, "content_hash")
+        # Reference of the stored payload of the current configuration, if any
+        if payload_ref:
+            pipe.hset(head_key, "payload_ref", payload_ref)
+        else:
+            pipe.hdel(head_key, "payload_ref")
+        pipe.json().set(
+            instrument_key(instrument_id, "meta"), "$.last_updated", timestamp
+        )
+        if self.search is not None:
+            self.search.queue_update(
+                pipe, instrument_id, config=config_data, last_updated=timestamp
+            )
+        self._queue_event(
+            pipe,
+            "config",
+            instrument_id,
+            version_id=version_id,
+            seq=seq,
+            timestamp=timestamp,
+            user=user,
+            change_count=len(changes),
+        )
+        self._publish_invalidation(pipe, instrument_id)
+        return version_id
+
+    def _evict(self, instrument_id):
+        """Drop this worker's cache entries right after a committed write"""
+        if self.cache is not None:
+            self.cache.invalidate(instrument_id)
+
+    # --- Instrument Config Operations ---
+
+    @replica_read
+    async def get_instrument_ids(self):
+        """Get the sorted IDs of all instruments"""
+        return sorted(await get_instrument_ids(self.redis))
+
+    @replica_read
+    async def get_instruments(self, instrument_ids=None):
+        """Get metadata of all instruments, or of the given IDs that exist"""
+        if instrument_ids is None:
+            instrument_ids = await self.get_instrument_ids()
+        instrument_ids = sorted(instrument_ids)
+        if not instrument_ids:
+            return {}
+
+        metadata = await json_mget(
+            self.redis,
+            [instrument_key(instrument_id, "meta") for instrument_id in instrument_ids],
+            ".",
         )
+        return {
+            instrument_id: meta
+            for instrument_id, meta in zip(instrument_ids, metadata)
+            if meta
+        }
 
-        # Add to versions list
-        await self.redis.json().arrappend(
-            f"instrument:{instrument_id}:versions", "$", version_id
+    @replica_read
+    async def get_instrument(self, instrument_id):
+        """Get specific instrument metadata"""
+        return await self._cached(
+            (instrument_id, "meta"),
+            lambda: self.redis.json().get(instrument_key(instrument_id, "meta")),
         )
 
-        # Update last_updated in instrument metadata
-        await self.redis.json().set(
-            "instruments:list", f"$.{instrument_id}.last_updated", timestamp
+    @replica_read
+    async def instrument_exists(self, instrument_id):
+        """Check whether an instrument exists without loading its metadata"""
+        if self.cache is not None:
+            # Metadata is small; caching it also answers future checks
+            return await self.get_instrument(instrument_id) is not None
+        return bool(await self.redis.exists(instrument_key(instrument_id, "meta")))
+
+    @replica_read
+    async def search_instruments(
+        self,
+        types=None,
+        locations=None,
+        name=None,
+        conditions=(),
+        sort_by=None,
+        descending=False,
+        offset=0,
+        limit=50,
+    ):
+        """Total number of matching instruments and one page of them
+
+        Served by the search index, see SearchIndex.search.
+        """
+        return await self.search.search(
+            self.redis,
+            types=types,
+            locations=locations,
+            name=name,
+            conditions=conditions,
+            sort_by=sort_by,
+            descending=descending,
+            offset=offset,
+            limit=limit,
         )
 
-        return version_id
+    @primary_write
+    async def add_instrument(self, instrument_id, metadata):
+        """Add a new instrument"""
+        async with self._transaction(instrument_id) as pipe:
+            # Store metadata and register the instrument ID
+            pipe.json().set(instrument_key(instrument_id, "meta"), "$", metadata)
+            pipe.sadd(instrument_ids_key(instrument_id), instrument_id)
+
+            # Initialize empty config
+            pipe.json().set(instrument_key(instrument_id, "config"), "$", {})
 
+            # Initialize empty versions and snapshots lists
+            pipe.json().set(instrument_key(instrument_id, "versions"), "$", [])
+            pipe.json().set(instrument_key(instrument_id, "snapshots"), "$", [])
+            if self.search is not None:
+                self.search.queue_update(pipe, instrument_id, metadata, config={})
+            self._publish_invalidation(pipe, instrument_id)
+            await pipe.execute()
+        self._evict(instrument_id)
+
+        return True
+
+    # --- Configuration Operations ---
+
+    @replica_read
+    async def get_config(self, instrument_id, paths=None):
+        """Get current configuration for an instrument
+
+        ``paths`` optionally projects it onto definite JSONPaths; only the
+        selected values are then read and returned, keyed by path.
+        """
+        if paths:
+            cached = (
+                self.cache.get((instrument_id, "config"))
+                if self.cache is not None
+                else MISSING
+            )
+            if cached is not MISSING:
+                return project(cached, paths)
+            return await self._read_projection(
+                instrument_key(instrument_id, "config"), paths
+            )
+
+        config = await self._cached(
+            (instrument_id, "config"),
+            lambda: self.redis.json().get(instrument_key(instrument_id, "config")),
+        )
+        return config or {}
+
+    @replica_read
+    async def get_config_json(self, instrument_id):
+        """Get the current configuration as stored, encoded as JSON bytes
+
+        Responses can send these bytes as they are, without parsing and
+        re-encoding the whole document.
+        """
+
+        async def load():
+            return await self.raw.execute_command(
+                "JSON.GET",
+                instrument_key(instrument_id, "config"),
+                ".",
+                **{NEVER_DECODE: True},
+            )
+
+        return await self._cached((instrument_id, "config_json"), load) or b"{}"
+
+    @replica_read
+    async def get_config_etag(self, instrument_id):
+        """Get an entity tag for the current configuration, if one is recorded
+
+        This is the content hash kept in the head, or the head version ID
+        after partial updates, which do not hash the whole configuration.
+        Checking it never loads the configuration itself.
+        """
+
+        async def load():
+            digest, version_id = await self.redis.hmget(
+                instrument_key(instrument_id, "head"), "content_hash", "version_id"
+            )
+            return digest or (version_id and f"v-{version_id}")
+
+        return await self._cached((instrument_id, "etag"), load)
+
+    @replica_read
+    async def get_configs(self, instrument_ids):
+        """Get current configurations of many instruments in one round trip
+
+        Returns a dict of instrument ID to config; IDs of instruments that
+        do not exist are left out.
+        """
+        configs = {}
+        to_load = []
+        for instrument_id in instrument_ids:
+            cached = (
+                self.cache.get((instrument_id, "config"))
+                if self.cache is not None
+                else MISSING
+            )
+            if cached is MISSING:
+                to_load.append(instrument_id)
+            else:
+                configs[instrument_id] = cached
+
+        if to_load:
+            # Loaded from the primary when cached, as in _cached
+            client = self.primary if self.cache is not None else self.redis
+            loaded = await json_mget(
+                client,
+                [instrument_key(instrument_id, "config") for instrument_id in to_load],
+                ".",
+            )
+            for instrument_id, config in zip(to_load, loaded):
+                # Every instrument has a config key, so a miss means no instrument
+                if not isinstance(config, dict):
+                    continue
+                configs[instrument_id] = config
+                if self.cache is not None:
+                    self.cache.set((instrument_id, "config"), config)
+
+        # Keep the requested order
+        return {
+            instrument_id: configs[instrument_id]
+            for instrument_id in instrument_ids
+            if instrument_id in configs
+        }
+
+    @primary_write
+    async def update_config(
+        self, instrument_id, config_data, user, comment="", expected=None
+    ):
+        """Update configuration and create a new version
+
+        Returns a ``(version_id, config)`` tuple with the resulting state;
+        ``version_id`` is None when the update contained no changes. With
+        ``expected``, a collection of version IDs or entity tags, raises
+        VersionConflict unless the configuration is still in one of those
+        states; the check and the write are one atomic compare-and-set.
+        """
+        head_key = instrument_key(instrument_id, "head")
+        await self.codec.prepare(self.redis)
+
+        pipe = self._transaction(instrument_id)
+        async with self._transaction_slot(), pipe:
+            while True:
+                try:
+                    # Every committed version rewrites the head, so watching it
+                    # guarantees sequence numbers are never handed out twice
+                    await pipe.watch(head_key)
+
+                    # Get current config and head, bypassing the cache
+                    async with self.redis.pipeline(transaction=False) as reads:
+                        reads.json().get(instrument_key(instrument_id, "config"))
+                        reads.hgetall(head_key)
+                        current_config, head = await reads.execute()
+                    current_config = current_config or {}
+                    if expected is not None:
+                        _check_base(head, expected, current_config)
+
+                    # Path-addressed diff between old and new
+                    ops = diff(current_config, config_data)
+
+                    # If no changes, don't create a new version
+                    if not ops:
+                        return None, current_config
+
+                    # Apply every write in a single MULTI/EXEC round trip so a
+                    # failure can never leave a version missing from the list
+                    pipe.multi()
+                    pipe.json().set(
+                        instrument_key(instrument_id, "config"), "$", config_data
+                    )
+                    version_id = self._queue_version(
+                        pipe, instrument_id, head, ops, user, comment, config_data
+                    )
+                    await pipe.execute()
+                    break
+                except redis.WatchError:
+                    # Another writer committed first; diff against its result
+                    continue
+        self._evict(instrument_id)
+
+        return version_id, config_data
+
+    @primary_write
+    async def patch_config(
+        self, instrument_id, operations, user, comment="", expected=None
+    ):
+        """Apply path operations to the configuration in place and create a version
+
+        ``operations`` are dicts with ``op``, ``path`` and ``value``: JSON
+        Patch ``add``, ``remove`` and ``replace`` addressed by JSON Pointer,
+        or ``set`` and ``delete`` addressed by a definite JSONPath. They are
+        applied with RedisJSON path commands, so only the edited values are
+        read and written; the whole document is only read when a keyframe
+        is due. Operations must not overlap, since they are all validated
+        against the configuration before any is applied.
+
+        Returns a ``(version_id, changes)`` tuple. Raises ValueError when an
+        operation cannot be applied, and VersionConflict as update_config
+        does when ``expected`` is given.
+        """
+        if not operations:
+            raise ValueError("No operations given")
+        config_key = instrument_key(instrument_id, "config")
+        head_key = instrument_key(instrument_id, "head")
+
+        targets = []
+        for operation in operations:
+            if operation["op"] in ("set", "delete"):
+                targets.append(parse_jsonpath(operation["path"]))
+            elif operation["op"] in ("add", "remove", "replace"):
+                targets.append(split_pointer(operation["path"]))
+            else:
+                raise ValueError(f"Unsupported operation: {operation['op']!r}")
+        await self.codec.prepare(self.redis)
+
+        pipe = self._transaction(instrument_id)
+        async with self._transaction_slot(), pipe:
+            while True:
+                try:
+                    await pipe.watch(head_key)
+                    head = await pipe.hgetall(head_key)
+                    if expected is not None:
+                        current = None
+                        if not head:
+                            # Never-updated configurations have no recorded tag
+                            current = await self.redis.json().get(config_key) or {}
+                        _check_base(head, expected, current)
+                    tokens = await self._resolve_indexes(
+                        config_key, operations, targets
+                    )
+                    ops, writes = await self._plan_operations(
+                        config_key, operations, tokens
+                    )
+
+                    config_data = None
+                    if self._keyframe_due(head) or (
+                        self.search is not None and self.search.touches(ops)
+                    ):
+                        # Keyframes hold the whole document, once per interval,
+                        # and search documents the values of indexed paths
+                        current = await self.redis.json().get(config_key)
+                        config_data = apply_patch(current or {}, to_patch(ops))
+
+                    pipe.multi()
+                    for command, *args in writes:
+                        getattr(pipe.json(), command)(*args)
+                    version_id = self._queue_version(
+                        pipe, instrument_id, head, ops, user, comment, config_data
+                    )
+                    await pipe.execute()
+                    break
+                except redis.WatchError:
+                    continue
+        self._evict(instrument_id)
+
+        return version_id, to_changes(ops)
+
+    async def _resolve_indexes(self, key, operations, targets):
+        """Turn JSON Pointer tokens addressing array elements into indexes
+
+        Whether ``/a/0`` addresses an element or a member named "0" depends
+        on the document, so the type of each such parent is looked up.
+        """
+        resolved = [list(tokens) for tokens in targets]
+        pointers = [
+            tokens
+            for operation, tokens in zip(operations, resolved)
+            if operation["op"] in ("add", "remove", "replace")
+        ]
+        for depth in range(max(map(len, pointers), default=0)):
+            pending = [
+                tokens
+                for tokens in pointers
+                if depth < len(tokens) and is_array_index(tokens[depth])
+            ]
+            if not pending:
+                continue
+            async with self.redis.pipeline(transaction=False) as reads:
+                for tokens in pending:
+                    reads.json().type(key, to_redis_path(tokens[:depth]))
+                types = await reads.execute()
+            for tokens, found in zip(pending, types):
+                if found and found[0] == "array":
+                    tokens[depth] = int(tokens[depth])
+        return resolved
+
+    async def _plan_operations(self, key, operations, targets):
+        """Validate operations against the stored document
+
+        Returns the applied operations in diff form, with previous values,
+        and the RedisJSON commands performing them as argument tuples.
+        """
+        async with self.redis.pipeline(transaction=False) as reads:
+            for tokens in targets:
+                parent = to_redis_path(tokens[:-1])
+                reads.json().type(key, parent)
+                reads.json().arrlen(key, parent)
+                reads.json().get(key, to_redis_path(tokens))
+            results = await reads.execute()
+
+        ops = []
+        writes = []
+        for index, (operation, tokens) in enumerate(zip(operations, targets)):
+            parent_type, length, found = results[index * 3 : index * 3 + 3]
+            parent_type = parent_type[0] if parent_type else None
+            length = length[0] if length else None
+            op, path, value = operation["op"], operation["path"], operation.get("value")
+            target = to_redis_path(tokens)
+            pointer = to_pointer(tokens)
+
+            if not tokens:
+                if op in ("remove", "delete"):
+                    raise ValueError("The configuration itself cannot be removed")
+                if not isinstance(value, dict):
+                    raise ValueError("The configuration must be an object")
+            elif parent_type == "array":
+                if tokens[-1] == "-" and op == "add":
+                    tokens[-1] = length
+                    pointer = to_pointer(tokens)
+                last = tokens[-1]
+                if (
+                    not isinstance(last, int)
+                    or last > length
+                    or (last == length and op != "add")
+                ):
+                    raise ValueError(f"Array index out of range: {path!r}")
+                if op == "add":
+                    # Inserting shifts later elements instead of replacing one
+                    ops.append({"op": "add", "path": pointer, "value": value})
+                    parent = to_redis_path(tokens[:-1])
+                    if last == length:
+                        writes.append(("arrappend", key, parent, value))
+                    else:
+                        writes.append(("arrinsert", key, parent, last, value))
+                    continue
+            elif parent_type == "object":
+                if isinstance(tokens[-1], int):
+                    raise ValueError(f"Path addresses an index of an object: {path!r}")
+                if not found and op not in ("add", "set"):
+                    raise ValueError(f"Path not found: {path!r}")
+            elif parent_type is None:
+                raise ValueError(f"Path not found: {path!r}")
+            else:
+                raise ValueError(f"Path addresses into a {parent_type}: {path!r}")
+
+            if op in ("remove", "delete"):
+                ops.append({"op": "remove", "path": pointer, "old": found[0]})
+                writes.append(("delete", key, target))
+            else:
+                ops.append(
+                    {"op": "replace", "path": pointer, "old": found[0], "value": value}
+                    if found
+                    else {"op": "add", "path": pointer, "value": value}
+                )
+                writes.append(("set", key, target, value))
+
+        _check_disjoint(targets, ops)
+        return ops, writes
+
+    async def _has_archived(self, instrument_id):
+        """Whether compaction may have archived versions of an instrument"""
+        if self.archive is None:
+            return False
+        base_seq = await self.redis.hget(
+            instrument_key(instrument_id, "head"), "base_seq"
+        )
+        return bool(int(base_seq or 0))
+
+    @replica_read
     async def get_versions(self, instrument_id):
-        """Get all version IDs for an instrument"""
-        versions = await self.redis.json().get(f"instrument:{instrument_id}:versions")
-        return versions or []
+        """Get all version IDs for an instrument, oldest first"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.json().get(instrument_key(instrument_id, "versions"))
+            pipe.hgetall(instrument_key(instrument_id, "pinned"))
+            pipe.hget(instrument_key(instrument_id, "head"), "base_seq")
+            versions, pinned, base_seq = await pipe.execute()
+        versions = versions or []
+        # Only compaction, which advances base_seq, moves versions out
+        if self.archive is None or not int(base_seq or 0):
+            return versions
+
+        # Versions before the list were archived or kept for a snapshot
+        older = await self.archive.version_ids(instrument_id)
+        older += [(int(seq), version_id) for version_id, seq in pinned.items()]
+        return [version_id for _, version_id in sorted(older)] + versions
+
+    @replica_read
+    async def get_version_history(
+        self, instrument_id, limit=50, cursor=None, start=None, end=None
+    ):
+        """Get one page of version summaries, newest first
+
+        ``cursor`` is the ``next_cursor`` returned by the previous page;
+        ``start`` and ``end`` optionally bound the version timestamps.
+        Returns a ``(summaries, next_cursor)`` tuple.
+        """
+        key = instrument_key(instrument_id, "history")
+        max_score = timestamp_score(end) if end else "+inf"
+        min_score = timestamp_score(start) if start else "-inf"
+        # Score and ID of the cursor, when items sharing its score may follow
+        ties = None
+        if cursor is not None:
+            # Cursors are the score and ID of the last item returned, as
+            # versions may share a timestamp
+            score, _, last_id = str(cursor).partition(":")
+            score = int(score)
+            if max_score == "+inf" or score <= max_score:
+                max_score = f"({score}"
+                if last_id and (min_score == "-inf" or score >= min_score):
+                    ties = (score, last_id)
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrevrangebyscore(
+                key, max_score, min_score, start=0, num=limit + 1, withscores=True
+            )
+            pipe.hget(instrument_key(instrument_id, "head"), "base_seq")
+            if ties is not None:
+                pipe.zrevrangebyscore(key, ties[0], ties[0], withscores=True)
+            entries, base_seq, *tied = await pipe.execute()
+        if ties is not None:
+            entries += [entry for entry in tied[0] if entry[0] < ties[1]]
+
+        summaries = {}
+        if entries:
+            loaded = await self.redis.hmget(
+                instrument_key(instrument_id, "history:summaries"),
+                [version_id for version_id, _ in entries],
+            )
+            for (version_id, _), summary in zip(entries, loaded):
+                if summary:
+                    summaries[version_id] = json.loads(summary)
+
+        if self.archive is not None and int(base_seq or 0):
+            # Archived versions interleave with the ones kept for snapshots
+            archived = await self.archive.history(
+                instrument_id,
+                _exclusive_max(max_score),
+                -(2**63) if min_score == "-inf" else min_score,
+                limit + 1,
+                ties,
+            )
+            for summary, score in archived:
+                summaries[summary["version_id"]] = summary
+                entries.append((summary["version_id"], score))
 
-    async def get_version(self, instrument_id, version_id):
-        """Get specific version data"""
-        version = await self.redis.json().get(
-            f"instrument:{instrument_id}:version:{version_id}"
+        # Newest first, and by descending ID among equal timestamps as in Redis
+        entries.sort(key=lambda entry: (entry[1], entry[0]), reverse=True)
+        entries = entries[: limit + 1]
+        page = entries[:limit]
+        if not page:
+            return [], None
+        next_cursor = (
+            f"{int(page[-1][1])}:{page[-1][0]}" if len(entries) > limit else None
         )
+        return [
+            summaries[version_id] for version_id, _ in page if version_id in summaries
+        ], next_cursor
+
+    @replica_read
+    async def get_version(self, instrument_id, version_id, paths=None, raw=False):
+        """Get specific version data, replaying patches from its keyframe
+
+        ``paths`` optionally projects the data onto definite JSONPaths.
+        Keyframes read only the projection; deltas are rebuilt in full first.
+        With ``raw``, keyframe data is returned unparsed as an
+        ``orjson.Fragment``. Versions no longer in Redis are read from the
+        archive. Raises RuntimeError when the delta chain stays broken.
+        """
+        for _ in range(CHAIN_READ_ATTEMPTS):
+            version = await self.redis.json().get(
+                instrument_key(instrument_id, "version", version_id)
+            )
+            if not version:
+                if not await self._has_archived(instrument_id):
+                    return None
+                version = await self.archive.get(instrument_id, version_id)
+                if version and paths:
+                    version["data"] = project(version["data"], paths)
+                return version
+            if "patch" not in version:
+                return await self._resolve_data(instrument_id, version, paths, raw)
+
+            # IDs of the keyframe and every delta up to, but excluding, this
+            # one; the list starts at the head's base_seq once compacted
+            keyframe_seq, seq = version["keyframe_seq"], version["seq"]
+            base_seq = int(
+                await self.redis.hget(instrument_key(instrument_id, "head"), "base_seq")
+                or 0
+            )
+            chain_ids = await self.redis.json().get(
+                instrument_key(instrument_id, "versions"),
+                f"$[{keyframe_seq - base_seq}:{seq - base_seq}]",
+            )
+            chain = []
+            if chain_ids:
+                chain = await self.redis.json().mget(
+                    [
+                        instrument_key(instrument_id, "version", vid)
+                        for vid in chain_ids
+                    ],
+                    ".",
+                )
+            # Compaction may have moved the list since the version was read
+            if _chain_intact(version, chain):
+                break
+        else:
+            raise RuntimeError(
+                f"Delta chain of version {version_id!r} of {instrument_id!r} is broken"
+            )
+
+        data = (await self._resolve_data(instrument_id, chain[0]))["data"]
+        for delta in chain[1:] + [version]:
+            data = apply_patch(data, delta["patch"])
+
+        del version["patch"]
+        version["data"] = project(data, paths) if paths else data
         return version
 
-    # --- Snapshot Operations ---
+    @replica_read
+    async def version_exists(self, instrument_id, version_id):
+        """Check whether a version exists without loading it"""
+        if await self.redis.exists(
+            instrument_key(instrument_id, "version", version_id)
+        ):
+            return True
+        return await self._has_archived(instrument_id) and await self.archive.contains(
+            instrument_id, version_id
+        )
 
-    async def create_snapshot(self, instrument_id, snapshot_name, description, user):
-        """Create a named snapshot of current configuration"""
-        # Get current config
-        config = await self.get_config(instrument_id)
+    @replica_read
+    async def get_version_ids_at(self, instrument_ids, at):
+        """Get the IDs of the versions in effect at a time, by instrument
 
-        # Get latest version ID
-        versions = await self.get_versions(instrument_id)
-        version_id = versions[-1] if versions else None
+        Each is the newest version with a timestamp at or before ``at``,
+        found in the history index with one pipelined lookup per instrument.
+        Instruments without a version by then are left out.
+        """
+        score = timestamp_score(at)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for instrument_id in instrument_ids:
+                pipe.zrevrangebyscore(
+                    instrument_key(instrument_id, "history"),
+                    score,
+                    "-inf",
+                    start=0,
+                    num=1,
+                    withscores=True,
+                )
+                pipe.hget(instrument_key(instrument_id, "head"), "base_seq")
+            results = await pipe.execute()
+        found = {
+            instrument_id: entries[0]
+            for instrument_id, entries in zip(instrument_ids, results[::2])
+            if entries
+        }
+        compacted = [
+            instrument_id
+            for instrument_id, base_seq in zip(instrument_ids, results[1::2])
+            if int(base_seq or 0)
+        ]
 
-        # Create snapshot
-        timestamp = datetime.utcnow().isoformat()
+        if self.archive is not None and compacted:
+            # Archived versions may be newer than ones kept for snapshots
+            archived = await self.archive.latest(compacted, score)
+            for instrument_id, (version_id, archived_score) in archived.items():
+                if archived_score > found.get(instrument_id, (None, float("-inf")))[1]:
+                    found[instrument_id] = (version_id, archived_score)
 
-        snapshot_data = {
-            "snapshot_name": snapshot_name,
-            "timestamp": timestamp,
-            "user": user,
-            "description": description,
-            "version_id": version_id,
-            "data": config,
+        return {
+            instrument_id: found[instrument_id][0]
+            for instrument_id in instrument_ids
+            if instrument_id in found
+        }
+
+    @replica_read
+    async def get_versions_at(self, instrument_ids, at):
+        """Get the versions in effect at a time for many instruments
+
+        Versions are rebuilt from a fixed number of batched reads however
+        many instruments there are; versions that were archived, or whose
+        delta chain moved during compaction, are read one by one. Returns a
+        dict of instrument ID to version, leaving out instruments without
+        a version by then. Raises RuntimeError as get_version does when a
+        delta chain stays broken.
+        """
+        version_ids = await self.get_version_ids_at(instrument_ids, at)
+        ids = list(version_ids)
+        if not ids:
+            return {}
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for instrument_id in ids:
+                pipe.hget(instrument_key(instrument_id, "head"), "base_seq")
+            # The versions are in the slots of their instruments on a cluster
+            documents, base_seqs = await asyncio.gather(
+                json_mget(
+                    self.redis,
+                    [
+                        instrument_key(
+                            instrument_id, "version", version_ids[instrument_id]
+                        )
+                        for instrument_id in ids
+                    ],
+                    ".",
+                ),
+                pipe.execute(),
+            )
+        versions = {}
+        deltas = []
+        for instrument_id, version, base_seq in zip(ids, documents, base_seqs):
+            if version and "patch" in version:
+                deltas.append((instrument_id, version, int(base_seq or 0)))
+            elif version:
+                versions[instrument_id] = version
+
+        # IDs of each delta's keyframe and preceding deltas, then the documents
+        chains = {}
+        if deltas:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for instrument_id, version, base_seq in deltas:
+                    pipe.json().get(
+                        instrument_key(instrument_id, "versions"),
+                        f"$[{version['keyframe_seq'] - base_seq}"
+                        f":{version['seq'] - base_seq}]",
+                    )
+                chain_ids = [members or [] for members in await pipe.execute()]
+            keys = [
+                instrument_key(instrument_id, "version", version_id)
+                for (instrument_id, _, _), members in zip(deltas, chain_ids)
+                for version_id in members
+            ]
+            loaded = iter(await json_mget(self.redis, keys, ".") if keys else [])
+            for (instrument_id, version, _), members in zip(deltas, chain_ids):
+                chain = [next(loaded) for _ in members]
+                if _chain_intact(version, chain):
+                    chains[instrument_id] = chain
+
+        # Payloads of every keyframe in one read
+        keyframes = dict(versions)
+        keyframes.update(
+            (instrument_id, chain[0]) for instrument_id, chain in chains.items()
+        )
+        refs = [
+            (instrument_id, keyframe["data_ref"])
+            for instrument_id, keyframe in keyframes.items()
+            if "data_ref" in keyframe
+        ]
+        payloads = dict(zip(refs, await load_blobs(self.redis, refs)))
+        for instrument_id, keyframe in keyframes.items():
+            ref = keyframe.pop("data_ref", None)
+            if ref is not None:
+                keyframe["data"] = payloads[(instrument_id, ref)]
+
+        for instrument_id, version, _ in deltas:
+            if instrument_id not in chains:
+                continue
+            chain = chains[instrument_id]
+            data = chain[0]["data"]
+            for delta in chain[1:] + [version]:
+                data = apply_patch(data, delta["patch"])
+            del version["patch"]
+            version["data"] = data
+            versions[instrument_id] = version
+
+        result = {}
+        for instrument_id in ids:
+            version = versions.get(instrument_id)
+            if version is None:
+                # Archived, or rebuilt on its own after a concurrent compaction
+                # with a bounded number of re-reads
+                version = await self.get_version(
+                    instrument_id, version_ids[instrument_id]
+                )
+            if version is not None:
+                result[instrument_id] = version
+        return result
+
+    # --- Diffs ---
+
+    @replica_read
+    async def resolve_ref(self, instrument_id, ref):
+        """Resolve a diff reference to a (kind, name) pair, or None
+
+        References are ``current``, ``version:{version_id}`` or
+        ``snapshot:{snapshot_name}``; bare ones are looked up as a version
+        ID first and then as a snapshot name.
+        """
+        if ref == "current":
+            return "current", None
+        kind, separator, name = ref.partition(":")
+        if separator and kind in ("version", "snapshot"):
+            candidates = [(kind, name)]
+        else:
+            candidates = [("version", ref), ("snapshot", ref)]
+
+        for kind, name in candidates:
+            if kind == "version":
+                found = await self.version_exists(instrument_id, name)
+            else:
+                found = await self.redis.exists(
+                    instrument_key(instrument_id, "snapshot", name)
+                )
+            if found:
+                return kind, name
+        return None
+
+    async def _ref_identity(self, instrument_id, ref):
+        """Identity of a resolved reference's content, or None if unknown
+
+        Versions never change, snapshots are identified by their payload
+        hash and the current config by its ETag, so equal identities mean
+        equal content.
+        """
+        kind, name = ref
+        if kind == "current":
+            return await self.get_config_etag(instrument_id)
+        if kind == "version":
+            return f"v-{name}"
+        data_ref = await self.redis.json().get(
+            instrument_key(instrument_id, "snapshot", name), "$.data_ref"
+        )
+        return split_ref(data_ref[0])[2] if data_ref else None
+
+    async def _ref_data(self, instrument_id, ref):
+        kind, name = ref
+        if kind == "current":
+            return await self.get_config(instrument_id)
+        if kind == "version":
+            document = await self.get_version(instrument_id, name)
+        else:
+            document = await self.get_snapshot(instrument_id, name)
+        return document["data"] if document else None
+
+    @replica_read
+    async def diff_refs(self, instrument_id, old_ref, new_ref):
+        """Get the changes turning one resolved reference's config into another's
+
+        Returns a dict of JSON Pointer path to operation with old and new
+        value, like a version's ``changes``, or None if either side no
+        longer exists. Diffs are cached by the identities of both sides.
+        """
+        refs = (old_ref, new_ref)
+        identities = [await self._ref_identity(instrument_id, ref) for ref in refs]
+        key = (instrument_id, *identities)
+        cacheable = self.diff_cache is not None and None not in identities
+        if cacheable:
+            changes = self.diff_cache.get(key)
+            if changes is not MISSING:
+                return changes
+        if identities[0] is not None and identities[0] == identities[1]:
+            return {}
+
+        old, new = await asyncio.gather(
+            *(self._ref_data(instrument_id, ref) for ref in refs)
+        )
+        if old is None or new is None:
+            return None
+        changes = to_changes(diff(old, new))
+
+        if cacheable and any(kind == "current" for kind, _ in refs):
+            # Only cache if the current config did not change while read
+            current = await self.get_config_etag(instrument_id)
+            cacheable = all(
+                identity == current
+                for (kind, _), identity in zip(refs, identities)
+                if kind == "current"
+            )
+        if cacheable:
+            self.diff_cache.set(key, changes)
+        return changes
+
+    # --- Version Retention ---
+
+    @replica_read
+    async def get_retention_overrides(self, instrument_id):
+        """Get the retention settings an instrument overrides"""
+        overrides = await self.redis.hgetall(instrument_key(instrument_id, "retention"))
+        return {
+            "keep_last": (
+                int(overrides["keep_last"]) if "keep_last" in overrides else None
+            ),
+            "max_age_days": (
+                float(overrides["max_age_days"])
+                if "max_age_days" in overrides
+                else None
+            ),
         }
 
-        # Save snapshot
-        await self.redis.json().set(
-            f"instrument:{instrument_id}:snapshot:{snapshot_name}", "$", snapshot_data
+    @replica_read
+    async def get_retention(self, instrument_id):
+        """Get the retention policy applying to an instrument"""
+        overrides = await self.get_retention_overrides(instrument_id)
+        return {
+            "keep_last": (
+                settings.RETENTION_KEEP_LAST
+                if overrides["keep_last"] is None
+                else overrides["keep_last"]
+            ),
+            "max_age_days": (
+                settings.RETENTION_MAX_AGE_DAYS
+                if overrides["max_age_days"] is None
+                else overrides["max_age_days"]
+            ),
+        }
+
+    @primary_write
+    async def set_retention(self, instrument_id, keep_last=None, max_age_days=None):
+        """Override the global retention settings; None restores a global value"""
+        key = instrument_key(instrument_id, "retention")
+        overrides = {
+            name: value
+            for name, value in (
+                ("keep_last", keep_last),
+                ("max_age_days", max_age_days),
+            )
+            if value is not None
+        }
+        async with self._transaction(instrument_id) as pipe:
+            pipe.delete(key)
+            if overrides:
+                pipe.hset(key, mapping=overrides)
+            await pipe.execute()
+        self.last_write = time.time()
+
+    @primary_write
+    async def compact_versions(self, instrument_id, batch_size=200, now=None):
+        """Move versions expired by the retention policy to the archive
+
+        A version is kept while it is among the newest ``keep_last`` or
+        younger than ``max_age_days``, and whenever a snapshot refers to it;
+        the current version is always kept. Expired versions are archived
+        with their full data and removed from Redis, oldest first. Versions
+        kept only for a snapshot stay in Redis as keyframes outside the
+        versions list. The oldest version left in the list is rewritten as
+        a keyframe so every remaining delta can still be rebuilt.
+
+        Returns the number of versions archived.
+        """
+        if self.archive is None:
+            raise RuntimeError("Version archive is not configured")
+        policy = await self.get_retention(instrument_id)
+        keep_last, max_age_days = policy["keep_last"], policy["max_age_days"]
+        if not keep_last and not max_age_days:
+            return 0
+        age_cutoff = None
+        if max_age_days:
+            age_cutoff = timestamp_score(
+                (now or datetime.utcnow()) - timedelta(days=max_age_days)
+            )
+
+        head_key = instrument_key(instrument_id, "head")
+        await self.codec.prepare(self.redis)
+        archived = 0
+        pipe = self._transaction(instrument_id)
+        async with self._transaction_slot(), pipe:
+            while True:
+                try:
+                    # Writers rewrite the head, so they abort this batch
+                    await pipe.watch(head_key)
+                    head = await pipe.hgetall(head_key)
+                    if "seq" not in head:
+                        break
+                    head_seq = int(head["seq"])
+                    keep_from = head_seq - keep_last + 1 if keep_last else head_seq
+
+                    pipe.multi()
+                    rows = await self._queue_compaction(
+                        pipe, instrument_id, head, keep_from, age_cutoff, batch_size
+                    )
+                    if rows is None:
+                        break
+
+                    # Archive first; rows of an aborted batch are rewritten
+                    await self.archive.store(instrument_id, rows)
+                    await pipe.execute()
+                    archived += len(rows)
+                except redis.WatchError:
+                    continue
+
+        await self.gc_blobs(instrument_id)
+        return archived
+
+    async def _queue_compaction(
+        self, pipe, instrument_id, head, keep_from, age_cutoff, batch_size
+    ):
+        """Queue the Redis side of compacting one batch of versions
+
+        Returns the rows to archive, or None when no version in the list
+        has expired.
+        """
+        prefix = instrument_key(instrument_id)
+        head_seq = int(head["seq"])
+        base_seq = int(head.get("base_seq", 0))
+        end = min(base_seq + batch_size, head_seq, keep_from)
+        if end <= base_seq:
+            return None
+
+        # One version past the batch, which may become the new base
+        version_ids = await self.redis.json().get(
+            f"{prefix}:versions", f"$[0:{end - base_seq + 1}]"
+        )
+        versions = await self.redis.json().mget(
+            [f"{prefix}:version:{version_id}" for version_id in version_ids], "."
         )
+        expired = 0
+        while expired < end - base_seq and (
+            age_cutoff is None
+            or timestamp_score(versions[expired]["timestamp"]) < age_cutoff
+        ):
+            expired += 1
+        if not expired:
+            return None
+        new_base = base_seq + expired
 
-        # Add to snapshots list
-        await self.redis.json().arrappend(
-            f"instrument:{instrument_id}:snapshots", "$", snapshot_name
+        snapshot_names = await self.get_snapshots(instrument_id)
+        pinned = set()
+        if snapshot_names:
+            referenced = await self.redis.json().mget(
+                [f"{prefix}:snapshot:{name}" for name in snapshot_names], ".version_id"
+            )
+            pinned = set(referenced)
+
+        payloads = [
+            version["data_ref"]
+            for version in versions[: expired + 1]
+            if "data_ref" in version
+        ]
+        blobs = dict(
+            zip(payloads, await load_payloads(self.redis, instrument_id, payloads))
         )
 
+        rows = []
+        archived_ids = []
+        data = None
+        for index, (version_id, version) in enumerate(
+            zip(version_ids[: expired + 1], versions)
+        ):
+            seq = base_seq + index
+            if "patch" in version:
+                data = apply_patch(data, version["patch"])
+            else:
+                data = (
+                    blobs[version["data_ref"]]
+                    if "data_ref" in version
+                    else version["data"]
+                )
+
+            keyframe = {
+                key: value
+                for key, value in version.items()
+                if key not in ("patch", "data_ref", "data")
+            }
+            keyframe.update(seq=seq, keyframe_seq=seq)
+
+            if index < expired and version_id not in pinned:
+                if "data_ref" in version:
+                    self._release_blob(pipe, instrument_id, version["data_ref"])
+                rows.append(
+                    (
+                        {**keyframe, "data": copy.deepcopy(data)},
+                        timestamp_score(version["timestamp"]),
+                        {
+                            "version_id": version_id,
+                            "timestamp": version["timestamp"],
+                            "user": version["user"],
+                            "comment": version["comment"],
+                            "change_count": len(version.get("changes") or {}),
+                        },
+                    )
+                )
+                archived_ids.append(version_id)
+                continue
+
+            if index < expired:
+                pipe.hset(f"{prefix}:pinned", version_id, seq)
+            if "patch" in version:
+                # Deltas left without their keyframe become keyframes
+                ref = self._store_blob(pipe, instrument_id, content_hash(data), data)
+                pipe.json().set(
+                    f"{prefix}:version:{version_id}",
+                    "$",
+                    {**keyframe, "data_ref": ref},
+                )
+
+        # Deltas after the new base still pointing at an older keyframe
+        for version_id in await self._deltas_after(instrument_id, new_base, base_seq):
+            pipe.json().set(
+                f"{prefix}:version:{version_id}", "$.keyframe_seq", new_base
+            )
+
+        if archived_ids:
+            pipe.delete(*[f"{prefix}:version:{vid}" for vid in archived_ids])
+            pipe.zrem(f"{prefix}:history", *archived_ids)
+            pipe.hdel(f"{prefix}:history:summaries", *archived_ids)
+        pipe.json().arrtrim(f"{prefix}:versions", "$", expired, head_seq - base_seq)
+        pipe.hset(
+            f"{prefix}:head",
+            mapping={
+                "base_seq": new_base,
+                "keyframe_seq": max(int(head["keyframe_seq"]), new_base),
+            },
+        )
+        return rows
+
+    async def _deltas_after(self, instrument_id, new_base, base_seq, batch_size=50):
+        """IDs of the deltas following new_base whose keyframe precedes it"""
+        found = []
+        start = new_base - base_seq + 1
+        while True:
+            version_ids = await self.redis.json().get(
+                instrument_key(instrument_id, "versions"),
+                f"$[{start}:{start + batch_size}]",
+            )
+            if not version_ids:
+                return found
+            keyframes = await self.redis.json().mget(
+                [
+                    instrument_key(instrument_id, "version", version_id)
+                    for version_id in version_ids
+                ],
+                ".keyframe_seq",
+            )
+            for version_id, keyframe_seq in zip(version_ids, keyframes):
+                if keyframe_seq is None or keyframe_seq >= new_base:
+                    return found
+                found.append(version_id)
+            start += batch_size
+
+    # --- Snapshot Operations ---
+
+    @primary_write
+    async def create_snapshot(self, instrument_id, snapshot_name, description, user):
+        """Create a named snapshot of current configuration
+
+        The configuration is stored once per distinct content; snapshots of
+        unchanged configs only add a reference and never transfer the data.
+        """
+        head_key = instrument_key(instrument_id, "head")
+        await self.codec.prepare(self.redis)
+
+        pipe = self._transaction(instrument_id)
+        async with self._transaction_slot(), pipe:
+            while True:
+                try:
+                    await pipe.watch(head_key)
+                    version_id, digest, payload_ref = await pipe.hmget(
+                        head_key, "version_id", "content_hash", "payload_ref"
+                    )
+
+                    config = None
+                    ref = digest
+                    if payload_ref and split_ref(payload_ref)[2] == digest:
+                        ref = payload_ref
+                    if ref:
+                        # Watch the payload too so a GC sweep can't remove it
+                        key = blob_key(instrument_id, ref)
+                        await pipe.watch(key)
+                        if not await pipe.exists(key):
+                            ref = None
+                    if not ref:
+                        # Get current config, bypassing the cache
+                        config = (
+                            await self.redis.json().get(
+                                instrument_key(instrument_id, "config")
+                            )
+                            or {}
+                        )
+                        ref = content_hash(config)
+
+                    # Create snapshot
+                    timestamp = datetime.utcnow().isoformat()
+
+                    snapshot_data = {
+                        "snapshot_name": snapshot_name,
+                        "timestamp": timestamp,
+                        "user": user,
+                        "description": description,
+                        "version_id": version_id,
+                    }
+
+                    pipe.multi()
+                    snapshot_data["data_ref"] = self._store_blob(
+                        pipe, instrument_id, ref, config
+                    )
+                    if config is not None and ref == digest:
+                        # Later snapshots of the same content reuse the payload
+                        pipe.hset(head_key, "payload_ref", snapshot_data["data_ref"])
+
+                    # Save snapshot
+                    pipe.json().set(
+                        instrument_key(instrument_id, "snapshot", snapshot_name),
+                        "$",
+                        snapshot_data,
+                    )
+
+                    # Add to snapshots list
+                    pipe.json().arrappend(
+                        instrument_key(instrument_id, "snapshots"), "$", snapshot_name
+                    )
+                    self._queue_event(
+                        pipe,
+                        "snapshot",
+                        instrument_id,
+                        snapshot_name=snapshot_name,
+                        version_id=version_id,
+                        timestamp=timestamp,
+                        user=user,
+                    )
+                    self._publish_invalidation(pipe, instrument_id)
+                    await pipe.execute()
+                    break
+                except redis.WatchError:
+                    continue
+        self._evict(instrument_id)
+
         return snapshot_name
 
+    @replica_read
     async def get_snapshots(self, instrument_id):
         """Get all snapshot names for an instrument"""
-        snapshots = await self.redis.json().get(f"instrument:{instrument_id}:snapshots")
+        snapshots = await self.redis.json().get(
+            instrument_key(instrument_id, "snapshots")
+        )
         return snapshots or []
 
-    async def get_snapshot(self, instrument_id, snapshot_name):
-        """Get specific snapshot data"""
+    @replica_read
+    async def get_snapshot(self, instrument_id, snapshot_name, paths=None, raw=False):
+        """Get specific snapshot data
+
+        ``paths`` optionally projects the data onto definite JSONPaths. With
+        ``raw``, the data is returned unparsed as an ``orjson.Fragment``.
+        """
         snapshot = await self.redis.json().get(
-            f"instrument:{instrument_id}:snapshot:{snapshot_name}"
+            instrument_key(instrument_id, "snapshot", snapshot_name)
         )
-        return snapshot
+        return await self._resolve_data(instrument_id, snapshot, paths, raw)
+
+    @replica_read
+    async def get_snapshot_etag(self, instrument_id, snapshot_name):
+        """Get an entity tag for a snapshot without loading its data
+
+        Snapshots never change once created, so their payload hash and
+        creation time identify them.
+        """
+        fields = await self.redis.json().get(
+            instrument_key(instrument_id, "snapshot", snapshot_name),
+            "$.data_ref",
+            "$.timestamp",
+        )
+        if not fields or not fields["$.data_ref"]:
+            return None
+        digest = split_ref(fields["$.data_ref"][0])[2]
+        return f"{digest}-{timestamp_score(fields['$.timestamp'][0])}"
+
+    # --- Payload Storage ---
+
+    @primary_write
+    async def gc_blobs(self, instrument_id):
+        """Delete an instrument's payloads that are no longer referenced
+
+        Returns the number of payloads removed.
+        """
+        refs_key = instrument_key(instrument_id, "blobrefs")
+        async with self._transaction(instrument_id) as pipe:
+            while True:
+                try:
+                    await pipe.watch(refs_key)
+                    refs = await pipe.hgetall(refs_key)
+                    unreferenced = [
+                        ref for ref, count in refs.items() if int(count) <= 0
+                    ]
+                    if not unreferenced:
+                        return 0
+
+                    pipe.multi()
+                    pipe.delete(*[blob_key(instrument_id, ref) for ref in unreferenced])
+                    pipe.hdel(refs_key, *unreferenced)
+                    await pipe.execute()
+                    return len(unreferenced)
+                except redis.WatchError:
+                    continue
@@ -1,9 +1,21 @@
 # backend/app/main.py
-from fastapi import FastAPI
+import asyncio
+import time
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import config, instruments, snapshots
+from fastapi.responses import JSONResponse
+from redis.exceptions import RedisError
+from app.api import config, events, instruments, snapshots, transfer
 from app.core.config import settings
-from app.db.redis_client import init_redis_pool
+from app.db.redis_client import init_redis_pool, init_replicas, pool_stats
+from app.db.migrations import run_migrations
+from app.services.archive import VersionArchive
+from app.services.cache import LRUCache, listen_for_invalidations
+from app.services.events import ChangeFeed
+from app.services.metrics import MetricsMiddleware, render, watch_pool
+from app.services.replicas import ReadYourWritesMiddleware
+from app.services.retention import run_retention
+from app.services.search import open_index
 
 app = FastAPI(
     title="Configuration Manager API",
@@ -20,22 +32,126 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+if settings.READ_YOUR_WRITES_SECONDS > 0:
+    app.add_middleware(ReadYourWritesMiddleware, window=settings.READ_YOUR_WRITES_SECONDS)
+
 # Include routers
 app.include_router(instruments.router, prefix="/api/instruments", tags=["instruments"])
 app.include_router(config.router, prefix="/api/configs", tags=["configs"])
 app.include_router(snapshots.router, prefix="/api/snapshots", tags=["snapshots"])
+app.include_router(transfer.router, prefix="/api/transfer", tags=["transfer"])
+app.include_router(events.router, prefix="/api/events", tags=["events"])
 
 
 @app.on_event("startup")
 async def startup_db_client():
-    app.state.redis = await init_redis_pool()
+    await start_services(await init_redis_pool(), await init_replicas())
+
+
+async def start_services(redis_client, replicas=None):
+    """Migrate the database and start the background tasks of this worker"""
+    app.state.redis = redis_client
+    app.state.replicas = replicas
+    watch_pool(lambda: pool_stats(redis_client))
+    await run_migrations(app.state.redis)
+
+    app.state.cache = None
+    app.state.cache_listener = None
+    app.state.diff_cache = None
+    if settings.DIFF_CACHE_MAX_ENTRIES > 0:
+        # Diffs are keyed by the content they compare, so never go stale
+        app.state.diff_cache = LRUCache(
+            max_entries=settings.DIFF_CACHE_MAX_ENTRIES, ttl=None
+        )
+    if settings.CACHE_ENABLED:
+        app.state.cache = LRUCache(
+            max_entries=settings.CACHE_MAX_ENTRIES, ttl=settings.CACHE_TTL_SECONDS
+        )
+        app.state.cache_listener = asyncio.create_task(
+            listen_for_invalidations(app.state.redis, app.state.cache)
+        )
+
+    # One stream reader per worker serves every change feed client; its
+    # blocking reads must return before the socket timeout cuts them
+    block_ms = 30000
+    if settings.REDIS_SOCKET_TIMEOUT:
+        block_ms = min(block_ms, int(settings.REDIS_SOCKET_TIMEOUT * 500))
+    app.state.feed = ChangeFeed(
+        app.state.redis, queue_size=settings.EVENTS_QUEUE_SIZE, block_ms=block_ms
+    )
+    app.state.feed_reader = asyncio.create_task(app.state.feed.run())
+
+    app.state.search = await open_index(redis_client)
+
+    app.state.archive = None
+    app.state.retention = None
+    if settings.ARCHIVE_PATH:
+        app.state.archive = VersionArchive(settings.ARCHIVE_PATH)
+        if settings.RETENTION_INTERVAL_SECONDS > 0:
+            app.state.retention = asyncio.create_task(
+                run_retention(
+                    app.state.redis,
+                    app.state.archive,
+                    settings.RETENTION_INTERVAL_SECONDS,
+                )
+            )
 
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if app.state.cache_listener is not None:
+        app.state.cache_listener.cancel()
+    app.state.feed_reader.cancel()
+    if app.state.retention is not None:
+        app.state.retention.cancel()
     await app.state.redis.close()
+    if app.state.replicas is not None:
+        await app.state.replicas.close()
 
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy"}
+    # Ping Redis, since the API is down without it
+    started = time.perf_counter()
+    try:
+        await app.state.redis.ping()
+    except (RedisError, OSError) as e:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "unhealthy",
+                "redis": {"status": "down", "error": str(e)},
+            },
+        )
+    latency_ms = (time.perf_counter() - started) * 1000
+    return {
+        "status": "healthy",
+        "redis": {"status": "up", "latency_ms": round(latency_ms, 3)},
+    }
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    diffs = app.state.diff_cache.stats() if app.state.diff_cache else None
+    if app.state.cache is None:
+        return {"enabled": False, "diffs": diffs}
+    return {"enabled": True, **app.state.cache.stats(), "diffs": diffs}
+
+
+@app.get("/api/redis/stats")
+async def redis_stats():
+    stats = pool_stats(app.state.redis)
+    if app.state.replicas is not None:
+        stats["replicas"] = app.state.replicas.stats(pool_stats)
+    return stats
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    if not settings.METRICS_ENABLED:
+        return Response(status_code=404)
+    content, content_type = render()
+    return Response(content=content, headers={"Content-Type": content_type})
@@ -1,6 +1,6 @@
 # backend/app/models/config.py
 from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Literal
 from datetime import datetime
 
 class ConfigBase(BaseModel):
@@ -10,6 +10,19 @@ class ConfigBase(BaseModel):
 class ConfigUpdate(ConfigBase):
     """Model for updating configuration"""
     comment: Optional[str] = Field("", description="Comment for this change")
+    base_version: Optional[str] = Field(None, description="Version ID or ETag the change was made against; the update fails with 409 if it is no longer current")
+
+class PatchOperation(BaseModel):
+    """Model for one operation of a partial configuration update"""
+    op: Literal["add", "remove", "replace", "set", "delete"]
+    path: str = Field(..., description="JSON Pointer for add/remove/replace, JSONPath for set/delete")
+    value: Any = Field(None, description="New value for add, replace and set")
+
+class ConfigPatch(BaseModel):
+    """Model for a partial configuration update"""
+    operations: List[PatchOperation] = Field(..., min_items=1)
+    comment: Optional[str] = Field("", description="Comment for this change")
+    base_version: Optional[str] = Field(None, description="Version ID or ETag the change was made against; the update fails with 409 if it is no longer current")
 
 class ConfigVersion(BaseModel):
     """Model for configuration version"""
@@ -24,6 +37,39 @@ class ConfigVersionResponse(BaseModel):
     """Response model for version list"""
     versions: List[ConfigVersion]
 
+class VersionSummary(BaseModel):
+    """Model for a version history entry without the configuration data"""
+    version_id: str
+    timestamp: datetime
+    user: str
+    comment: str
+    change_count: int
+
+class VersionHistoryPage(BaseModel):
+    """Response model for one page of version history, newest first"""
+    versions: List[VersionSummary]
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page")
+
+class ConfigDiff(BaseModel):
+    """Response model for the changes between two configurations"""
+    from_ref: str
+    to_ref: str
+    changes: Dict[str, Dict[str, Any]]
+    change_count: int
+
+class ConfigBatchRequest(BaseModel):
+    """Model for selecting instruments whose configs are fetched together"""
+    instrument_ids: Optional[List[str]] = Field(None, description="Instrument IDs; all instruments if omitted")
+    type: Optional[str] = Field(None, description="Only instruments of this type")
+    location: Optional[str] = Field(None, description="Only instruments at this location")
+    at: Optional[datetime] = Field(None, description="Return the configs in effect at this time instead of the current ones")
+
+class ConfigBatchResponse(BaseModel):
+    """Response model for a batch config fetch"""
+    configs: Dict[str, Dict[str, Any]]
+    missing: List[str] = Field([], description="Requested IDs that do not exist")
+    version_ids: Optional[Dict[str, str]] = Field(None, description="Version in effect per instrument, when at is given")
+
 # backend/app/models/snapshot.py
 from pydantic import BaseModel, Field
 from typing import Dict, Any, Optional, List
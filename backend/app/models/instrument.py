@@ -29,3 +29,30 @@ class InstrumentList(BaseModel):
     """Response model for instrument list"""
 
     instruments: List[Instrument]
+
+
+class InstrumentSearchPage(BaseModel):
+    """Response model for one page of search results"""
+
+    total: int = Field(..., description="Number of matching instruments")
+    offset: int
+    limit: int
+    instruments: List[Instrument]
+
+
+class RetentionPolicy(BaseModel):
+    """Model for version retention rules; null fields use the global settings"""
+
+    keep_last: Optional[int] = Field(
+        None, ge=0, description="Keep the newest N versions (0 disables the rule)"
+    )
+    max_age_days: Optional[float] = Field(
+        None, ge=0, description="Keep versions younger than this (0 disables the rule)"
+    )
+
+
+class RetentionSettings(BaseModel):
+    """Response model for the retention policy of an instrument"""
+
+    overrides: RetentionPolicy
+    effective: RetentionPolicy
@@ -0,0 +1,179 @@
+# backend/app/services/archive.py
+"""Compressed on-disk archive of versions expired from Redis
+
+Archived versions are stored self-contained, with their full data, as
+zlib-compressed JSON in a local SQLite database. SQLite calls run in a
+worker thread so they never block the event loop.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import zlib
+from contextlib import contextmanager
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    instrument_id TEXT NOT NULL,
+    version_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    document BLOB NOT NULL,
+    PRIMARY KEY (instrument_id, version_id)
+);
+CREATE INDEX IF NOT EXISTS versions_by_seq ON versions (instrument_id, seq);
+CREATE INDEX IF NOT EXISTS versions_by_score ON versions (instrument_id, score);
+"""
+
+
+class VersionArchive:
+    """SQLite file holding archived versions of every instrument"""
+
+    def __init__(self, path, compression_level=9):
+        self.path = path
+        self.compression_level = compression_level
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            # Readers in other workers never wait for the compacting writer
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Connection committing on success and always closed afterwards"""
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _store(self, instrument_id, rows):
+        with self._connect() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        instrument_id,
+                        version["version_id"],
+                        version["seq"],
+                        score,
+                        json.dumps(summary),
+                        zlib.compress(
+                            json.dumps(version, separators=(",", ":")).encode(),
+                            self.compression_level,
+                        ),
+                    )
+                    for version, score, summary in rows
+                ],
+            )
+
+    def _get(self, instrument_id, version_id):
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT document FROM versions WHERE instrument_id = ? AND version_id = ?",
+                (instrument_id, version_id),
+            ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def _contains(self, instrument_id, version_id):
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT 1 FROM versions WHERE instrument_id = ? AND version_id = ?",
+                (instrument_id, version_id),
+            ).fetchone()
+        return row is not None
+
+    def _documents(self, instrument_id, after_seq, limit):
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT document FROM versions WHERE instrument_id = ? AND seq > ?"
+                " ORDER BY seq LIMIT ?",
+                (instrument_id, after_seq, limit),
+            ).fetchall()
+        return [json.loads(zlib.decompress(row[0])) for row in rows]
+
+    def _version_ids(self, instrument_id):
+        with self._connect() as db:
+            return db.execute(
+                "SELECT seq, version_id FROM versions WHERE instrument_id = ? ORDER BY seq",
+                (instrument_id,),
+            ).fetchall()
+
+    def _history(self, instrument_id, max_score, min_score, limit, ties):
+        # With a cursor, rows sharing its score are paged by version ID
+        tie_score, last_id = ties or (None, None)
+        with self._connect() as db:
+            return db.execute(
+                "SELECT summary, score FROM versions"
+                " WHERE instrument_id = ? AND score >= ?"
+                " AND (score < ? OR (score = ? AND version_id < ?))"
+                " ORDER BY score DESC, version_id DESC LIMIT ?",
+                (instrument_id, min_score, max_score, tie_score, last_id, limit),
+            ).fetchall()
+
+    def _latest(self, instrument_ids, max_score):
+        latest = {}
+        with self._connect() as db:
+            # Stay below SQLite's limit on query parameters
+            for start in range(0, len(instrument_ids), 500):
+                chunk = instrument_ids[start : start + 500]
+                # SQLite takes the bare columns from the row holding MAX(score)
+                latest.update(
+                    (instrument_id, (version_id, score))
+                    for instrument_id, version_id, score in db.execute(
+                        "SELECT instrument_id, version_id, MAX(score) FROM versions"
+                        f" WHERE instrument_id IN ({', '.join('?' * len(chunk))})"
+                        " AND score <= ? GROUP BY instrument_id",
+                        (*chunk, max_score),
+                    )
+                )
+        return latest
+
+    def _delete_instrument(self, instrument_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM versions WHERE instrument_id = ?", (instrument_id,))
+
+    async def store(self, instrument_id, rows):
+        """Archive (version, score, summary) rows; versions must hold full data"""
+        await asyncio.to_thread(self._store, instrument_id, rows)
+
+    async def get(self, instrument_id, version_id):
+        """Get an archived version, or None"""
+        return await asyncio.to_thread(self._get, instrument_id, version_id)
+
+    async def contains(self, instrument_id, version_id):
+        """Whether a version is archived, without decompressing it"""
+        return await asyncio.to_thread(self._contains, instrument_id, version_id)
+
+    async def documents(self, instrument_id, after_seq=-1, limit=100):
+        """Get up to limit archived versions with seq > after_seq, oldest first"""
+        return await asyncio.to_thread(self._documents, instrument_id, after_seq, limit)
+
+    async def version_ids(self, instrument_id):
+        """Get (seq, version_id) pairs of archived versions, oldest first"""
+        return await asyncio.to_thread(self._version_ids, instrument_id)
+
+    async def history(self, instrument_id, max_score, min_score, limit, ties=None):
+        """Get (summary, score) pairs with min_score <= score < max_score, newest first
+
+        ``ties`` is an optional (score, version_id) pair that also admits the
+        versions with that score and a smaller ID, as a page cursor.
+        """
+        rows = await asyncio.to_thread(
+            self._history, instrument_id, max_score, min_score, limit, ties
+        )
+        return [(json.loads(summary), score) for summary, score in rows]
+
+    async def latest(self, instrument_ids, max_score):
+        """Get the newest archived (version_id, score) with score <= max_score,
+        by instrument ID; instruments without one are left out"""
+        return await asyncio.to_thread(self._latest, list(instrument_ids), max_score)
+
+    async def delete_instrument(self, instrument_id):
+        """Drop every archived version of an instrument"""
+        await asyncio.to_thread(self._delete_instrument, instrument_id)
@@ -0,0 +1,108 @@
+# backend/app/services/cache.py
+import asyncio
+import time
+from collections import OrderedDict
+
+# Pub/sub channel carrying the IDs of instruments whose cached data is stale
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Sentinel returned by LRUCache.get on a miss (None is a valid cached value)
+MISSING = object()
+
+
+class LRUCache:
+    """Bounded in-process LRU cache with a TTL ceiling
+
+    Keys are tuples whose first element is the instrument ID, so every entry
+    belonging to an instrument can be dropped at once. A ttl of None keeps
+    entries until they are evicted.
+    """
+
+    def __init__(self, max_entries=10000, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_instrument = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached value for key, or MISSING"""
+        entry = self._entries.get(key)
+        if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return MISSING
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries if full"""
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        self._by_instrument.setdefault(key[0], set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, instrument_id):
+        """Drop every entry belonging to an instrument"""
+        for key in self._by_instrument.pop(instrument_id, ()):
+            self._entries.pop(key, None)
+        self.invalidations += 1
+
+    def clear(self):
+        """Drop every entry"""
+        self._entries.clear()
+        self._by_instrument.clear()
+
+    def stats(self):
+        """Counters used to size the cache"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._by_instrument.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_instrument[key[0]]
+
+
+async def listen_for_invalidations(redis_client, cache):
+    """Drop cached entries as other workers publish instrument changes"""
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Messages may have been missed while (re)subscribing
+            cache.clear()
+            while True:
+                # Bounded waits: a blocking read would fail at the socket timeout
+                message = await pubsub.get_message(timeout=5.0)
+                if message and message["type"] == "message":
+                    cache.invalidate(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Cache invalidation listener failed, resubscribing: {e}")
+            cache.clear()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.close()
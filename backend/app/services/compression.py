@@ -0,0 +1,240 @@
+# backend/app/services/compression.py
+"""Compressed storage of large payloads
+
+Payloads are the content-addressed blobs referenced by ``data_ref``. By
+default they are RedisJSON documents stored under their plain SHA-256
+digest, so projections can be read server-side. With compression enabled,
+payloads whose JSON encoding reaches a threshold are stored as binary
+strings instead, and their reference names the encoding:
+``zlib:{digest}``, or ``zlib.{dictionary_id}:{digest}`` when a trained
+dictionary was used. Payloads written under earlier settings therefore
+stay readable.
+"""
+
+import collections
+import hashlib
+import re
+import zlib
+import orjson
+from redis.client import NEVER_DECODE
+from app.core.config import settings
+from app.db.keys import instrument_key, json_mget, read_by_slot
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for the zstd codec
+    zstandard = None
+
+CODECS = ("zlib", "zstd")
+DEFAULT_LEVELS = {"zlib": 6, "zstd": 3}
+
+# Trained dictionaries, stored once under their ID and never changed
+DICTIONARY_KEY = "compression:dictionary:{}"
+
+# Only the last 32 KiB of a zlib preset dictionary are used
+_ZLIB_WINDOW = 32768
+_JSON_KEY = re.compile(rb'"(?:[^"\\]|\\.)*":')
+
+# Dictionaries by ID; they are immutable, so cached for the process lifetime
+_dictionaries = {}
+
+
+def split_ref(ref):
+    """Split a payload reference into (codec, dictionary_id, digest)
+
+    The codec is None for payloads stored as RedisJSON.
+    """
+    scheme, _, digest = ref.rpartition(":")
+    codec, _, dictionary_id = scheme.partition(".")
+    return codec or None, dictionary_id or None, digest
+
+
+def blob_key(instrument_id, ref):
+    return instrument_key(instrument_id, "blob", ref)
+
+
+def dictionary_id(dictionary):
+    return hashlib.sha256(dictionary).hexdigest()[:16]
+
+
+def _require_zstd():
+    if zstandard is None:
+        raise RuntimeError("The zstd codec requires the zstandard package")
+
+
+def compress(payload, codec, level=None, dictionary=None):
+    level = level or DEFAULT_LEVELS[codec]
+    if codec == "zlib":
+        if dictionary is None:
+            return zlib.compress(payload, level)
+        compressor = zlib.compressobj(level, zdict=dictionary)
+        return compressor.compress(payload) + compressor.flush()
+    if codec == "zstd":
+        _require_zstd()
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdCompressor(level=level, dict_data=dict_data).compress(
+            payload
+        )
+    raise ValueError(f"Unknown compression codec: {codec!r}")
+
+
+def decompress(blob, codec, dictionary=None):
+    if codec == "zlib":
+        if dictionary is None:
+            return zlib.decompress(blob)
+        decompressor = zlib.decompressobj(zdict=dictionary)
+        return decompressor.decompress(blob) + decompressor.flush()
+    if codec == "zstd":
+        _require_zstd()
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(blob)
+    raise ValueError(f"Unknown compression codec: {codec!r}")
+
+
+def train_dictionary(samples, codec, size=_ZLIB_WINDOW):
+    """Build a dictionary from encoded sample payloads"""
+    if codec == "zstd":
+        _require_zstd()
+        return zstandard.train_dictionary(size, samples).as_bytes()
+    if codec != "zlib":
+        raise ValueError(f"Unknown compression codec: {codec!r}")
+
+    # zlib has no trainer: its preset dictionary is just content likely to
+    # recur. Object keys shared by most payloads make up the bulk of it,
+    # ordered so the most valuable ones end up last, closest to the data.
+    counts = collections.Counter()
+    for sample in samples:
+        counts.update(set(_JSON_KEY.findall(sample)))
+    common = [key for key, count in counts.items() if count > 1 or len(samples) == 1]
+    common.sort(key=lambda key: (counts[key] * len(key), key))
+    return b"".join(common)[-min(size, _ZLIB_WINDOW) :]
+
+
+async def store_dictionary(client, dictionary):
+    """Store a trained dictionary once; returns its ID"""
+    dict_id = dictionary_id(dictionary)
+    await client.set(DICTIONARY_KEY.format(dict_id), dictionary, nx=True)
+    _dictionaries[dict_id] = dictionary
+    return dict_id
+
+
+async def load_dictionary(client, dict_id):
+    if dict_id not in _dictionaries:
+        dictionary = await client.execute_command(
+            "GET", DICTIONARY_KEY.format(dict_id), **{NEVER_DECODE: True}
+        )
+        if dictionary is None:
+            raise LookupError(f"Compression dictionary {dict_id!r} not found")
+        _dictionaries[dict_id] = dictionary
+    return _dictionaries[dict_id]
+
+
+async def load_payloads(client, instrument_id, refs):
+    """Read payloads by reference, in order; missing ones are None"""
+    return await load_blobs(client, [(instrument_id, ref) for ref in refs])
+
+
+async def load_blobs(client, blobs):
+    """Read payloads of any instruments by (instrument_id, ref), in order"""
+    payloads = [None] * len(blobs)
+    plain = [index for index, (_, ref) in enumerate(blobs) if not split_ref(ref)[0]]
+    packed = [index for index, (_, ref) in enumerate(blobs) if split_ref(ref)[0]]
+
+    if plain:
+        loaded = await json_mget(
+            client, [blob_key(*blobs[index]) for index in plain], "."
+        )
+        for index, payload in zip(plain, loaded):
+            payloads[index] = payload
+    if packed:
+        loaded = await read_by_slot(
+            client,
+            [blob_key(*blobs[index]) for index in packed],
+            lambda keys: client.execute_command("MGET", *keys, **{NEVER_DECODE: True}),
+        )
+        for index, blob in zip(packed, loaded):
+            if blob is not None:
+                codec, dict_id, _ = split_ref(blobs[index][1])
+                dictionary = await load_dictionary(client, dict_id) if dict_id else None
+                payloads[index] = orjson.loads(decompress(blob, codec, dictionary))
+    return payloads
+
+
+async def load_payload_json(client, instrument_id, ref):
+    """Read a payload's JSON encoding without parsing it, or None
+
+    ``client`` must not parse RedisJSON replies, see ``raw_client``.
+    """
+    key = blob_key(instrument_id, ref)
+    codec, dict_id, _ = split_ref(ref)
+    if codec is None:
+        return await client.execute_command(
+            "JSON.GET", key, ".", **{NEVER_DECODE: True}
+        )
+    blob = await client.execute_command("GET", key, **{NEVER_DECODE: True})
+    if blob is None:
+        return None
+    dictionary = await load_dictionary(client, dict_id) if dict_id else None
+    return decompress(blob, codec, dictionary)
+
+
+class PayloadCodec:
+    """Decides how new payloads are stored"""
+
+    def __init__(self, codec="none", min_bytes=4096, level=None, dictionary_id=""):
+        if codec != "none" and codec not in CODECS:
+            raise ValueError(f"Unknown compression codec: {codec!r}")
+        if codec == "zstd":
+            _require_zstd()
+        self.codec = None if codec == "none" else codec
+        self.min_bytes = min_bytes
+        self.level = level
+        self.dictionary_id = dictionary_id or None
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            settings.STORAGE_COMPRESSION,
+            settings.COMPRESSION_MIN_BYTES,
+            settings.COMPRESSION_LEVEL,
+            settings.COMPRESSION_DICTIONARY,
+        )
+
+    async def prepare(self, client):
+        """Load the configured dictionary; call before encoding payloads"""
+        if self.codec and self.dictionary_id:
+            await load_dictionary(client, self.dictionary_id)
+
+    def encode(self, digest, data):
+        """Reference and stored value of a payload
+
+        The value is the data itself for RedisJSON, or compressed bytes.
+        """
+        if self.codec is None:
+            return digest, data
+        try:
+            payload = orjson.dumps(data)
+        except TypeError:
+            # orjson rejects integers wider than 64 bits
+            return digest, data
+        if len(payload) < self.min_bytes:
+            return digest, data
+
+        if self.dictionary_id:
+            dictionary = _dictionaries[self.dictionary_id]
+            scheme = f"{self.codec}.{self.dictionary_id}"
+        else:
+            dictionary = None
+            scheme = self.codec
+        return f"{scheme}:{digest}", compress(
+            payload, self.codec, self.level, dictionary
+        )
+
+    def queue_store(self, pipe, instrument_id, digest, data):
+        """Queue storing a payload unless already stored; returns its reference"""
+        ref, value = self.encode(digest, data)
+        if isinstance(value, bytes):
+            pipe.set(blob_key(instrument_id, ref), value, nx=True)
+        else:
+            pipe.json().set(blob_key(instrument_id, ref), "$", value, nx=True)
+        return ref
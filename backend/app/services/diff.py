@@ -0,0 +1,171 @@
+# backend/app/services/diff.py
+"""JSON Patch (RFC 6902) generation and application for config documents"""
+
+import json
+import orjson
+
+
+def escape_pointer(token):
+    """Escape a single JSON Pointer reference token"""
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def unescape_pointer(token):
+    """Unescape a single JSON Pointer reference token"""
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def split_pointer(path):
+    """Split a JSON Pointer into its unescaped reference tokens"""
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise ValueError(f"Invalid JSON Pointer: {path!r}")
+    return [unescape_pointer(token) for token in path[1:].split("/")]
+
+
+def canonical_json(value):
+    """Serialize value with sorted keys, so equal JSON gives equal bytes"""
+    try:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+    except TypeError:
+        # orjson rejects integers wider than 64 bits
+        return json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+
+
+def diff(old, new):
+    """Return the path-addressed operations turning old into new
+
+    Each operation is a JSON Patch add/remove/replace operation that also
+    carries the previous value as ``old`` for remove and replace. Values of
+    different types differ, so 1, 1.0 and true are kept apart.
+    """
+    ops = []
+    _diff(old, new, "", ops)
+    return ops
+
+
+def _same(old, new):
+    """Whether two containers are equal JSON, keeping 1, 1.0 and true apart
+
+    ``==`` runs in C but equates those, so equality is confirmed by the
+    serializations, which tell them apart. Each unchanged subtree is thus
+    serialized once, by the first container found equal.
+    """
+    if old != new:
+        return False
+    try:
+        return orjson.dumps(old) == orjson.dumps(new)
+    except TypeError:
+        # Integers wider than 64 bits; compare element by element instead
+        return False
+
+
+def _diff(old, new, path, ops):
+    if type(old) is not type(new):
+        ops.append({"op": "replace", "path": path, "old": old, "value": new})
+        return
+    if isinstance(old, (dict, list)) and _same(old, new):
+        return
+
+    # Equal scalars of the same type are skipped before building their path
+    if isinstance(old, dict):
+        for key, old_value in old.items():
+            if key not in new:
+                ops.append(
+                    {
+                        "op": "remove",
+                        "path": f"{path}/{escape_pointer(key)}",
+                        "old": old_value,
+                    }
+                )
+                continue
+            new_value = new[key]
+            if (
+                type(old_value) is not type(new_value)
+                or isinstance(old_value, (dict, list))
+                or old_value != new_value
+            ):
+                _diff(old_value, new_value, f"{path}/{escape_pointer(key)}", ops)
+        for key, new_value in new.items():
+            if key not in old:
+                ops.append(
+                    {
+                        "op": "add",
+                        "path": f"{path}/{escape_pointer(key)}",
+                        "value": new_value,
+                    }
+                )
+        return
+
+    if isinstance(old, list):
+        common = min(len(old), len(new))
+        for index in range(common):
+            old_value, new_value = old[index], new[index]
+            if (
+                type(old_value) is not type(new_value)
+                or isinstance(old_value, (dict, list))
+                or old_value != new_value
+            ):
+                _diff(old_value, new_value, f"{path}/{index}", ops)
+        # Remove from the end so earlier indexes stay valid
+        for index in range(len(old) - 1, common - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{index}", "old": old[index]})
+        for index in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/{index}", "value": new[index]})
+        return
+
+    if old != new:
+        ops.append({"op": "replace", "path": path, "old": old, "value": new})
+
+
+def to_patch(ops):
+    """Strip previous values, leaving plain RFC 6902 operations"""
+    return [{key: value for key, value in op.items() if key != "old"} for op in ops]
+
+
+def to_changes(ops):
+    """Map each changed path to its operation with old and new values"""
+    return {
+        op["path"]: {"op": op["op"], "old": op.get("old"), "new": op.get("value")}
+        for op in ops
+    }
+
+
+def make_patch(old, new):
+    """Return the list of add/remove/replace operations turning old into new"""
+    return to_patch(diff(old, new))
+
+
+def apply_patch(doc, patch):
+    """Apply add/remove/replace operations to doc in place and return it"""
+    for op in patch:
+        tokens = split_pointer(op["path"])
+        if not tokens:
+            # Operations on the root replace the whole document
+            doc = op.get("value")
+            continue
+
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+
+        last = tokens[-1]
+        if isinstance(parent, list):
+            index = len(parent) if last == "-" else int(last)
+            if op["op"] == "add":
+                parent.insert(index, op["value"])
+            elif op["op"] == "remove":
+                del parent[index]
+            elif op["op"] == "replace":
+                parent[index] = op["value"]
+            else:
+                raise ValueError(f"Unsupported patch operation: {op['op']!r}")
+        else:
+            if op["op"] in ("add", "replace"):
+                parent[last] = op["value"]
+            elif op["op"] == "remove":
+                del parent[last]
+            else:
+                raise ValueError(f"Unsupported patch operation: {op['op']!r}")
+    return doc
@@ -0,0 +1,147 @@
+# backend/app/services/events.py
+"""Change feed of configuration updates and snapshots
+
+Writers append one compact event per committed change to a single Redis
+Stream. Every worker tails the stream with one blocking XREAD and fans the
+events out to its subscribers, so idle clients cost Redis nothing beyond
+that read.
+"""
+
+import asyncio
+
+# Stream holding the most recent change events of every instrument
+EVENTS_STREAM = "events:changes"
+
+# Fields stored as integers in the stream
+_INT_FIELDS = ("seq", "change_count")
+
+
+def stream_id(value):
+    """Sortable form of a stream entry ID such as ``1700000000000-0``"""
+    milliseconds, _, sequence = value.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def decode_event(entry_id, fields):
+    """Build an event dict from a stream entry"""
+    event = {"id": entry_id, **fields}
+    for name in _INT_FIELDS:
+        if name in event:
+            event[name] = int(event[name])
+    return event
+
+
+class Subscription:
+    """Bounded queue of events for one client of a worker"""
+
+    def __init__(self, instrument_id, queue_size):
+        self.instrument_id = instrument_id
+        self.queue = asyncio.Queue(queue_size)
+        # Set once the queue overflowed; the client then reads the stream
+        self.lagged = False
+
+    def wants(self, event):
+        return self.instrument_id is None or self.instrument_id == event["instrument_id"]
+
+
+class ChangeFeed:
+    """Tails the change stream and fans events out to subscriptions"""
+
+    def __init__(self, redis_client, queue_size=1000, block_ms=30000):
+        self.redis = redis_client
+        self.queue_size = queue_size
+        self.block_ms = block_ms
+        self._subscriptions = set()
+
+    def subscribe(self, instrument_id=None):
+        """Receive events of one instrument, or of all if instrument_id is None"""
+        subscription = Subscription(instrument_id, self.queue_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions.discard(subscription)
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscriptions),
+            "queued": sum(sub.queue.qsize() for sub in self._subscriptions),
+        }
+
+    def _dispatch(self, event):
+        for subscription in list(self._subscriptions):
+            if not subscription.wants(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Never let a slow client hold up the others or grow memory;
+                # it catches up from the stream once it drained its queue
+                subscription.lagged = True
+                self._subscriptions.discard(subscription)
+
+    async def run(self):
+        """Read new stream entries and dispatch them until cancelled"""
+        last_id = "$"
+        while True:
+            try:
+                result = await self.redis.xread(
+                    {EVENTS_STREAM: last_id}, count=500, block=self.block_ms
+                )
+                for _, entries in result or []:
+                    for entry_id, fields in entries:
+                        last_id = entry_id
+                        self._dispatch(decode_event(entry_id, fields))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Change feed read failed, retrying: {e}")
+                await asyncio.sleep(1)
+
+    async def read_after(self, last_id, instrument_id=None, batch_size=500):
+        """Yield the retained events after last_id, oldest first"""
+        while True:
+            entries = await self.redis.xrange(
+                EVENTS_STREAM, min=f"({last_id}", max="+", count=batch_size
+            )
+            for entry_id, fields in entries:
+                last_id = entry_id
+                event = decode_event(entry_id, fields)
+                if instrument_id is None or event["instrument_id"] == instrument_id:
+                    yield event
+            if len(entries) < batch_size:
+                return
+
+    async def events(self, instrument_id=None, last_id=None, keepalive=15.0):
+        """Yield events after last_id, then live ones as they are committed
+
+        Yields None after ``keepalive`` seconds without events, so callers
+        can keep idle connections open.
+        """
+        # Subscribe before reading the backlog so nothing falls in between
+        subscription = self.subscribe(instrument_id)
+        try:
+            if last_id is not None:
+                async for event in self.read_after(last_id, instrument_id):
+                    last_id = event["id"]
+                    yield event
+
+            while True:
+                if subscription.lagged and subscription.queue.empty():
+                    subscription = self.subscribe(instrument_id)
+                    async for event in self.read_after(last_id, instrument_id):
+                        last_id = event["id"]
+                        yield event
+
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                # Skip events already sent while catching up
+                if last_id is not None and stream_id(event["id"]) <= stream_id(last_id):
+                    continue
+                last_id = event["id"]
+                yield event
+        finally:
+            self.unsubscribe(subscription)
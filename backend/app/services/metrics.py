@@ -0,0 +1,215 @@
+# backend/app/services/metrics.py
+"""Prometheus metrics and optional OpenTelemetry tracing
+
+Requests are measured by ``MetricsMiddleware``, RedisService calls by the
+``instrument_methods`` class decorator and Redis commands by the client in
+``app.db.redis_client``. Metrics are kept per worker process.
+"""
+
+import contextlib
+import functools
+import inspect
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram
+from prometheus_client import generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from app.core.config import settings
+
+try:
+    from opentelemetry import trace
+except ImportError:  # optional, only needed for tracing
+    trace = None
+
+# Redis commands mostly take well under a millisecond
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+FAST_BUCKETS += (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, float("inf"))
+SIZE_BUCKETS = tuple(float(4**exponent) for exponent in range(4, 14))
+SIZE_BUCKETS += (float("inf"),)
+
+REQUEST_SECONDS = Histogram(
+    "configer_http_request_duration_seconds",
+    "Time to serve an HTTP request, until the response is complete",
+    ["method", "route", "status"],
+)
+REQUEST_BYTES = Histogram(
+    "configer_http_request_size_bytes",
+    "Size of HTTP request bodies",
+    ["method", "route"],
+    buckets=SIZE_BUCKETS,
+)
+RESPONSE_BYTES = Histogram(
+    "configer_http_response_size_bytes",
+    "Size of HTTP response bodies",
+    ["method", "route"],
+    buckets=SIZE_BUCKETS,
+)
+SERVICE_SECONDS = Histogram(
+    "configer_service_call_duration_seconds",
+    "Time spent in RedisService methods",
+    ["method"],
+    buckets=FAST_BUCKETS,
+)
+SERVICE_ERRORS = Counter(
+    "configer_service_call_errors_total",
+    "RedisService calls that raised, by exception type",
+    ["method", "error"],
+)
+COMMAND_SECONDS = Histogram(
+    "configer_redis_command_duration_seconds",
+    "Redis command round trips, including retries; pipelines and transactions "
+    "are measured as a whole under PIPELINE and MULTI",
+    ["command"],
+    buckets=FAST_BUCKETS,
+)
+COMMAND_ERRORS = Counter(
+    "configer_redis_command_errors_total",
+    "Redis commands that failed, by exception type",
+    ["command", "error"],
+)
+
+
+class PoolCollector:
+    """Connection pool gauges, read from the pool when scraped"""
+
+    def __init__(self):
+        self.stats = None
+
+    def collect(self):
+        stats = self.stats() if self.stats else {}
+        if not stats.get("monitored"):
+            return
+        for name, help_text in (
+            ("max_connections", "Connections the pool may open"),
+            ("created", "Connections currently open"),
+            ("in_use", "Connections handed out"),
+            ("idle", "Open connections waiting to be used"),
+            ("peak_in_use", "Most connections handed out at once"),
+        ):
+            yield GaugeMetricFamily(
+                f"configer_redis_pool_{name}", help_text, value=stats[name]
+            )
+        yield CounterMetricFamily(
+            "configer_redis_pool_acquire_errors",
+            "Requests that found no free connection in time",
+            value=stats["acquire_errors"],
+        )
+        yield CounterMetricFamily(
+            "configer_redis_pool_acquire_seconds",
+            "Time spent waiting for a free connection",
+            value=stats["acquire_seconds"],
+        )
+
+
+POOL = PoolCollector()
+REGISTRY.register(POOL)
+
+
+def watch_pool(stats):
+    """Report the pool whose utilization stats() returns"""
+    POOL.stats = stats
+
+
+def render():
+    """Current metrics in the Prometheus text format, and its content type"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def _span(name, **attributes):
+    if trace is None or not settings.TRACING_ENABLED:
+        return contextlib.nullcontext()
+    return trace.get_tracer(__name__).start_as_current_span(name, attributes=attributes)
+
+
+@contextlib.contextmanager
+def observe(seconds, errors, span_name, **labels):
+    """Time the block into histogram seconds and count exceptions in errors"""
+    started = time.perf_counter()
+    with _span(span_name, **labels):
+        try:
+            yield
+        except Exception as e:
+            errors.labels(**labels, error=type(e).__name__).inc()
+            raise
+        finally:
+            seconds.labels(**labels).observe(time.perf_counter() - started)
+
+
+def observe_command(command):
+    return observe(COMMAND_SECONDS, COMMAND_ERRORS, f"redis {command}", command=command)
+
+
+def instrument_methods(cls):
+    """Class decorator measuring every public coroutine method"""
+    if not settings.METRICS_ENABLED:
+        return cls
+    for name, function in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.iscoroutinefunction(function):
+            continue
+
+        def wrap(function, name=name):
+            @functools.wraps(function)
+            async def measured(*args, **kwargs):
+                with observe(
+                    SERVICE_SECONDS,
+                    SERVICE_ERRORS,
+                    f"{cls.__name__}.{name}",
+                    method=name,
+                ):
+                    return await function(*args, **kwargs)
+
+            return measured
+
+        setattr(cls, name, wrap(function))
+    return cls
+
+
+class MetricsMiddleware:
+    """ASGI middleware measuring the latency and body sizes of HTTP requests
+
+    Requests are labelled with their route's path template, so instrument
+    IDs do not multiply the series; unknown paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        request_bytes = 0
+        response_bytes = 0
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        started = time.perf_counter()
+        with _span(method, method=method, path=scope["path"]) as span:
+            try:
+                await self.app(scope, counting_receive, counting_send)
+            finally:
+                # The router stores the matched route in the scope
+                route = getattr(scope.get("route"), "path", "unmatched")
+                if span is not None:
+                    span.update_name(f"{method} {route}")
+                    span.set_attribute("status", status)
+                REQUEST_SECONDS.labels(method, route, str(status)).observe(
+                    time.perf_counter() - started
+                )
+                REQUEST_BYTES.labels(method, route).observe(request_bytes)
+                RESPONSE_BYTES.labels(method, route).observe(response_bytes)
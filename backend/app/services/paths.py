@@ -0,0 +1,87 @@
+# backend/app/services/paths.py
+"""Conversion between JSON Pointers, definite JSONPaths and RedisJSON paths
+
+Paths are handled as lists of tokens: ``str`` tokens address object
+members and ``int`` tokens address array elements.
+"""
+
+import json
+import re
+from app.services.diff import escape_pointer
+
+_SEGMENT = re.compile(
+    r"""\.([A-Za-z_][\w-]*)|\[(0|[1-9]\d*)\]|\[('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")\]"""
+)
+_ARRAY_INDEX = re.compile(r"0|[1-9]\d*")
+
+
+def parse_jsonpath(path):
+    """Split a definite JSONPath such as ``$.a['b'][0]`` into tokens
+
+    Wildcards, slices, filters and recursive descent are rejected, since
+    they may address more than one value.
+    """
+    if not path.startswith("$"):
+        raise ValueError(f"JSONPath must start with '$': {path!r}")
+
+    tokens = []
+    position = 1
+    while position < len(path):
+        match = _SEGMENT.match(path, position)
+        if not match:
+            raise ValueError(f"Unsupported JSONPath: {path!r}")
+        name, index, quoted = match.groups()
+        if name is not None:
+            tokens.append(name)
+        elif index is not None:
+            tokens.append(int(index))
+        else:
+            tokens.append(re.sub(r"\\(.)", r"\1", quoted[1:-1]))
+        position = match.end()
+    return tokens
+
+
+def is_array_index(token):
+    """Whether a JSON Pointer token can address an array element"""
+    return _ARRAY_INDEX.fullmatch(token) is not None
+
+
+def to_redis_path(tokens):
+    """Build the RedisJSON path addressing tokens"""
+    return "$" + "".join(
+        f"[{token}]"
+        if isinstance(token, int)
+        else f"[{json.dumps(token, ensure_ascii=False)}]"
+        for token in tokens
+    )
+
+
+def to_pointer(tokens):
+    """Build the JSON Pointer addressing tokens"""
+    return "".join(f"/{escape_pointer(token)}" for token in tokens)
+
+
+def select(document, tokens):
+    """Values addressed by tokens, as a list of none or one like RedisJSON"""
+    value = document
+    for token in tokens:
+        if isinstance(token, int) and isinstance(value, list) and token < len(value):
+            value = value[token]
+        elif isinstance(token, str) and isinstance(value, dict) and token in value:
+            value = value[token]
+        else:
+            return []
+    return [value]
+
+
+def project(document, paths):
+    """Select definite JSONPaths from a document, keyed by path
+
+    Paths that do not exist in the document are left out.
+    """
+    projection = {}
+    for path in paths:
+        matches = select(document, parse_jsonpath(path))
+        if matches:
+            projection[path] = matches[0]
+    return projection
@@ -0,0 +1,102 @@
+# backend/app/services/replicas.py
+"""Read replicas and read-your-writes routing
+
+RedisService sends reads to the replicas of a ReplicaSet, in turn, and
+writes to the primary. A replica that fails is skipped for a while and
+its reads are retried on the primary. With read-your-writes enabled, a
+client that wrote gets a short-lived cookie, and its reads go to the
+primary until the cookie expires, whichever worker serves them.
+"""
+
+import math
+import time
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+# Cookie holding the time of a client's last write
+WRITE_COOKIE = "configer_last_write"
+
+
+class ReplicaSet:
+    """Replica clients used round-robin, skipping ones that recently failed"""
+
+    def __init__(self, clients, retry_seconds=5.0):
+        self.clients = list(clients)
+        self.retry_seconds = retry_seconds
+        self._turn = 0
+        self._down_until = [0.0] * len(self.clients)
+        self.fallbacks = 0
+
+    def choose(self):
+        """Next replica to read from, or None if all of them are down"""
+        now = time.monotonic()
+        for _ in range(len(self.clients)):
+            index = self._turn
+            self._turn = (self._turn + 1) % len(self.clients)
+            if self._down_until[index] <= now:
+                return self.clients[index]
+        return None
+
+    def mark_down(self, client):
+        """Skip a replica that failed for the next retry_seconds"""
+        index = self.clients.index(client)
+        self._down_until[index] = time.monotonic() + self.retry_seconds
+        self.fallbacks += 1
+
+    def stats(self, pool_stats):
+        now = time.monotonic()
+        return {
+            "fallbacks": self.fallbacks,
+            "replicas": [
+                {"up": self._down_until[index] <= now, **pool_stats(client)}
+                for index, client in enumerate(self.clients)
+            ],
+        }
+
+    async def close(self):
+        for client in self.clients:
+            await client.close()
+
+
+def wrote_recently(cookie, window):
+    """Whether a write cookie's time lies within the last window seconds"""
+    try:
+        return time.time() - float(cookie) < window
+    except (TypeError, ValueError):
+        return False
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware pinning a client's reads to the primary after it wrote
+
+    It sets ``read_primary`` in the request state for get_redis_service,
+    which leaves the request's RedisService there in turn; if that service
+    wrote, the response sets the write cookie.
+    """
+
+    def __init__(self, app, window):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+        cookie = HTTPConnection(scope).cookies.get(WRITE_COOKIE)
+        state["read_primary"] = wrote_recently(cookie, self.window)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                service = state.get("redis_service")
+                if service is not None and service.last_write is not None:
+                    MutableHeaders(scope=message).append(
+                        "set-cookie",
+                        f"{WRITE_COOKIE}={service.last_write:.3f}; "
+                        f"Max-Age={math.ceil(self.window)}; Path=/; HttpOnly; "
+                        "SameSite=Lax",
+                    )
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,45 @@
+# backend/app/services/retention.py
+"""Periodic compaction of version history into the archive"""
+
+import asyncio
+from redis.exceptions import LockError
+from app.db.keys import scan_instrument_ids
+from app.db.redis_client import RedisService
+
+# Lock held by the single worker compacting at a time
+RETENTION_LOCK = "retention:lock"
+
+
+async def compact_all(service, batch_size=200):
+    """Apply the retention policies of every instrument
+
+    Returns the number of versions archived.
+    """
+    archived = 0
+    async for instrument_id in scan_instrument_ids(service.redis):
+        archived += await service.compact_versions(instrument_id, batch_size)
+    return archived
+
+
+async def run_retention(redis_client, archive, interval):
+    """Compact every interval seconds, skipping runs another worker holds"""
+    service = RedisService(redis_client, archive=archive)
+    while True:
+        try:
+            lock = redis_client.lock(RETENTION_LOCK, timeout=max(interval, 300))
+            if await lock.acquire(blocking=False):
+                try:
+                    archived = await compact_all(service)
+                    if archived:
+                        print(f"Archived {archived} expired versions")
+                finally:
+                    try:
+                        await lock.release()
+                    except LockError:
+                        # The lock expired during a long run
+                        pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Version retention failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,373 @@
+# backend/app/services/search.py
+"""RediSearch index over instrument metadata and selected config values
+
+Every instrument has a search document, a hash at ``search:instrument:{id}``
+holding its metadata and the values of the configured config paths. Writes
+update it in the same transaction as the data it mirrors, and a RediSearch
+index over these hashes answers filtered, sorted and paginated queries
+without reading any instrument.
+"""
+
+import hashlib
+import json
+import math
+import re
+from datetime import datetime, timezone
+import redis.asyncio as redis
+from redis.commands.search.field import NumericField, TagField, TextField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+from app.core.config import settings
+from app.db.keys import hash_tag, hash_tagged, instrument_key, scan_instrument_ids
+from app.services.paths import parse_jsonpath, select, to_pointer
+
+DOCUMENT_PREFIX = "search:instrument:"
+INDEX_PREFIX = "idx:instruments"
+# Tag values are matched whole, so they are split at a character that
+# metadata and config strings do not contain
+TAG_SEPARATOR = "\x1f"
+METADATA_FIELDS = ("name", "type", "location", "last_updated")
+# Sortable metadata and the attribute of each
+SORT_ATTRIBUTES = {
+    "id": "instrument_id",
+    "name": "name",
+    "type": "type",
+    "location": "location",
+    "last_updated": "last_updated_at",
+}
+# Comparisons of config values, two-character operators first
+OPERATORS = ("==", "!=", ">=", "<=", ">", "<")
+_RANGES = {
+    ">=": "[{} +inf]",
+    ">": "[({} +inf]",
+    "<=": "[-inf {}]",
+    "<": "[-inf ({}]",
+}
+
+
+def document_key(instrument_id):
+    # Hash-tagged like the instrument's keys, to share their slot
+    return f"{DOCUMENT_PREFIX}{hash_tag(instrument_id)}"
+
+
+def _instrument_id(key):
+    tag = key[len(DOCUMENT_PREFIX) :]
+    return tag[1:-1] if hash_tagged() else tag
+
+
+def _escape(value):
+    """Escape punctuation and spaces for a RediSearch query"""
+    return re.sub(r"\W", lambda match: "\\" + match.group(), value)
+
+
+def _tag(name, **kwargs):
+    return TagField(
+        name, separator=TAG_SEPARATOR, case_sensitive=True, sortable=True, **kwargs
+    )
+
+
+def _epoch_seconds(value):
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - datetime(1970, 1, 1)).total_seconds()
+
+
+class ConfigField:
+    """A config value to index, stored in the document under ``key``"""
+
+    def __init__(self, path, kind, attribute):
+        if kind not in ("numeric", "tag"):
+            raise ValueError(f"Search fields are numeric or tag, not {kind!r}")
+        self.path = path
+        self.kind = kind
+        self.tokens = parse_jsonpath(path)
+        self.pointer = to_pointer(self.tokens)
+        self.key = f"config:{path}"
+        # Query attribute, since paths are not valid attribute names
+        self.attribute = attribute
+
+    def value(self, config):
+        """Indexed form of the field's value in config, or None"""
+        matches = select(config, self.tokens)
+        if not matches or isinstance(matches[0], (dict, list)) or matches[0] is None:
+            return None
+        value = matches[0]
+        if self.kind == "tag":
+            return value if isinstance(value, str) else json.dumps(value)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        return value
+
+    def clause(self, operator, value):
+        if self.kind == "tag":
+            if operator not in ("==", "!="):
+                raise ValueError(f"{self.path} is a tag and only supports == and !=")
+            clause = f"@{self.attribute}:{{{_escape(value)}}}"
+        else:
+            try:
+                number = float(value)
+            except ValueError:
+                raise ValueError(f"{self.path} expects a number, not {value!r}")
+            if not math.isfinite(number):
+                raise ValueError(f"{self.path} expects a finite number, not {value!r}")
+            bounds = _RANGES.get(operator, "[{0} {0}]").format(repr(number))
+            clause = f"@{self.attribute}:{bounds}"
+        return f"-{clause}" if operator == "!=" else clause
+
+
+class SearchIndex:
+    """Schema, maintenance and queries of the instrument search index
+
+    The index name includes a digest of the schema, so changing the indexed
+    config paths builds a new index alongside the old one.
+    """
+
+    def __init__(self, config_fields=()):
+        self.config_fields = [
+            ConfigField(path, kind, f"c{index}")
+            for index, (path, kind) in enumerate(config_fields)
+        ]
+        schema = [(field.path, field.kind) for field in self.config_fields]
+        digest = hashlib.sha256(json.dumps(schema).encode()).hexdigest()[:12]
+        self.name = f"{INDEX_PREFIX}:{digest}"
+
+    @classmethod
+    def from_settings(cls):
+        fields = []
+        for entry in settings.SEARCH_CONFIG_FIELDS.split(","):
+            if entry.strip():
+                path, _, kind = entry.strip().rpartition(":")
+                fields.append((path.strip(), kind.strip().lower()))
+        return cls(fields)
+
+    def fields(self):
+        fields = [
+            _tag("instrument_id"),
+            TextField("name", sortable=True),
+            _tag("type"),
+            _tag("location"),
+            NumericField("last_updated_at", sortable=True),
+        ]
+        for field in self.config_fields:
+            if field.kind == "tag":
+                fields.append(_tag(field.key, as_name=field.attribute))
+            else:
+                fields.append(
+                    NumericField(field.key, sortable=True, as_name=field.attribute)
+                )
+        return fields
+
+    def touches(self, ops):
+        """Whether patch operations may change an indexed config value"""
+        for op in ops:
+            path = op["path"]
+            if op["op"] in ("add", "remove"):
+                # Inserting or removing elements shifts the ones after them
+                path = path.rsplit("/", 1)[0]
+            for field in self.config_fields:
+                if (
+                    field.pointer == path
+                    or field.pointer.startswith(path + "/")
+                    or path.startswith(field.pointer + "/")
+                ):
+                    return True
+        return False
+
+    def queue_update(
+        self, pipe, instrument_id, metadata=None, config=None, last_updated=None
+    ):
+        """Queue updating the parts of a search document that are given
+
+        ``metadata`` replaces the metadata fields, ``config`` the indexed
+        config values and ``last_updated`` just the update time.
+        """
+        values = {}
+        if metadata is not None:
+            values["instrument_id"] = instrument_id
+            for name in METADATA_FIELDS:
+                values[name] = metadata.get(name)
+        if last_updated is not None:
+            values["last_updated"] = last_updated
+        if "last_updated" in values:
+            values["last_updated_at"] = (
+                _epoch_seconds(values["last_updated"])
+                if values["last_updated"]
+                else None
+            )
+        if config is not None:
+            for field in self.config_fields:
+                values[field.key] = field.value(config)
+
+        key = document_key(instrument_id)
+        present = {name: value for name, value in values.items() if value is not None}
+        if present:
+            pipe.hset(key, mapping=present)
+        missing = [name for name, value in values.items() if value is None]
+        if missing:
+            pipe.hdel(key, *missing)
+
+    async def ensure(self, client):
+        """Create the index unless it exists, dropping those of other schemas
+
+        Returns whether the index was created. Dropping an index keeps the
+        documents, which every index shares.
+        """
+        names = [
+            name.decode() if isinstance(name, bytes) else name
+            for name in await client.execute_command("FT._LIST")
+        ]
+        for name in names:
+            if name.startswith(f"{INDEX_PREFIX}:") and name != self.name:
+                await client.execute_command("FT.DROPINDEX", name)
+        if self.name in names:
+            return False
+        try:
+            await client.ft(self.name).create_index(
+                self.fields(),
+                # Index every word of names, which are short
+                stopwords=[],
+                definition=IndexDefinition(
+                    prefix=[DOCUMENT_PREFIX], index_type=IndexType.HASH
+                ),
+            )
+        except redis.ResponseError as e:
+            # Another worker created it first
+            if "already exists" in str(e).lower():
+                return False
+            raise
+        return True
+
+    async def rebuild(self, client, batch_size=100):
+        """Rewrite the search document of every instrument"""
+        batch = []
+        async for instrument_id in scan_instrument_ids(client, count=batch_size):
+            batch.append(instrument_id)
+            if len(batch) >= batch_size:
+                await self._rebuild(client, batch)
+                batch = []
+        if batch:
+            await self._rebuild(client, batch)
+
+    async def _rebuild(self, client, instrument_ids):
+        async with client.pipeline(transaction=False) as pipe:
+            for instrument_id in instrument_ids:
+                pipe.json().get(instrument_key(instrument_id, "meta"))
+                if self.config_fields:
+                    pipe.json().get(instrument_key(instrument_id, "config"))
+            results = await pipe.execute()
+
+        step = 2 if self.config_fields else 1
+        async with client.pipeline(transaction=False) as pipe:
+            for index, instrument_id in enumerate(instrument_ids):
+                metadata, *config = results[index * step : index * step + step]
+                if metadata is None:
+                    continue
+                self.queue_update(
+                    pipe,
+                    instrument_id,
+                    metadata=metadata,
+                    config=(config[0] or {}) if config else None,
+                )
+            await pipe.execute()
+
+    def parse_condition(self, condition):
+        """Split ``$.path<op>value`` into an indexed field, operator and value"""
+        for field in sorted(
+            self.config_fields, key=lambda field: len(field.path), reverse=True
+        ):
+            if not condition.startswith(field.path):
+                continue
+            rest = condition[len(field.path) :].lstrip()
+            for operator in OPERATORS:
+                if rest.startswith(operator):
+                    return field, operator, rest[len(operator) :].strip()
+        raise ValueError(
+            f"Conditions compare an indexed config path with one of "
+            f"{', '.join(OPERATORS)}: {condition!r}"
+        )
+
+    def query_string(self, types=None, locations=None, name=None, conditions=()):
+        """RediSearch query matching every given filter"""
+        clauses = []
+        for attribute, values in (("type", types), ("location", locations)):
+            if values:
+                tags = " | ".join(_escape(value) for value in values)
+                clauses.append(f"@{attribute}:{{{tags}}}")
+        words = re.findall(r"\w+", name or "")
+        if words:
+            clauses.append(f"@name:({' '.join(words)})")
+        for condition in conditions:
+            field, operator, value = self.parse_condition(condition)
+            clauses.append(field.clause(operator, value))
+        return " ".join(clauses) or "*"
+
+    def sort_attribute(self, sort_by):
+        if sort_by in SORT_ATTRIBUTES:
+            return SORT_ATTRIBUTES[sort_by]
+        for field in self.config_fields:
+            if field.path == sort_by:
+                return field.attribute
+        raise ValueError(
+            f"Sort by one of {', '.join(SORT_ATTRIBUTES)} or an indexed config path"
+        )
+
+    async def search(
+        self,
+        client,
+        types=None,
+        locations=None,
+        name=None,
+        conditions=(),
+        sort_by=None,
+        descending=False,
+        offset=0,
+        limit=50,
+    ):
+        """Total number of matching instruments and one page of them
+
+        Instruments are metadata dicts with their ``id``. Raises ValueError
+        for conditions or sort fields the index cannot serve.
+        """
+        query = Query(self.query_string(types, locations, name, conditions))
+        query.return_fields(*METADATA_FIELDS).no_stopwords()
+        query.paging(offset, limit).dialect(2)
+        if sort_by:
+            query.sort_by(self.sort_attribute(sort_by), asc=not descending)
+        result = await client.ft(self.name).search(query)
+        instruments = [
+            {
+                "id": _instrument_id(document.id),
+                **{name: getattr(document, name, None) for name in METADATA_FIELDS},
+            }
+            for document in result.docs
+        ]
+        return result.total, instruments
+
+
+async def prepare_index(client, index):
+    """Create the search index and fill it if it is new
+
+    Returns False if the server has no RediSearch module.
+    """
+    try:
+        created = await index.ensure(client)
+    except redis.ResponseError as e:
+        print(f"Instrument search unavailable: {e}")
+        return False
+    if created:
+        await index.rebuild(client)
+    return True
+
+
+async def open_index(client):
+    """The configured search index, prepared for use
+
+    None if SEARCH_ENABLED is false or the server has no RediSearch module;
+    writes then skip the search documents, which prepare_index rebuilds
+    once it creates the index.
+    """
+    if not settings.SEARCH_ENABLED:
+        return None
+    index = SearchIndex.from_settings()
+    return index if await prepare_index(client, index) else None
@@ -0,0 +1,360 @@
+# backend/app/services/transfer.py
+"""Streaming NDJSON export and import of instruments and their history
+
+Every line is one JSON record. Records of an instrument always appear in
+this order: ``instrument``, ``config``, its ``version`` records oldest
+first, then its ``snapshot`` records.
+"""
+
+import json
+from app.db.keys import instrument_ids_key, instrument_key, scan_instrument_ids
+from app.db.redis_client import content_hash, timestamp_score
+from app.services.cache import INVALIDATION_CHANNEL
+from app.services.compression import PayloadCodec, blob_key, load_payloads
+
+
+async def export_records(client, batch_size=100, archive=None):
+    """Yield every instrument, config, version and snapshot as a record
+
+    Versions compacted out of Redis are read from ``archive``, if given;
+    without it they are left out. Compaction rewrites the oldest version
+    left in Redis as a keyframe, so the rest can still be rebuilt; raises
+    RuntimeError when a delta's keyframe is missing all the same.
+    """
+    async for instrument_id in scan_instrument_ids(client, count=batch_size):
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.json().get(instrument_key(instrument_id, "meta"))
+            pipe.json().get(instrument_key(instrument_id, "config"))
+            pipe.json().get(instrument_key(instrument_id, "versions"))
+            pipe.json().get(instrument_key(instrument_id, "snapshots"))
+            meta, config, version_ids, snapshot_names = await pipe.execute()
+        if meta is None:
+            continue
+
+        yield {"kind": "instrument", "id": instrument_id, "meta": meta}
+        yield {"kind": "config", "instrument_id": instrument_id, "data": config or {}}
+
+        exported = set()
+        async for version in _older_versions(
+            client, archive, instrument_id, batch_size
+        ):
+            exported.add(version.get("seq"))
+            yield {
+                "kind": "version",
+                "instrument_id": instrument_id,
+                "version": version,
+            }
+
+        # Versions are exported as stored so delta chains stay intact
+        for start in range(0, len(version_ids or []), batch_size):
+            async with client.pipeline(transaction=False) as pipe:
+                for version_id in version_ids[start : start + batch_size]:
+                    pipe.json().get(
+                        instrument_key(instrument_id, "version", version_id)
+                    )
+                versions = await _resolve_payloads(
+                    client, instrument_id, await pipe.execute()
+                )
+            for version in versions:
+                if not version:
+                    continue
+                if "patch" in version and version["keyframe_seq"] not in exported:
+                    raise RuntimeError(
+                        f"Keyframe of version {version['version_id']!r}"
+                        f" of {instrument_id!r} is missing"
+                    )
+                exported.add(version.get("seq"))
+                yield {
+                    "kind": "version",
+                    "instrument_id": instrument_id,
+                    "version": version,
+                }
+
+        for start in range(0, len(snapshot_names or []), batch_size):
+            async with client.pipeline(transaction=False) as pipe:
+                for name in snapshot_names[start : start + batch_size]:
+                    pipe.json().get(instrument_key(instrument_id, "snapshot", name))
+                snapshots = await _resolve_payloads(
+                    client, instrument_id, await pipe.execute()
+                )
+            for snapshot in snapshots:
+                if snapshot:
+                    yield {
+                        "kind": "snapshot",
+                        "instrument_id": instrument_id,
+                        "snapshot": snapshot,
+                    }
+
+
+async def _older_versions(client, archive, instrument_id, batch_size):
+    """Yield archived versions and those kept for snapshots, oldest first
+
+    These precede the versions list and all hold full data.
+    """
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.hgetall(instrument_key(instrument_id, "pinned"))
+        pipe.hget(instrument_key(instrument_id, "head"), "base_seq")
+        pinned, base_seq = await pipe.execute()
+    if not int(base_seq or 0):
+        # Only compaction, which advances base_seq, archives versions
+        archive = None
+    kept = []
+    if pinned:
+        ordered = sorted(pinned, key=lambda version_id: int(pinned[version_id]))
+        async with client.pipeline(transaction=False) as pipe:
+            for version_id in ordered:
+                pipe.json().get(instrument_key(instrument_id, "version", version_id))
+            documents = await _resolve_payloads(
+                client, instrument_id, await pipe.execute()
+            )
+        for version_id, version in zip(ordered, documents):
+            if version:
+                version.setdefault("seq", int(pinned[version_id]))
+                kept.append(version)
+
+    after_seq = -1
+    while archive is not None:
+        archived = await archive.documents(instrument_id, after_seq, batch_size)
+        for version in archived:
+            while kept and kept[0]["seq"] < version["seq"]:
+                yield kept.pop(0)
+            yield version
+        if len(archived) < batch_size:
+            break
+        after_seq = archived[-1]["seq"]
+    for version in kept:
+        yield version
+
+
+async def _resolve_payloads(client, instrument_id, documents):
+    """Inline the content-addressed payloads referenced by documents"""
+    referencing = [doc for doc in documents if doc and "data_ref" in doc]
+    if referencing:
+        payloads = await load_payloads(
+            client, instrument_id, [doc["data_ref"] for doc in referencing]
+        )
+        for doc, payload in zip(referencing, payloads):
+            del doc["data_ref"]
+            doc["data"] = payload
+    return documents
+
+
+async def export_ndjson(client, batch_size=100, archive=None):
+    """Yield the export as encoded NDJSON lines"""
+    async for record in export_records(client, batch_size, archive):
+        yield (json.dumps(record, separators=(",", ":")) + "\n").encode()
+
+
+async def iter_lines(chunks):
+    """Split an async iterable of byte chunks into lines"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+class _Importer:
+    """Writes records with batched, pipelined commands"""
+
+    def __init__(self, client, batch_size, archive=None, search=None):
+        self.client = client
+        self.batch_size = batch_size
+        self.archive = archive
+        self.pipe = client.pipeline(transaction=False)
+        # Payloads are stored as configured for new writes
+        self.codec = PayloadCodec.from_settings()
+        self.search = search
+        self.queued = 0
+        self.counts = {"instrument": 0, "config": 0, "version": 0, "snapshot": 0}
+        # Sequence number of the next version of each imported instrument
+        self.next_seq = {}
+        # Exported sequence numbers of each instrument's versions mapped to
+        # their new ones, renumbered from 0 as archived versions may be left
+        # out of an export
+        self.seqs = {}
+
+    async def add(self, record):
+        kind = record.get("kind")
+        if kind not in self.counts:
+            raise ValueError(f"Unknown record kind: {kind!r}")
+
+        if kind == "instrument":
+            if self.archive is not None:
+                await self.archive.delete_instrument(record["id"])
+            if record["id"] in self.next_seq:
+                # Its earlier records must be stored to be found and replaced
+                await self.flush()
+            stale = await self._stored_keys(record["id"])
+            self._add_instrument(record["id"], record["meta"], stale)
+        else:
+            instrument_id = record["instrument_id"]
+            if instrument_id not in self.next_seq:
+                raise ValueError(
+                    f"{kind} record for {instrument_id!r} precedes its instrument record"
+                )
+            if kind == "config":
+                self.pipe.json().set(
+                    instrument_key(instrument_id, "config"), "$", record["data"]
+                )
+                self.pipe.hset(
+                    instrument_key(instrument_id, "head"),
+                    "content_hash",
+                    content_hash(record["data"]),
+                )
+                if self.search is not None:
+                    self.search.queue_update(
+                        self.pipe, instrument_id, config=record["data"]
+                    )
+            elif kind == "version":
+                self._add_version(instrument_id, record["version"])
+            else:
+                self._add_snapshot(instrument_id, record["snapshot"])
+
+        self.counts[kind] += 1
+        self.queued += 1
+        if self.queued >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if self.queued:
+            await self.pipe.execute()
+            self.queued = 0
+
+    async def _stored_keys(self, instrument_id):
+        """Keys of the versions, snapshots and payloads stored for an instrument"""
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.json().get(instrument_key(instrument_id, "versions"))
+            pipe.hkeys(instrument_key(instrument_id, "pinned"))
+            pipe.json().get(instrument_key(instrument_id, "snapshots"))
+            pipe.hkeys(instrument_key(instrument_id, "blobrefs"))
+            version_ids, pinned, snapshot_names, refs = await pipe.execute()
+        return [
+            *(
+                instrument_key(instrument_id, "version", version_id)
+                for version_id in [*(version_ids or []), *pinned]
+            ),
+            *(
+                instrument_key(instrument_id, "snapshot", name)
+                for name in snapshot_names or []
+            ),
+            *(blob_key(instrument_id, ref) for ref in refs),
+        ]
+
+    def _add_instrument(self, instrument_id, meta, stale=()):
+        # Importing an instrument replaces whatever was stored under its ID,
+        # so its versions, snapshots and payloads are deleted with it
+        self.next_seq[instrument_id] = 0
+        self.seqs[instrument_id] = {}
+        self.pipe.json().set(instrument_key(instrument_id, "meta"), "$", meta)
+        self.pipe.sadd(instrument_ids_key(instrument_id), instrument_id)
+        self.pipe.json().set(instrument_key(instrument_id, "config"), "$", {})
+        self.pipe.json().set(instrument_key(instrument_id, "versions"), "$", [])
+        self.pipe.json().set(instrument_key(instrument_id, "snapshots"), "$", [])
+        if self.search is not None:
+            self.search.queue_update(self.pipe, instrument_id, meta, config={})
+        self.pipe.delete(
+            instrument_key(instrument_id, "head"),
+            instrument_key(instrument_id, "history"),
+            instrument_key(instrument_id, "history:summaries"),
+            instrument_key(instrument_id, "blobrefs"),
+            instrument_key(instrument_id, "pinned"),
+            *stale,
+        )
+        self.pipe.publish(INVALIDATION_CHANNEL, instrument_id)
+
+    def _store_payload(self, instrument_id, document):
+        """Store a document's data once under its content hash"""
+        if "data" in document:
+            data = document.pop("data")
+            ref = self.codec.queue_store(
+                self.pipe, instrument_id, content_hash(data), data
+            )
+            self.pipe.hincrby(instrument_key(instrument_id, "blobrefs"), ref, 1)
+            document["data_ref"] = ref
+
+    def _add_version(self, instrument_id, version):
+        version_id = version["version_id"]
+        seq = self.next_seq[instrument_id]
+        # Keyframes, and legacy versions without a keyframe_seq, hold full data
+        keyframe_seq = seq
+        if "patch" in version:
+            # Deltas must follow their keyframe and every delta before it
+            keyframe_seq = self.seqs[instrument_id].get(version["keyframe_seq"])
+            if (
+                keyframe_seq is None
+                or seq - keyframe_seq != version["seq"] - version["keyframe_seq"]
+            ):
+                raise ValueError(
+                    f"Version {version_id!r} of {instrument_id!r} is a delta"
+                    " without the versions it applies to"
+                )
+        self.next_seq[instrument_id] = seq + 1
+        if "seq" in version:
+            self.seqs[instrument_id][version["seq"]] = seq
+            version.update(seq=seq, keyframe_seq=keyframe_seq)
+
+        self._store_payload(instrument_id, version)
+        self.pipe.json().set(
+            instrument_key(instrument_id, "version", version_id), "$", version
+        )
+        self.pipe.json().arrappend(
+            instrument_key(instrument_id, "versions"), "$", version_id
+        )
+        self.pipe.hset(
+            instrument_key(instrument_id, "head"),
+            mapping={
+                "version_id": version_id,
+                "seq": seq,
+                "keyframe_seq": keyframe_seq,
+            },
+        )
+        self.pipe.zadd(
+            instrument_key(instrument_id, "history"),
+            {version_id: timestamp_score(version["timestamp"])},
+        )
+        self.pipe.hset(
+            instrument_key(instrument_id, "history:summaries"),
+            version_id,
+            json.dumps(
+                {
+                    "version_id": version_id,
+                    "timestamp": version["timestamp"],
+                    "user": version["user"],
+                    "comment": version["comment"],
+                    "change_count": len(version.get("changes") or {}),
+                }
+            ),
+        )
+
+    def _add_snapshot(self, instrument_id, snapshot):
+        name = snapshot["snapshot_name"]
+        self._store_payload(instrument_id, snapshot)
+        self.pipe.json().set(
+            instrument_key(instrument_id, "snapshot", name), "$", snapshot
+        )
+        self.pipe.json().arrappend(
+            instrument_key(instrument_id, "snapshots"), "$", name
+        )
+
+
+async def import_ndjson(client, lines, batch_size=500, archive=None, search=None):
+    """Import NDJSON lines from an async iterable; returns counts per kind
+
+    Archived versions of imported instruments are dropped from ``archive``,
+    and the documents of the SearchIndex ``search``, if given, are written.
+    """
+    importer = _Importer(client, batch_size, archive, search)
+    await importer.codec.prepare(client)
+    try:
+        async for line in lines:
+            line = line.strip()
+            if line:
+                await importer.add(json.loads(line))
+        await importer.flush()
+    finally:
+        await importer.pipe.reset()
+    return importer.counts
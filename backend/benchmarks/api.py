@@ -0,0 +1,324 @@
+# backend/benchmarks/api.py
+"""Throughput and latency of every API endpoint
+
+The app runs in-process behind httpx's ASGI transport, so results cover
+routing, validation, serialization and Redis but no HTTP server. Run from
+the backend directory against the redis-stack configured through the
+usual REDIS_* settings, or an in-process fakeredis server with --fake
+(needs httpx, and fakeredis for --fake):
+
+    python -m benchmarks.api --instruments 20 --config-keys 5000 --output api.json
+
+Seeded instruments are deleted afterwards. Compare two result files with
+``python -m benchmarks.compare``.
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+from datetime import datetime
+from app.core.config import settings
+from app.services.transfer import export_records
+from benchmarks.common import (
+    Dataset,
+    add_dataset_arguments,
+    change_leaf,
+    connect,
+    measure,
+    write_results,
+)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+async def replay_events(feed, instrument_id, count):
+    """Read an instrument's change events from the start, as SSE clients do"""
+    from app.api.events import server_sent_events
+
+    received = 0
+    async for chunk in server_sent_events(feed, instrument_id, "0-0"):
+        if chunk.startswith(b"id:"):
+            received += 1
+            if received >= count:
+                break
+    return received >= count
+
+
+async def scenarios(client, data, app_state, args):
+    """(name, request count, call) of every benchmark, reads before writes"""
+    rng = data.rng
+    n = args.requests
+    rare = max(1, n // 50)
+
+    def instrument(index):
+        return data.instrument(index)
+
+    def version(index):
+        return rng.choice(data.version_ids[instrument(index)])
+
+    def snapshot(index):
+        names = data.snapshot_names[instrument(index)]
+        return names[index % len(names)] if names else "missing"
+
+    async def get(path, expect=200, **kwargs):
+        response = await client.get(path, **kwargs)
+        return response.status_code == expect
+
+    async def send(method, path, expect=200, **kwargs):
+        response = await client.request(method, path, **kwargs)
+        return response.status_code == expect
+
+    # Bodies are prepared up front so only the requests are timed
+    updates = []
+    configs = dict(data.configs)
+    for index in range(n):
+        instrument_id = instrument(index)
+        configs[instrument_id], _ = change_leaf(configs[instrument_id], rng)
+        updates.append({"data": configs[instrument_id], "comment": "bench"})
+    first_section = {
+        instrument_id: next(iter(config.items()))
+        for instrument_id, config in data.configs.items()
+    }
+
+    def patch_body(index):
+        section, leaves = first_section[instrument(index)]
+        key = next(iter(leaves))
+        return {
+            "operations": [
+                {"op": "replace", "path": f"/{section}/{key}", "value": index}
+            ],
+            "comment": "bench",
+        }
+
+    # The first instrument exported on its own, to import it again
+    lines = []
+    async for record in export_records(app_state.redis):
+        if data.instrument(0) in (record.get("id"), record.get("instrument_id")):
+            lines.append(json.dumps(record, separators=(",", ":")))
+    ndjson = ("\n".join(lines) + "\n").encode()
+
+    seeded_at = datetime.utcnow().isoformat()
+    etags = {}
+
+    async def conditional_get(index):
+        instrument_id = instrument(index)
+        if instrument_id not in etags:
+            response = await client.get(f"/api/configs/{instrument_id}")
+            etags[instrument_id] = response.headers["etag"]
+        return await get(
+            f"/api/configs/{instrument_id}",
+            expect=304,
+            headers={"If-None-Match": etags[instrument_id]},
+        )
+
+    bases = {}
+
+    async def conditional_patch(index):
+        # Each write's version is the base of the next one; concurrent
+        # writers to an instrument lose the race with 412
+        instrument_id = instrument(index)
+        if instrument_id not in bases:
+            response = await client.get(f"/api/configs/{instrument_id}")
+            bases[instrument_id] = response.headers["etag"]
+        body = patch_body(index)
+        body["operations"][0]["value"] = -index
+        response = await client.patch(
+            f"/api/configs/{instrument_id}",
+            json=body,
+            headers={"If-Match": bases[instrument_id]},
+        )
+        if response.status_code == 200:
+            bases[instrument_id] = response.json()["version_id"]
+        return response.status_code in (200, 412)
+
+    return [
+        ("GET /api/health", n, lambda i: get("/api/health")),
+        ("GET /api/cache/stats", n, lambda i: get("/api/cache/stats")),
+        ("GET /api/redis/stats", n, lambda i: get("/api/redis/stats")),
+        ("GET /api/instruments/", n, lambda i: get("/api/instruments/")),
+        (
+            "GET /api/instruments/search",
+            n,
+            lambda i: get(
+                "/api/instruments/search",
+                # Servers without RediSearch answer 503
+                expect=200 if app_state.search is not None else 503,
+                params={"type": "bench", "sort": "name", "limit": 20},
+            ),
+        ),
+        (
+            "GET /api/instruments/{id}",
+            n,
+            lambda i: get(f"/api/instruments/{instrument(i)}"),
+        ),
+        (
+            "GET /api/instruments/{id}/retention",
+            n,
+            lambda i: get(f"/api/instruments/{instrument(i)}/retention"),
+        ),
+        ("GET /api/configs/{id}", n, lambda i: get(f"/api/configs/{instrument(i)}")),
+        ("GET /api/configs/{id} (If-None-Match)", n, conditional_get),
+        (
+            "GET /api/configs/{id}?path=",
+            n,
+            lambda i: get(
+                f"/api/configs/{instrument(i)}",
+                params={"path": f"$.{first_section[instrument(i)][0]}"},
+            ),
+        ),
+        (
+            "POST /api/configs/batch",
+            n,
+            lambda i: send(
+                "POST",
+                "/api/configs/batch",
+                json={"instrument_ids": data.instrument_ids},
+            ),
+        ),
+        (
+            "GET /api/configs/{id}/versions",
+            n,
+            lambda i: get(f"/api/configs/{instrument(i)}/versions"),
+        ),
+        (
+            "GET /api/configs/{id}/history",
+            n,
+            lambda i: get(f"/api/configs/{instrument(i)}/history"),
+        ),
+        (
+            "GET /api/configs/{id}/versions/{version_id}",
+            n,
+            lambda i: get(f"/api/configs/{instrument(i)}/versions/{version(i)}"),
+        ),
+        (
+            "GET /api/configs/{id}/as-of",
+            n,
+            lambda i: get(
+                f"/api/configs/{instrument(i)}/as-of", params={"at": seeded_at}
+            ),
+        ),
+        (
+            "POST /api/configs/batch (at)",
+            n,
+            lambda i: send(
+                "POST",
+                "/api/configs/batch",
+                json={"instrument_ids": data.instrument_ids, "at": seeded_at},
+            ),
+        ),
+        (
+            "GET /api/configs/{id}/diff",
+            n,
+            lambda i: get(
+                f"/api/configs/{instrument(i)}/diff",
+                params={"from": version(i), "to": version(i)},
+            ),
+        ),
+        (
+            "GET /api/snapshots/{id}",
+            n,
+            lambda i: get(f"/api/snapshots/{instrument(i)}"),
+        ),
+        (
+            "GET /api/snapshots/{id}/{name}",
+            n,
+            lambda i: get(f"/api/snapshots/{instrument(i)}/{snapshot(i)}"),
+        ),
+        ("GET /api/events/stats", n, lambda i: get("/api/events/stats")),
+        (
+            "GET /api/events/ (replay)",
+            rare,
+            lambda i: replay_events(
+                app_state.feed, instrument(i), len(data.version_ids[instrument(i)])
+            ),
+        ),
+        ("GET /api/transfer/export", rare, lambda i: get("/api/transfer/export")),
+        (
+            "POST /api/instruments/",
+            n,
+            lambda i: send(
+                "POST",
+                "/api/instruments/",
+                json={"id": f"{data.prefix}-new-{i}", "name": "new", "type": "bench"},
+            ),
+        ),
+        (
+            "PUT /api/instruments/{id}/retention",
+            n,
+            lambda i: send(
+                "PUT",
+                f"/api/instruments/{instrument(i)}/retention",
+                json={"keep_last": 0, "max_age_days": 0},
+            ),
+        ),
+        (
+            "PUT /api/configs/{id}",
+            n,
+            lambda i: send("PUT", f"/api/configs/{instrument(i)}", json=updates[i]),
+        ),
+        (
+            "PATCH /api/configs/{id}",
+            n,
+            lambda i: send(
+                "PATCH", f"/api/configs/{instrument(i)}", json=patch_body(i)
+            ),
+        ),
+        ("PATCH /api/configs/{id} (If-Match)", n, conditional_patch),
+        (
+            "POST /api/snapshots/{id}",
+            n,
+            lambda i: send(
+                "POST",
+                f"/api/snapshots/{instrument(i)}",
+                json={"name": f"bench-{i}"},
+            ),
+        ),
+        (
+            "POST /api/transfer/import",
+            rare,
+            lambda i: send("POST", "/api/transfer/import", content=ndjson),
+        ),
+    ]
+
+
+async def run(args):
+    if httpx is None:
+        raise SystemExit("This benchmark needs the httpx package (pip install httpx)")
+    from app import main
+
+    # Compaction would change the dataset while it is measured
+    settings.RETENTION_INTERVAL_SECONDS = 0
+    settings.ARCHIVE_PATH = f"{tempfile.mkdtemp()}/archive.sqlite3"
+
+    client = await connect(args.fake)
+    await main.start_services(client)
+    data = Dataset(client, args)
+    results = {}
+    try:
+        await data.seed()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as http:
+            benchmarks = await scenarios(http, data, main.app.state, args)
+            for name, count, call in benchmarks:
+                results[name] = await measure(call, count, args.concurrency)
+    finally:
+        await data.cleanup()
+        await main.shutdown_db_client()
+
+    write_results("api", args, results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_dataset_arguments(parser)
+    parser.add_argument("--concurrency", type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# backend/benchmarks/common.py
+"""Datasets, timing and result files shared by the benchmark suites"""
+
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+import uuid
+from datetime import datetime
+from app.db.keys import instrument_ids_keys
+from app.db.redis_client import RedisService, init_redis_pool
+
+
+def add_dataset_arguments(parser):
+    """Options shared by every suite"""
+    parser.add_argument(
+        "--fake",
+        action="store_true",
+        help="run against an in-process fakeredis server instead of REDIS_*",
+    )
+    parser.add_argument("--instruments", type=int, default=10)
+    parser.add_argument("--config-keys", type=int, default=1000, help="config leaves")
+    parser.add_argument("--versions", type=int, default=50, help="per instrument")
+    parser.add_argument("--snapshots", type=int, default=2, help="per instrument")
+    parser.add_argument("--requests", type=int, default=200, help="per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+
+
+async def connect(fake):
+    """Redis client for a benchmark run"""
+    if not fake:
+        return await init_redis_pool()
+    try:
+        import fakeredis
+    except ImportError:
+        raise SystemExit("--fake needs the fakeredis package (pip install fakeredis)")
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+def make_config(n_keys, rng, section_size=100):
+    """Build a nested config with n_keys numeric leaves"""
+    config = {}
+    for index in range(n_keys):
+        section = config.setdefault(f"section_{index // section_size}", {})
+        section[f"param_{index}"] = round(rng.random(), 6)
+    return config
+
+
+def change_leaf(config, rng):
+    """Copy of config with one random leaf changed, and the changed path"""
+    config = json.loads(json.dumps(config))
+    section = rng.choice(list(config))
+    key = rng.choice(list(config[section]))
+    config[section][key] = round(rng.random(), 6)
+    return config, (section, key)
+
+
+class Dataset:
+    """Instruments seeded with configs, version histories and snapshots"""
+
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        self.instrument_ids = []
+        self.configs = {}
+        self.version_ids = {}
+        self.snapshot_names = {}
+
+    async def seed(self):
+        service = RedisService(self.client)
+        snapshot_every = max(1, self.args.versions // max(1, self.args.snapshots))
+        for index in range(self.args.instruments):
+            instrument_id = f"{self.prefix}-{index}"
+            await service.add_instrument(
+                instrument_id,
+                {
+                    "name": instrument_id,
+                    "type": "bench",
+                    "location": f"hall-{index % 3}",
+                    "last_updated": None,
+                },
+            )
+            config = make_config(self.args.config_keys, self.rng)
+            version_ids = []
+            snapshot_names = []
+            for seq in range(self.args.versions):
+                if seq:
+                    config, _ = change_leaf(config, self.rng)
+                version_id, _ = await service.update_config(
+                    instrument_id, config, "bench"
+                )
+                version_ids.append(version_id)
+                if (seq + 1) % snapshot_every == 0 and (
+                    len(snapshot_names) < self.args.snapshots
+                ):
+                    name = f"snap-{seq}"
+                    await service.create_snapshot(instrument_id, name, "", "bench")
+                    snapshot_names.append(name)
+            self.instrument_ids.append(instrument_id)
+            self.configs[instrument_id] = config
+            self.version_ids[instrument_id] = version_ids
+            self.snapshot_names[instrument_id] = snapshot_names
+
+    def instrument(self, index):
+        return self.instrument_ids[index % len(self.instrument_ids)]
+
+    async def cleanup(self):
+        """Delete every key created under this dataset's prefix"""
+        keys = [
+            key
+            for pattern in (
+                # Plain and hash-tagged layouts
+                f"instrument:{self.prefix}-*",
+                f"instrument:{{{self.prefix}-*",
+                f"search:instrument:{self.prefix}-*",
+                f"search:instrument:{{{self.prefix}-*",
+            )
+            async for key in self.client.scan_iter(pattern)
+        ]
+        for start in range(0, len(keys), 1000):
+            await self.client.delete(*keys[start : start + 1000])
+        for ids_key in instrument_ids_keys():
+            members = [
+                member
+                async for member in self.client.sscan_iter(
+                    ids_key, match=f"{self.prefix}-*"
+                )
+            ]
+            if members:
+                await self.client.srem(ids_key, *members)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Throughput and latency percentiles of one benchmark, in ms"""
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "max_ms": round(max(latencies), 3),
+    }
+
+
+async def measure(call, count, concurrency=1):
+    """Await call(index) count times from concurrent workers and summarize
+
+    call returns False for a failed request, which is counted as an error.
+    """
+    latencies = []
+    errors = 0
+    indexes = iter(range(count))
+
+    async def worker():
+        nonlocal errors
+        for index in indexes:
+            started = time.perf_counter()
+            ok = await call(index)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if ok is False:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(suite, args, results):
+    """Print the results with the run parameters and save them if asked"""
+    report = {
+        "suite": suite,
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "backend": "fakeredis" if args.fake else "redis",
+        "parameters": {
+            name: value for name, value in vars(args).items() if name != "output"
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,84 @@
+# backend/benchmarks/compare.py
+"""Compare two benchmark result files and flag regressions
+
+    python -m benchmarks.compare base.json head.json --threshold 10
+
+A benchmark regressed when its p50 or p99 latency grew, or its throughput
+fell, by more than the threshold percentage. Exits with status 1 if any
+did, so it can gate a CI job. Results are only comparable when both runs
+used the same suite, backend and parameters; differences are reported.
+"""
+import argparse
+import json
+import sys
+
+# Metric, and whether larger values are better
+METRICS = [("p50_ms", False), ("p99_ms", False), ("throughput_rps", True)]
+
+
+def change(base, head):
+    """Relative change in percent, or None if it cannot be computed"""
+    if not base or head is None:
+        return None
+    return (head - base) / base * 100
+
+
+def compare(base, head, threshold):
+    """Rows of (benchmark, metric, base, head, change, regressed)"""
+    rows = []
+    for name, head_result in head["results"].items():
+        base_result = base["results"].get(name)
+        if base_result is None:
+            continue
+        for metric, higher_is_better in METRICS:
+            delta = change(base_result.get(metric), head_result.get(metric))
+            if delta is None:
+                continue
+            worse = -delta if higher_is_better else delta
+            rows.append(
+                (
+                    name,
+                    metric,
+                    base_result[metric],
+                    head_result[metric],
+                    delta,
+                    worse > threshold,
+                )
+            )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base", help="results of the reference commit")
+    parser.add_argument("head", help="results of the commit under test")
+    parser.add_argument(
+        "--threshold", type=float, default=10.0, help="allowed change in percent"
+    )
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    for field in ("suite", "backend", "parameters"):
+        if base.get(field) != head.get(field):
+            print(f"warning: {field} differs between the runs", file=sys.stderr)
+    print(f"{base.get('commit')} -> {head.get('commit')}")
+
+    regressions = 0
+    for name, metric, old, new, delta, regressed in compare(base, head, args.threshold):
+        flag = "REGRESSION" if regressed else ""
+        print(f"{name:50} {metric:15} {old:>10} {new:>10} {delta:+7.1f}% {flag}")
+        regressions += regressed
+    for name in sorted(set(base["results"]) ^ set(head["results"])):
+        print(f"{name:50} only in one of the runs")
+
+    if regressions:
+        print(f"{regressions} regression(s) above {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# backend/benchmarks/compression.py
+"""Memory saved by payload compression against the CPU it adds per request
+
+Compares every codec, with and without a dictionary trained on sibling
+configs, to the JSON baseline. Sizes and CPU times are measured locally;
+with --redis the stored size is also measured as Redis MEMORY USAGE of a
+RedisJSON document versus a compressed string, using the usual REDIS_*
+settings:
+
+    python -m benchmarks.compression --keys 500 5000 50000 --redis
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+import orjson
+from app.db.redis_client import init_redis_pool
+from app.services.compression import compress, decompress, train_dictionary
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+UNITS = ["mm", "mrad", "A", "V", "Hz", "deg"]
+MODES = ["auto", "manual", "off"]
+
+
+def make_config(n_keys, rng, section_size=50):
+    """Build a nested config shaped like an instrument's: the same keys for
+    every instrument, with numeric, flag and enumerated leaves"""
+    config = {}
+    for index in range(n_keys):
+        section = config.setdefault(f"section_{index // section_size}", {})
+        kind = index % 4
+        if kind == 0:
+            value = {
+                "value": round(rng.uniform(-100, 100), 4),
+                "unit": UNITS[index % 6],
+            }
+        elif kind == 1:
+            value = rng.random() < 0.5
+        elif kind == 2:
+            value = rng.choice(MODES)
+        else:
+            value = round(rng.gauss(0, 10), 6)
+        section[f"param_{index}"] = value
+    return config
+
+
+def timed(function, repeat):
+    """Median microseconds per call"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(samples)
+
+
+async def memory_usage(client, value):
+    key = f"bench:compression:{uuid.uuid4().hex}"
+    try:
+        if isinstance(value, bytes):
+            await client.set(key, value)
+        else:
+            await client.json().set(key, "$", value)
+        return await client.memory_usage(key, samples=0)
+    finally:
+        await client.delete(key)
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    codecs = ["zlib"] + (["zstd"] if zstandard is not None else [])
+    client = await init_redis_pool() if args.redis else None
+    results = []
+
+    try:
+        for n_keys in args.keys:
+            # Dictionaries are trained on other instruments' configs
+            siblings = [orjson.dumps(make_config(n_keys, rng)) for _ in range(50)]
+            config = make_config(n_keys, rng)
+            payload = orjson.dumps(config)
+            # Parsed as compressed payloads are, so the difference is the
+            # decompression alone
+            baseline_read = timed(lambda: orjson.loads(payload), args.repeat)
+            json_memory = await memory_usage(client, config) if client else None
+
+            for codec in codecs:
+                for dictionary in (None, train_dictionary(siblings, codec)):
+                    blob = compress(payload, codec, args.level, dictionary)
+                    write_us = timed(
+                        lambda: compress(payload, codec, args.level, dictionary),
+                        args.repeat,
+                    )
+                    read_us = timed(
+                        lambda: orjson.loads(decompress(blob, codec, dictionary)),
+                        args.repeat,
+                    )
+                    result = {
+                        "keys": n_keys,
+                        "codec": codec,
+                        "dictionary_bytes": len(dictionary) if dictionary else 0,
+                        "json_bytes": len(payload),
+                        "stored_bytes": len(blob),
+                        "ratio": round(len(payload) / len(blob), 2),
+                        "write_cpu_us": round(write_us, 1),
+                        "read_cpu_us": round(read_us, 1),
+                        "baseline_read_cpu_us": round(baseline_read, 1),
+                        "added_read_cpu_us": round(read_us - baseline_read, 1),
+                    }
+                    if client:
+                        stored_memory = await memory_usage(client, blob)
+                        result.update(
+                            redis_json_bytes=json_memory,
+                            redis_stored_bytes=stored_memory,
+                            redis_ratio=round(json_memory / stored_memory, 2),
+                        )
+                    results.append(result)
+    finally:
+        if client:
+            await client.close()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--keys", type=int, nargs="+", default=[500, 5000], help="config leaves"
+    )
+    parser.add_argument("--level", type=int, help="compression level")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--redis", action="store_true", help="also measure Redis MEMORY USAGE"
+    )
+    parser.add_argument("--output", help="write results as JSON to this file")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
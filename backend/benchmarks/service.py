@@ -0,0 +1,162 @@
+# backend/benchmarks/service.py
+"""Latency of RedisService methods, without the HTTP layer
+
+Run from the backend directory against the redis-stack configured through
+the usual REDIS_* settings, or an in-process fakeredis server with --fake:
+
+    python -m benchmarks.service --versions 100 --output service.json
+
+With --cache the service reads through the in-process caches, as the API
+does by default. Seeded instruments are deleted afterwards.
+"""
+import argparse
+import asyncio
+from datetime import datetime
+from app.core.config import settings
+from app.db.redis_client import RedisService
+from app.services.cache import LRUCache
+from benchmarks.common import (
+    Dataset,
+    add_dataset_arguments,
+    change_leaf,
+    connect,
+    measure,
+    write_results,
+)
+
+
+def scenarios(service, data, args):
+    """(name, call count, call) of every benchmark, reads before writes"""
+    rng = data.rng
+    n = args.requests
+    interval = settings.VERSION_KEYFRAME_INTERVAL
+
+    def instrument(index):
+        return data.instrument(index)
+
+    def keyframe(index):
+        return data.version_ids[instrument(index)][0]
+
+    def deepest_delta(index):
+        # Versions between keyframes replay up to interval - 1 patches
+        version_ids = data.version_ids[instrument(index)]
+        return version_ids[min(len(version_ids), interval) - 1]
+
+    def snapshot(index):
+        names = data.snapshot_names[instrument(index)]
+        return names[index % len(names)] if names else "missing"
+
+    updates = []
+    configs = dict(data.configs)
+    for index in range(n):
+        instrument_id = instrument(index)
+        configs[instrument_id], _ = change_leaf(configs[instrument_id], rng)
+        updates.append(configs[instrument_id])
+    patches = []
+    for index in range(n):
+        section, leaves = next(iter(data.configs[instrument(index)].items()))
+        key = next(iter(leaves))
+        patches.append([{"op": "replace", "path": f"/{section}/{key}", "value": index}])
+    seeded_at = datetime.utcnow()
+    first_section = {
+        instrument_id: f"$.{next(iter(config))}"
+        for instrument_id, config in data.configs.items()
+    }
+
+    return [
+        ("get_instrument_ids", n, lambda i: service.get_instrument_ids()),
+        ("get_instruments", n, lambda i: service.get_instruments(data.instrument_ids)),
+        ("get_instrument", n, lambda i: service.get_instrument(instrument(i))),
+        ("instrument_exists", n, lambda i: service.instrument_exists(instrument(i))),
+        ("get_config", n, lambda i: service.get_config(instrument(i))),
+        (
+            "get_config (path)",
+            n,
+            lambda i: service.get_config(instrument(i), [first_section[instrument(i)]]),
+        ),
+        ("get_config_json", n, lambda i: service.get_config_json(instrument(i))),
+        ("get_config_etag", n, lambda i: service.get_config_etag(instrument(i))),
+        ("get_configs", n, lambda i: service.get_configs(data.instrument_ids)),
+        ("get_versions", n, lambda i: service.get_versions(instrument(i))),
+        (
+            "get_version_history",
+            n,
+            lambda i: service.get_version_history(instrument(i)),
+        ),
+        (
+            "get_version (keyframe)",
+            n,
+            lambda i: service.get_version(instrument(i), keyframe(i)),
+        ),
+        (
+            "get_version (deepest delta)",
+            n,
+            lambda i: service.get_version(instrument(i), deepest_delta(i)),
+        ),
+        (
+            "get_versions_at",
+            n,
+            lambda i: service.get_versions_at(data.instrument_ids, seeded_at),
+        ),
+        (
+            "diff_refs",
+            n,
+            lambda i: service.diff_refs(
+                instrument(i), ("version", keyframe(i)), ("version", deepest_delta(i))
+            ),
+        ),
+        ("get_snapshots", n, lambda i: service.get_snapshots(instrument(i))),
+        (
+            "get_snapshot",
+            n,
+            lambda i: service.get_snapshot(instrument(i), snapshot(i)),
+        ),
+        (
+            "update_config",
+            n,
+            lambda i: service.update_config(instrument(i), updates[i], "bench"),
+        ),
+        (
+            "patch_config",
+            n,
+            lambda i: service.patch_config(instrument(i), patches[i], "bench"),
+        ),
+        (
+            "create_snapshot",
+            n,
+            lambda i: service.create_snapshot(instrument(i), f"bench-{i}", "", "bench"),
+        ),
+    ]
+
+
+async def run(args):
+    client = await connect(args.fake)
+    service = RedisService(client)
+    if args.cache:
+        service.cache = LRUCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS)
+        service.diff_cache = LRUCache(settings.DIFF_CACHE_MAX_ENTRIES, ttl=None)
+    data = Dataset(client, args)
+    results = {}
+    try:
+        await data.seed()
+        for name, count, call in scenarios(service, data, args):
+            results[name] = await measure(call, count, args.concurrency)
+    finally:
+        await data.cleanup()
+        await client.close()
+
+    write_results("service", args, results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_dataset_arguments(parser)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--cache", action="store_true", help="read through the in-process cache"
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# backend/benchmarks/version_storage.py
+"""Redis memory and reconstruction latency of delta-encoded versions
+
+Run from the backend directory against a redis-stack instance configured
+through the usual REDIS_* settings, or an in-process fakeredis server with
+--fake, which lacks MEMORY USAGE and so reports encoded sizes instead:
+
+    python -m benchmarks.version_storage --config-keys 10000 --versions 200
+"""
+import argparse
+import asyncio
+import json
+from app.db.keys import instrument_key
+from app.db.redis_client import RedisService
+from app.services.compression import blob_key, split_ref
+from benchmarks.common import (
+    Dataset,
+    add_dataset_arguments,
+    change_leaf,
+    connect,
+    make_config,
+    measure,
+    write_results,
+)
+
+
+async def stored_bytes(client, json_keys, string_keys, fake):
+    """Total MEMORY USAGE of keys, sampling every nested value
+
+    fakeredis has no MEMORY USAGE, so there the size of the compact JSON
+    encodings and of the strings is summed instead.
+    """
+    async with client.pipeline(transaction=False) as pipe:
+        if not fake:
+            for key in [*json_keys, *string_keys]:
+                pipe.memory_usage(key, samples=0)
+            return sum(size or 0 for size in await pipe.execute())
+        for key in json_keys:
+            pipe.json().get(key)
+        for key in string_keys:
+            pipe.strlen(key)
+        sizes = await pipe.execute()
+    documents, strings = sizes[: len(json_keys)], sizes[len(json_keys) :]
+    return sum(
+        len(json.dumps(document, separators=(",", ":"))) for document in documents
+    ) + sum(strings)
+
+
+async def seed(service, data, args):
+    """Instruments with one parameter changed per version, as in calibration
+    runs; returns (instrument_id, version_id, full config) of every version"""
+    versions = []
+    for index in range(args.instruments):
+        instrument_id = f"{data.prefix}-{index}"
+        await service.add_instrument(
+            instrument_id,
+            {"name": "bench", "type": "bench", "location": None, "last_updated": None},
+        )
+        data.instrument_ids.append(instrument_id)
+        config = make_config(args.config_keys, data.rng)
+        for seq in range(args.versions):
+            if seq:
+                config, _ = change_leaf(config, data.rng)
+            version_id, _ = await service.update_config(instrument_id, config, "bench")
+            versions.append((instrument_id, version_id, config))
+    return versions
+
+
+async def storage(client, versions, fake):
+    """Bytes of the versions as stored, and stored as full documents"""
+    version_keys = [
+        instrument_key(instrument_id, "version", version_id)
+        for instrument_id, version_id, _ in versions
+    ]
+    # Keyframes keep their data in content-addressed payloads
+    json_keys, string_keys = list(version_keys), []
+    for instrument_id in dict.fromkeys(
+        instrument_id for instrument_id, _, _ in versions
+    ):
+        for ref in await client.hkeys(instrument_key(instrument_id, "blobrefs")):
+            keys = string_keys if split_ref(ref)[0] else json_keys
+            keys.append(blob_key(instrument_id, ref))
+    delta_bytes = await stored_bytes(client, json_keys, string_keys, fake)
+
+    # Baseline: the same history stored as full documents
+    full_keys = []
+    for index, (key, (instrument_id, _, data)) in enumerate(
+        zip(version_keys, versions)
+    ):
+        version = await client.json().get(key)
+        version.pop("patch", None)
+        version.pop("data_ref", None)
+        version["data"] = data
+        full_key = instrument_key(instrument_id, "fullcopy", index)
+        await client.json().set(full_key, "$", version)
+        full_keys.append(full_key)
+    full_bytes = await stored_bytes(client, full_keys, [], fake)
+    return delta_bytes, full_bytes
+
+
+async def run(args):
+    client = await connect(args.fake)
+    service = RedisService(client)
+    service.keyframe_interval = args.keyframe_interval
+    data = Dataset(client, args)
+
+    async def get_version(index):
+        instrument_id, version_id, expected = versions[index]
+        version = await service.get_version(instrument_id, version_id)
+        return version["data"] == expected
+
+    try:
+        versions = await seed(service, data, args)
+        delta_bytes, full_bytes = await storage(client, versions, args.fake)
+        # Reconstruction latency of every version; mismatches count as errors
+        latency = await measure(get_version, len(versions))
+    finally:
+        await data.cleanup()
+        await client.close()
+
+    write_results(
+        "version_storage",
+        args,
+        {
+            "storage": {
+                "size_metric": "encoded_bytes" if args.fake else "memory_usage",
+                "full_bytes": full_bytes,
+                "delta_bytes": delta_bytes,
+                "savings_ratio": round(full_bytes / delta_bytes, 2),
+            },
+            "get_version": latency,
+        },
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_dataset_arguments(parser)
+    parser.add_argument("--keyframe-interval", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
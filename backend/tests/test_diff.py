@@ -0,0 +1,74 @@
+# backend/tests/test_diff.py
+import copy
+import json
+import pytest
+from app.services.diff import apply_patch, diff, make_patch, split_pointer
+
+
+def test_split_pointer_unescapes_tokens():
+    assert split_pointer("") == []
+    assert split_pointer("/a~1b/c~0d/0") == ["a/b", "c~d", "0"]
+    with pytest.raises(ValueError):
+        split_pointer("a/b")
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        (1, True),
+        (1, 1.0),
+        (True, 1.0),
+        (0, False),
+        ([1], [True]),
+        ({"a": 1}, {"a": 1.0}),
+    ],
+)
+def test_diff_keeps_numbers_and_booleans_apart(old, new):
+    assert diff({"x": old}, {"x": new})
+    patched = apply_patch({"x": old}, make_patch({"x": old}, {"x": new}))
+    # json.dumps tells 1, 1.0 and true apart where == does not
+    assert json.dumps(patched) == json.dumps({"x": new})
+
+
+def test_diff_records_previous_values():
+    ops = diff({"a": 1, "b": {"c": 2}, "d": 3}, {"a": 1, "b": {"c": 4}, "e": 5})
+    assert ops == [
+        {"op": "replace", "path": "/b/c", "old": 2, "value": 4},
+        {"op": "remove", "path": "/d", "old": 3},
+        {"op": "add", "path": "/e", "value": 5},
+    ]
+
+
+def test_diff_of_equal_documents_is_empty():
+    doc = {"a": [1, 2.5, {"b": None}], "c": "x"}
+    assert diff(doc, copy.deepcopy(doc)) == []
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ({"a": [1, 2, 3]}, {"a": [1]}),
+        ({"a": [1]}, {"a": [1, 2, 3]}),
+        ({"a": [{"b": 1}, 2]}, {"a": [{"b": 2}, 2, {"c": []}]}),
+        ({"a/b": {"~": 1}}, {"a/b": {"~": 2}}),
+        ({"a": {"b": 1}}, {"a": [1]}),
+        ({"a": 1}, {}),
+    ],
+)
+def test_patch_round_trip(old, new):
+    assert apply_patch(copy.deepcopy(old), make_patch(old, new)) == new
+
+
+def test_apply_patch_array_operations():
+    doc = {"a": [1, 3]}
+    apply_patch(doc, [{"op": "add", "path": "/a/1", "value": 2}])
+    apply_patch(doc, [{"op": "add", "path": "/a/-", "value": 4}])
+    assert doc == {"a": [1, 2, 3, 4]}
+    apply_patch(doc, [{"op": "remove", "path": "/a/0"}])
+    assert doc == {"a": [2, 3, 4]}
+
+
+def test_apply_patch_replaces_the_root():
+    assert apply_patch(
+        {"a": 1}, [{"op": "replace", "path": "", "value": {"b": 2}}]
+    ) == {"b": 2}
@@ -0,0 +1,146 @@
+# backend/tests/test_patch_config.py
+import asyncio
+import copy
+import json
+import pytest
+from app.db.redis_client import RedisService, _check_disjoint
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def run(test, config, keyframe_interval=None):
+    """Run test(service) against a fresh instrument holding config"""
+
+    async def main():
+        service = RedisService(fakeredis.FakeAsyncRedis(decode_responses=True))
+        if keyframe_interval:
+            service.keyframe_interval = keyframe_interval
+        await service.add_instrument("i", {"name": "n", "type": "T", "location": None})
+        await service.update_config("i", config, "u")
+        return await test(service)
+
+    return asyncio.run(main())
+
+
+def patched(operations, config):
+    """The configuration after applying operations to config"""
+
+    async def test(service):
+        await service.patch_config("i", operations, "u")
+        return await service.get_config("i")
+
+    return run(test, config)
+
+
+def test_array_adds():
+    config = {"a": [1, 3]}
+    assert patched([{"op": "add", "path": "/a/1", "value": 2}], config) == {
+        "a": [1, 2, 3]
+    }
+    assert patched([{"op": "add", "path": "/a/-", "value": 4}], config) == {
+        "a": [1, 3, 4]
+    }
+    assert patched([{"op": "add", "path": "/a/2", "value": 4}], config) == {
+        "a": [1, 3, 4]
+    }
+
+
+@pytest.mark.parametrize(
+    "operation",
+    [
+        {"op": "add", "path": "/a/3", "value": 0},
+        {"op": "replace", "path": "/a/2", "value": 0},
+        {"op": "remove", "path": "/a/-"},
+        {"op": "replace", "path": "/missing/0", "value": 0},
+        {"op": "replace", "path": "/b/c", "value": 0},
+    ],
+)
+def test_invalid_paths_are_rejected(operation):
+    with pytest.raises(ValueError):
+        patched([operation], {"a": [1, 3], "b": 1})
+
+
+@pytest.mark.parametrize("value", [[1], 1, "x", None, True])
+def test_root_must_stay_an_object(value):
+    for op, path in [("replace", ""), ("add", ""), ("set", "$")]:
+        with pytest.raises(ValueError, match="must be an object"):
+            patched([{"op": op, "path": path, "value": value}], {"a": 1})
+
+
+def test_root_replace_and_remove():
+    assert patched([{"op": "replace", "path": "", "value": {"b": 2}}], {"a": 1}) == {
+        "b": 2
+    }
+    with pytest.raises(ValueError):
+        patched([{"op": "remove", "path": ""}], {"a": 1})
+
+
+def test_jsonpath_operations():
+    assert patched(
+        [
+            {"op": "set", "path": "$.a.b", "value": 2},
+            {"op": "delete", "path": "$.c[1]"},
+        ],
+        {"a": {"b": 1}, "c": [1, 2]},
+    ) == {"a": {"b": 2}, "c": [1]}
+
+
+@pytest.mark.parametrize(
+    "operations",
+    [
+        [
+            {"op": "replace", "path": "/a", "value": {}},
+            {"op": "replace", "path": "/a/b", "value": 1},
+        ],
+        [
+            {"op": "replace", "path": "/a/b", "value": 1},
+            {"op": "set", "path": "$.a.b", "value": 2},
+        ],
+        [
+            {"op": "add", "path": "/c/0", "value": 0},
+            {"op": "replace", "path": "/c/1", "value": 0},
+        ],
+        [{"op": "remove", "path": "/c/0"}, {"op": "remove", "path": "/c/1"}],
+    ],
+)
+def test_overlapping_operations_are_rejected(operations):
+    with pytest.raises(ValueError):
+        patched(operations, {"a": {"b": 0}, "c": [1, 2]})
+
+
+def test_disjoint_replaces_in_one_array():
+    operations = [
+        {"op": "replace", "path": "/c/0", "value": 3},
+        {"op": "replace", "path": "/c/1", "value": 4},
+    ]
+    _check_disjoint([["c", 0], ["c", 1]], operations)
+    assert patched(operations, {"c": [1, 2]}) == {"c": [3, 4]}
+
+
+def test_versions_round_trip_through_keyframes():
+    steps = [
+        [{"op": "replace", "path": "/a", "value": 2}],
+        [{"op": "add", "path": "/list/-", "value": {"x": 1}}],
+        [{"op": "replace", "path": "/a", "value": 2.0}],
+        [{"op": "add", "path": "/list/0", "value": True}],
+        [{"op": "remove", "path": "/b"}],
+        [{"op": "set", "path": "$.list[1].x", "value": 1.5}],
+        [{"op": "replace", "path": "", "value": {"a": 1, "list": []}}],
+        [{"op": "add", "path": "/b", "value": {"c": [1]}}],
+    ]
+
+    async def test(service):
+        expected = [await service.get_config("i")]
+        version_ids = list(await service.get_versions("i"))
+        for operations in steps:
+            version_id, _ = await service.patch_config("i", operations, "u")
+            version_ids.append(version_id)
+            expected.append(copy.deepcopy(await service.get_config("i")))
+        rebuilt = [
+            (await service.get_version("i", version_id))["data"]
+            for version_id in version_ids
+        ]
+        return expected, rebuilt
+
+    expected, rebuilt = run(test, {"a": 1, "b": 0, "list": []}, keyframe_interval=3)
+    assert json.dumps(rebuilt) == json.dumps(expected)
@@ -0,0 +1,28 @@
+# backend/tests/test_paths.py
+import pytest
+from app.services.paths import parse_jsonpath, project, to_pointer, to_redis_path
+
+
+def test_parse_jsonpath():
+    assert parse_jsonpath("$") == []
+    assert parse_jsonpath("$.a['b.c'][0][\"d\"]") == ["a", "b.c", 0, "d"]
+
+
+@pytest.mark.parametrize("path", ["a.b", "$.*", "$..a", "$[0:2]", "$[?(@.a)]", "$[01]"])
+def test_parse_jsonpath_rejects_indefinite_paths(path):
+    with pytest.raises(ValueError):
+        parse_jsonpath(path)
+
+
+def test_path_conversions():
+    tokens = ["a/b", 0, "c~"]
+    assert to_pointer(tokens) == "/a~1b/0/c~0"
+    assert to_redis_path(tokens) == '$["a/b"][0]["c~"]'
+
+
+def test_project_leaves_out_missing_paths():
+    doc = {"a": {"b": [10, 20]}, "c": None}
+    assert project(doc, ["$.a.b[1]", "$.c", "$.a.b[2]", "$.x"]) == {
+        "$.a.b[1]": 20,
+        "$.c": None,
+    }
@@ -0,0 +1,109 @@
+# backend/tests/test_versions.py
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from app.db.keys import instrument_key
+from app.db.redis_client import RedisService
+from app.services.archive import VersionArchive
+from app.services.transfer import export_ndjson, import_ndjson
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def run(test, **options):
+    """Run test(service) against a fresh instrument"""
+
+    async def main():
+        service = RedisService(
+            fakeredis.FakeAsyncRedis(decode_responses=True), **options
+        )
+        service.keyframe_interval = 5
+        await service.add_instrument("i", {"name": "n", "type": "T", "location": None})
+        return await test(service)
+
+    return asyncio.run(main())
+
+
+def test_broken_delta_chain_raises():
+    async def test(service):
+        version_ids = [
+            (await service.update_config("i", {"k": n}, "u"))[0] for n in range(4)
+        ]
+        await service.redis.delete(instrument_key("i", "version", version_ids[1]))
+        with pytest.raises(RuntimeError, match="broken"):
+            await asyncio.wait_for(service.get_version("i", version_ids[3]), 5)
+        return (await service.get_version("i", version_ids[0]))["data"]
+
+    assert run(test) == {"k": 0}
+
+
+@pytest.mark.parametrize("with_archive", [False, True])
+def test_import_of_a_compacted_export(tmp_path, with_archive):
+    archive = VersionArchive(str(tmp_path / "archive.sqlite3"))
+
+    async def test(service):
+        for n in range(60):
+            await service.update_config("i", {"k": n, "list": list(range(n % 7))}, "u")
+        await service.set_retention("i", keep_last=35)
+        assert await service.compact_versions("i") == 25
+
+        lines = [
+            line
+            async for line in export_ndjson(
+                service.redis, archive=archive if with_archive else None
+            )
+        ]
+        target = RedisService(fakeredis.FakeAsyncRedis(decode_responses=True))
+        target.keyframe_interval = service.keyframe_interval
+        await import_ndjson(target.redis, _aiter(lines))
+
+        version_ids = await target.get_versions("i")
+        rebuilt = [
+            (await target.get_version("i", version_id))["data"]["k"]
+            for version_id in version_ids
+        ]
+        # Writes continue the imported chain
+        await target.update_config("i", {"k": 60}, "u")
+        latest = await target.get_version("i", (await target.get_versions("i"))[-1])
+        return rebuilt, latest["data"]
+
+    rebuilt, latest = run(test, archive=archive)
+    assert rebuilt == list(range(0 if with_archive else 25, 60))
+    assert latest == {"k": 60}
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+class _UnusedArchive:
+    def __getattr__(self, name):
+        raise AssertionError(f"archive.{name} used")
+
+
+def test_archive_is_not_read_before_compaction():
+    async def test(service):
+        version_id, _ = await service.update_config("i", {"k": 1}, "u")
+        assert await service.get_versions("i") == [version_id]
+        page, _ = await service.get_version_history("i")
+        assert [summary["version_id"] for summary in page] == [version_id]
+        assert await service.get_version("i", "missing") is None
+        assert not await service.version_exists("i", "missing")
+        at = datetime.utcnow() + timedelta(days=1)
+        assert await service.get_version_ids_at(["i"], at) == {"i": version_id}
+
+    run(test, archive=_UnusedArchive())
+
+
+def test_broken_delta_chain_raises_for_versions_at():
+    async def test(service):
+        version_ids = [
+            (await service.update_config("i", {"k": n}, "u"))[0] for n in range(4)
+        ]
+        await service.redis.delete(instrument_key("i", "version", version_ids[1]))
+        at = datetime.utcnow() + timedelta(days=1)
+        with pytest.raises(RuntimeError, match="broken"):
+            await asyncio.wait_for(service.get_versions_at(["i"], at), 5)
+
+    run(test)